@@ -12,19 +12,16 @@ import argparse
 """
 OPTIONS:
 -d = cwd :directory
+-s = polar correlation power :stages to save
+-c = 100 :number of patterns processed at once
 """
 
 
-def correlation(signal_file):
-    ds = empyer.load(signal_file, signal_type='diffraction_signal')
+def correlation(signal_file, stages=("polar", "correlation", "power"), chunk_size=100):
+    ds = empyer.load(signal_file, signal_type='diffraction_signal', lazy=True)
     ds.mask_below(300)
     file_name = os.path.splitext(signal_file)[0]
-    ps = ds.calculate_polar_spectrum()
-    ps.save(filename=file_name+'_polar.hdf5', overwrite=True)
-    acs = ps.autocorrelation()
-    acs.save(filename=file_name + '_angular.hdf5', overwrite=True)
-    pow_s = acs.get_power_spectrum()
-    pow_s.save(filename=file_name+'_angularPower.hdf5', overwrite=True)
+    empyer.pipeline.run(ds, stages=stages, file_name=file_name, chunk_size=chunk_size)
     return
 
 
@@ -34,6 +31,16 @@ if __name__ == '__main__':
                         "--directory",
                         type=str,
                         help="input directory")
+    parser.add_argument("-s",
+                        "--stages",
+                        nargs="+",
+                        default=["polar", "correlation", "power"],
+                        help="stages to save")
+    parser.add_argument("-c",
+                        "--chunk_size",
+                        type=int,
+                        default=100,
+                        help="number of patterns processed at once")
     args = parser.parse_args()
 
     if not args.directory:
@@ -45,4 +52,4 @@ if __name__ == '__main__':
     print(files)
 
     for f in files:
-        correlation(f)
+        correlation(f, stages=args.stages, chunk_size=args.chunk_size)
@@ -1,7 +1,10 @@
 from .io import load, to_power_signal, to_correlation_signal, to_polar_signal, to_em_signal, to_diffraction_signal
+from .io import to_fourier_signal
 from .signals.diffraction_signal import DiffractionSignal
 from .signals.polar_signal import PolarSignal
 from .signals.correlation_signal import CorrelationSignal
 from .signals.power_signal import PowerSignal
+from .signals.fourier_signal import FourierSignal
+from . import pipeline
 
 name = "empyer"
@@ -1,9 +1,10 @@
 from hyperspy.io import load as hsload
 from .signals.em_signal import EMSignal
-from .signals.diffraction_signal import DiffractionSignal
+from .signals.diffraction_signal import DiffractionSignal, LazyDiffractionSignal
 from .signals.polar_signal import PolarSignal
 from .signals.correlation_signal import CorrelationSignal
 from .signals.power_signal import PowerSignal
+from .signals.fourier_signal import FourierSignal
 
 # Depreciated after version 0.210
 
@@ -56,6 +57,8 @@ def load(filenames=None,
         signal = to_correlation_signal(signal)
     if signal.metadata.Signal.signal_type == 'power_signal':
         signal = to_power_signal(signal)
+    if signal.metadata.Signal.signal_type == 'fourier_signal':
+        signal = to_fourier_signal(signal)
     if signal.metadata.Signal.has_item('signal_type'):
         print(signal.metadata.Signal.signal_type, " loaded!")
     return signal
@@ -93,7 +96,10 @@ def to_diffraction_signal(signal=None):
     """
     ax = signal.axes_manager.as_dictionary()
     ax = [ax[key]for key in ax]
-    ds = DiffractionSignal(signal, metadata=signal.metadata.as_dictionary(), axes=ax)
+    if signal._lazy:
+        ds = LazyDiffractionSignal(signal.data, metadata=signal.metadata.as_dictionary(), axes=ax)
+    else:
+        ds = DiffractionSignal(signal, metadata=signal.metadata.as_dictionary(), axes=ax)
     return ds
 
 
@@ -156,3 +162,23 @@ def to_power_signal(signal=None):
                      metadata=signal.metadata.as_dictionary(),
                      axes=ax)
     return ps
+
+
+def to_fourier_signal(signal=None):
+    """Hyperspy signal to fourier_signal
+
+    Parameters
+    ---------------------
+    signal: ComplexSignal2D
+
+    Returns
+    ---------------------
+    fs: fourier_signal
+        A signal of type signal_type
+    """
+    ax = signal.axes_manager.as_dictionary()
+    ax = [ax[key]for key in ax]
+    fs = FourierSignal(signal,
+                       metadata=signal.metadata.as_dictionary(),
+                       axes=ax)
+    return fs
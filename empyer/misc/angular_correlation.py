@@ -1,9 +1,11 @@
 import numpy as np
+from empyer.misc import fft_backend
 from empyer.misc.image import bin_2d
 import matplotlib.pyplot as plt
 
 
-def angular_correlation(r_theta_img, mask=None, binning=1, cut_off=0, normalize=True):
+def angular_correlation(r_theta_img, mask=None, binning=1, cut_off=0, normalize=True, dtype=np.float64, half=False,
+                        backend=None):
     """A program that takes a 2d image and then preforms an angular correlation on the image.
     Parameters
     ----------
@@ -17,56 +19,327 @@ def angular_correlation(r_theta_img, mask=None, binning=1, cut_off=0, normalize=
         The cut off in pixels to
     normalize: bool
         Subtract <I(\theta)>^2 and divide by <I(\theta)>^2
+    dtype: numpy dtype
+        The working precision. np.float32 uses single precision FFTs.
+    half: bool
+        Only return the angles 0-pi. The correlation is symmetric so the rest is redundant.
+    backend: str
+        The FFT backend ('numpy', 'scipy' or 'pyfftw'). Otherwise the one from fft_backend.set_backend is used.
     """
-    image = r_theta_img
-    m = mask
-    if m is not None:
-        mask_boolean = ~m  # inverting the boolean mask
-        mask_fft = np.fft.fft(mask_boolean, axis=1)
-        number_unmasked = np.fft.ifft(mask_fft*np.conjugate(mask_fft), axis=1).real
-        number_unmasked[number_unmasked < 1] = 1  # get rid of divide by zero error for completely masked rows
-        image[m] = 0
-        if cut_off is not 0:
-            number_unmasked = number_unmasked[cut_off:len(number_unmasked), :]
-
-    if cut_off is not 0:
-        image = image[cut_off:len(image), :]
-
-    if binning is not 1:
+    if mask is not None:
+        mask = np.asarray(mask)[np.newaxis]
+    return angular_correlation_stack(np.asarray(r_theta_img)[np.newaxis],
+                                     mask=mask,
+                                     binning=binning,
+                                     cut_off=cut_off,
+                                     normalize=normalize,
+                                     dtype=dtype,
+                                     half=half,
+                                     backend=backend)[0]
+
+
+def angular_correlation_stack(r_theta_imgs, mask=None, binning=1, cut_off=0, normalize=True, dtype=np.float64,
+                              half=False, number_unmasked=None, orders=None, backend=None):
+    """The angular correlation of a whole stack of polar images at once. The FFTs are taken along the last axis of
+    the stack and the normalization is broadcast so there is no python loop over the patterns or the rows.
+
+    Parameters
+    ----------
+    r_theta_imgs: array_like
+        A (n_patterns, n_k, n_theta) stack of polar images (any number of leading axes is allowed). If it is a masked
+        array and no mask is given its mask is used.
+    mask: boolean array
+        The mask of the stack. Either the same shape as the stack or a (n_k, n_theta) mask shared by every pattern.
+    binning : int
+        binning factor
+    cut_off : int
+        The cut off in pixels
+    normalize: bool
+        Subtract <I(\theta)>^2 and divide by <I(\theta)>^2
+    dtype: numpy dtype
+        The working precision. np.float32 uses single precision FFTs.
+    half: bool
+        Only return the angles 0-pi. The correlation is symmetric so the rest is redundant.
+    number_unmasked: array-like
+        The precomputed mask_normalization of the mask (broadcastable to the correlation). Otherwise it is computed
+        once for every unique mask in the stack.
+    orders: list
+        Also return the complex angular Fourier coefficients of the polar images at these orders. They come from
+        the same FFT as the correlation so they keep the phase (orientation) that the correlation loses.
+    backend: str
+        The FFT backend ('numpy', 'scipy' or 'pyfftw'). Otherwise the one from fft_backend.set_backend is used.
+
+    Returns
+    ----------
+    a: array-like
+        The angular correlation of every pattern. Dim (n_patterns, (n_k-cut_off)//binning, n_theta//binning) or
+        (n_patterns, (n_k-cut_off)//binning, n_theta//binning//2 + 1) if half
+    coefficients: array-like
+        Only if orders is given. The Fourier coefficients divided by the number of unmasked pixels in the row, so
+        order 0 is the mean intensity. Dim (n_patterns, (n_k-cut_off)//binning, len(orders))
+    """
+    if mask is None and isinstance(r_theta_imgs, np.ma.masked_array):
+        mask = np.ma.getmaskarray(r_theta_imgs)
+    image = np.array(np.ma.getdata(r_theta_imgs), dtype=dtype)  # copy so the masked pixels can be zeroed
+    if mask is not None:
+        image[np.broadcast_to(mask, image.shape)] = 0
+        if number_unmasked is None:
+            number_unmasked = _unique_normalization(mask, binning=binning, cut_off=cut_off, dtype=dtype)
+    if cut_off != 0:
+        image = image[..., cut_off:, :]
+    if binning != 1:
         image = bin_2d(image, binning)
-        if m is not None:
-            m = bin_2d(m, binning) != 0
 
     # fast method uses a FFT and is a process which is O(n) = n log(n)
-    I_fft = np.fft.fft(image, axis=1)
-    a = np.fft.ifft(I_fft * np.conjugate(I_fft), axis=1).real
-    # this is to determine how many of the variables were non zero... This is really dumb.  but...
-    # it works and I should stop trying to fix it (wreak it)
-    if m is not None:
-        a = np.multiply(np.divide(a, number_unmasked), 720)
+    if orders is not None:
+        a, image_fft = _autocorrelate(image, return_fft=True, backend=backend)
+        if mask is None:
+            row_unmasked = image.shape[-1]
+        else:
+            row_unmasked = (~np.asarray(mask))[..., cut_off:, :].astype(dtype)
+            if binning != 1:
+                row_unmasked = bin_2d(row_unmasked, binning)
+            row_unmasked = np.maximum(np.sum(row_unmasked, axis=-1, keepdims=True), 1)
+        coefficients = np.divide(image_fft[..., orders], row_unmasked)
+    else:
+        a = _autocorrelate(image, backend=backend)
+    if mask is not None:
+        a /= number_unmasked
+        a *= a.shape[-1]
 
     if normalize:
-        a_prime = np.zeros(np.shape(a))
-        for i, row in enumerate(a):
-            row_mean = np.mean(row)
-            if row_mean == 0:
-                normalized_row = np.divide(np.subtract(row, row_mean), 1)
-            else:
-                normalized_row = np.divide(np.subtract(row, row_mean), row_mean)
-            a_prime[i, :] = normalized_row
-            a = a_prime
+        row_mean = np.mean(a, axis=-1, keepdims=True)
+        a -= row_mean
+        a /= np.where(row_mean == 0, 1, row_mean)
+    if half:
+        a = a[..., :a.shape[-1]//2 + 1]
+    if orders is not None:
+        return a, coefficients
     return a
 
 
-def power_spectrum(correlation, method="FFT"):
+def mask_normalization(mask, binning=1, cut_off=0, dtype=np.float64):
+    """The number of unmasked pixels contributing to each angle of the correlation of some (stack of) masks.
+
+    Parameters
+    ----------
+    mask: boolean array
+        A (..., n_k, n_theta) mask
+    binning : int
+        binning factor
+    cut_off : int
+        The cut off in pixels
+    dtype: numpy dtype
+        The working precision
+
+    Returns
+    ----------
+    number_unmasked: array-like
+        The number of unmasked pairs of pixels for every angle. Dim (..., (n_k-cut_off)//binning, n_theta//binning)
+    """
+    unmasked = (~np.asarray(mask))[..., cut_off:, :].astype(dtype)  # inverting the boolean mask
+    if binning != 1:
+        unmasked = bin_2d(unmasked, binning)  # fraction of each binned pixel which is unmasked
+    number_unmasked = _autocorrelate(unmasked)
+    number_unmasked[number_unmasked < 1] = 1  # get rid of divide by zero error for completely masked rows
+    return number_unmasked
+
+
+def angular_cross_correlation_stack(r_theta_imgs, k_pairs=None, mask=None, binning=1, cut_off=0, normalize=True,
+                                    dtype=np.float64, number_unmasked=None, backend=None):
+    """The angular cross correlation C(k1, k2, dphi) = <I(k1, phi) I(k2, phi + dphi)> between the rings of a stack
+    of polar images. The FFT of every ring is only taken once and the products for all of the (k1, k2) pairs are
+    formed at once so there is no python loop over the pairs or the patterns.
+
+    Parameters
+    ----------
+    r_theta_imgs: array_like
+        A (n_patterns, n_k, n_theta) stack of polar images (any number of leading axes is allowed). If it is a masked
+        array and no mask is given its mask is used.
+    k_pairs: array-like
+        A (n_pairs, 2) list of the (k1, k2) indexes to correlate, counted after the cut off and the binning.
+        Otherwise every ring is correlated with every other ring.
+    mask: boolean array
+        The mask of the stack. Either the same shape as the stack or a (n_k, n_theta) mask shared by every pattern.
+    binning : int
+        binning factor
+    cut_off : int
+        The cut off in pixels
+    normalize: bool
+        Subtract <I(k1)><I(k2)> and divide by <I(k1)><I(k2)>
+    dtype: numpy dtype
+        The working precision. np.float32 uses single precision FFTs.
+    number_unmasked: array-like
+        The precomputed cross_mask_normalization of the mask. Otherwise it is computed once for every unique mask in
+        the stack.
+    backend: str
+        The FFT backend ('numpy', 'scipy' or 'pyfftw'). Otherwise the one from fft_backend.set_backend is used.
+
+    Returns
+    ----------
+    c: array-like
+        The cross correlation. Dim (n_patterns, n_k', n_k', n_theta//binning) or (n_patterns, n_pairs,
+        n_theta//binning) if k_pairs is given, where n_k' = (n_k-cut_off)//binning. c[..., k1, k2, :] for k1 == k2
+        is the angular correlation.
+    """
+    if k_pairs is not None:
+        k_pairs = np.reshape(k_pairs, (-1, 2))
+    if mask is None and isinstance(r_theta_imgs, np.ma.masked_array):
+        mask = np.ma.getmaskarray(r_theta_imgs)
+    image = np.array(np.ma.getdata(r_theta_imgs), dtype=dtype)  # copy so the masked pixels can be zeroed
+    if mask is not None:
+        image[np.broadcast_to(mask, image.shape)] = 0
+        if number_unmasked is None:
+            number_unmasked = _unique_normalization(mask, normalization=cross_mask_normalization, k_pairs=k_pairs,
+                                                    binning=binning, cut_off=cut_off, dtype=dtype)
+    if cut_off != 0:
+        image = image[..., cut_off:, :]
+    if binning != 1:
+        image = bin_2d(image, binning)
+
+    c = _cross_correlate(image, k_pairs=k_pairs, backend=backend)
+    if mask is not None:
+        c /= number_unmasked
+        c *= c.shape[-1]
+
+    if normalize:
+        row_mean = np.mean(c, axis=-1, keepdims=True)
+        c -= row_mean
+        c /= np.where(row_mean == 0, 1, row_mean)
+    return c
+
+
+def cross_mask_normalization(mask, k_pairs=None, binning=1, cut_off=0, dtype=np.float64):
+    """The number of unmasked pairs of pixels contributing to each angle of the cross correlation of some (stack
+    of) masks.
+
+    Parameters
+    ----------
+    mask: boolean array
+        A (..., n_k, n_theta) mask
+    k_pairs: array-like
+        A (n_pairs, 2) list of the (k1, k2) indexes. Otherwise every pair of rings.
+    binning : int
+        binning factor
+    cut_off : int
+        The cut off in pixels
+    dtype: numpy dtype
+        The working precision
+
+    Returns
+    ----------
+    number_unmasked: array-like
+        The number of unmasked pairs of pixels for every angle. Dim (..., n_k', n_k', n_theta//binning) or
+        (..., n_pairs, n_theta//binning)
+    """
+    unmasked = (~np.asarray(mask))[..., cut_off:, :].astype(dtype)  # inverting the boolean mask
+    if binning != 1:
+        unmasked = bin_2d(unmasked, binning)  # fraction of each binned pixel which is unmasked
+    number_unmasked = _cross_correlate(unmasked, k_pairs=None if k_pairs is None else np.reshape(k_pairs, (-1, 2)))
+    number_unmasked[number_unmasked < 1] = 1  # get rid of divide by zero error for completely masked rows
+    return number_unmasked
+
+
+def unique_masks(mask):
+    """Finds the distinct masks in a stack of masks.
+
+    Parameters
+    ----------
+    mask: boolean array
+        A (n_patterns, n_k, n_theta) stack of masks
+
+    Returns
+    ----------
+    unique: boolean array
+        The distinct masks. Dim (n_unique, n_k, n_theta)
+    inverse: array-like
+        The index into unique for every pattern
+    """
+    mask = np.asarray(mask)
+    flat = np.reshape(mask, (len(mask), -1))
+    if np.all(flat == flat[0]):
+        return mask[:1], np.zeros(len(mask), dtype=int)
+    _, index, inverse = np.unique(np.packbits(flat, axis=1), axis=0, return_index=True, return_inverse=True)
+    return mask[index], np.ravel(inverse)
+
+
+def _unique_normalization(mask, normalization=mask_normalization, **kwargs):
+    """The normalization (mask_normalization by default) of a stack of masks, calculated only once for each distinct
+    mask.
+    """
+    mask = np.asarray(mask)
+    if mask.ndim == 2:
+        return normalization(mask, **kwargs)
+    nav_shape = mask.shape[:-2]
+    unique, inverse = unique_masks(np.reshape(mask, (-1, *mask.shape[-2:])))
+    number_unmasked = normalization(unique, **kwargs)
+    if len(unique) == 1:
+        return number_unmasked[0]  # broadcast to every pattern
+    return np.reshape(number_unmasked[inverse], (*nav_shape, *number_unmasked.shape[1:]))
+
+
+def _autocorrelate(image, return_fft=False, backend=None):
+    """The circular autocorrelation along the last axis. The input is real so only the non-negative frequencies of
+    the real FFT are needed.
+    """
+    image_fft = fft_backend.rfft(image, axis=-1, backend=backend)
+    power = np.square(image_fft.real)
+    power += np.square(image_fft.imag)
+    correlation = fft_backend.irfft(power, n=image.shape[-1], axis=-1, backend=backend, overwrite_x=True)
+    if return_fft:
+        return correlation, image_fft
+    return correlation
+
+
+def _cross_correlate(image, k_pairs=None, backend=None):
+    """The circular cross correlation along the last axis between the rows of the image. The FFT of each row is only
+    taken once.
+    """
+    image_fft = fft_backend.rfft(image, axis=-1, backend=backend)
+    if k_pairs is None:
+        product = np.conj(image_fft)[..., :, np.newaxis, :] * image_fft[..., np.newaxis, :, :]
+    else:
+        product = np.conj(image_fft[..., k_pairs[:, 0], :]) * image_fft[..., k_pairs[:, 1], :]
+    return fft_backend.irfft(product, n=image.shape[-1], axis=-1, backend=backend, overwrite_x=True)
+
+
+def unfold_half(half_array, n):
+    """Rebuilds the full 0-2pi array from the 0-pi half of a symmetric array like an angular correlation or its
+    power spectrum.
+
+    Parameters
+    --------------
+    half_array: array-like
+        The first n//2 + 1 values along the last axis
+    n: int
+        The length of the full array
+
+    Returns
+    -----------
+    full_array: array-like
+        The symmetric array with length n along the last axis
+    """
+    return np.concatenate([half_array, half_array[..., 1:n - half_array.shape[-1] + 1][..., ::-1]], axis=-1)
+
+
+def power_spectrum(correlation, method="FFT", dtype=np.float64, half=False, n=None, backend=None):
     """Take the power spectrum for some correlation.  Takes the FFT of the correlation
 
     Parameters
     --------------
     correlation: array-like
-        Taking the FFT of the angular correlation to find the symmetry present
+        Taking the FFT of the angular correlation to find the symmetry present. Either one correlation or a
+        (..., n_k, n_theta) stack of them
     method: str ("FFT")
         Right now this doesn't actually do anything but I want to add in other methods.
+    dtype: numpy dtype
+        The working precision. np.float32 uses single precision FFTs.
+    half: bool
+        Only return the non-negative Fourier orders. The power spectrum is symmetric so the rest is redundant.
+    n: int
+        The full number of angles if the correlation only has the angles 0-pi.
+    backend: str
+        The FFT backend ('numpy', 'scipy' or 'pyfftw'). Otherwise the one from fft_backend.set_backend is used.
 
     Returns
     -----------
@@ -74,12 +347,157 @@ def power_spectrum(correlation, method="FFT"):
         The resulting power spectrum from the angular correlation.  Gives indexes 0-180.
     """
 
-    if method is "FFT":
-        pow_spectrum = np.fft.fft(correlation, axis=1).real
+    correlation = np.asarray(correlation, dtype=dtype)
+    if n is not None and n != correlation.shape[-1]:
+        correlation = unfold_half(correlation, n)
+    if method == "FFT":
+        # the correlation is real and symmetric so the real FFT holds every order
+        pow_spectrum = fft_backend.rfft(correlation, axis=-1, backend=backend).real
         pow_spectrum = np.power(pow_spectrum, 2)
+        if not half:
+            pow_spectrum = unfold_half(pow_spectrum, correlation.shape[-1])
     return pow_spectrum
 
 
+class PowerSpectrumAccumulator(object):
+    """Running sums for the power spectrum of the summed angular correlation.
+
+    The power spectrum is the square of the Fourier transform of the correlation, and the transform is linear, so the
+    transform of the summed correlation is the sum of the transforms of every correlation. Each chunk of correlations
+    is transformed and added as soon as it is made, so the correlations never have to be stored. The sum of the
+    squares of the transforms gives the variance of the summed spectrum.
+    """
+    def __init__(self, dtype=np.float64, n=None, backend=None):
+        """
+        Parameters
+        ------------------
+        dtype: numpy dtype
+            The working precision of the sums
+        n: int
+            The full number of angles if the correlations only have the angles 0-pi.
+        backend: str
+            The FFT backend ('numpy', 'scipy' or 'pyfftw'). Otherwise the one from fft_backend.set_backend is used.
+        """
+        self.dtype = dtype
+        self.n = n
+        self.backend = backend
+        self.count = 0
+        self.sum = None
+        self.sum_squares = None
+
+    def add(self, correlation):
+        """Adds a chunk of correlations to the sums.
+
+        Parameters
+        ------------------
+        correlation: array-like
+            One (n_k, n_theta) correlation or a (..., n_k, n_theta) stack of them. Masked values are added as 0.
+        """
+        correlation = np.asarray(np.ma.filled(correlation, 0), dtype=self.dtype)
+        if self.n is None:
+            self.n = correlation.shape[-1]
+        if self.n != correlation.shape[-1]:
+            correlation = unfold_half(correlation, self.n)
+        correlation = np.reshape(correlation, (-1, *correlation.shape[-2:]))
+        transform = fft_backend.rfft(correlation, axis=-1, backend=self.backend).real
+        if self.sum is None:
+            self.sum = np.zeros(transform.shape[1:], dtype=self.dtype)
+            self.sum_squares = np.zeros(transform.shape[1:], dtype=self.dtype)
+        self.sum += np.sum(transform, axis=0)
+        self.sum_squares += np.sum(np.square(transform), axis=0)
+        self.count += len(transform)
+
+    def power_spectrum(self, half=False):
+        """The power spectrum of the summed correlation. The same as power_spectrum(summed correlation).
+
+        Parameters
+        ------------------
+        half: bool
+            Only return the non-negative Fourier orders.
+
+        Returns
+        -----------
+        pow_spectrum: array-like
+            Dim (n_k, n_theta) or (n_k, n_theta//2 + 1) if half
+        """
+        pow_spectrum = np.square(self.sum)
+        if not half:
+            pow_spectrum = unfold_half(pow_spectrum, self.n)
+        return pow_spectrum
+
+    def variance(self, half=False):
+        """The variance of the power spectrum of the summed correlation, treating every correlation as an independent
+        sample and propagating the variance of the summed transform to its square.
+
+        Parameters
+        ------------------
+        half: bool
+            Only return the non-negative Fourier orders.
+
+        Returns
+        -----------
+        variance: array-like
+            Dim (n_k, n_theta) or (n_k, n_theta//2 + 1) if half
+        """
+        mean = self.sum / self.count
+        sum_variance = np.maximum(self.sum_squares - self.count * np.square(mean), 0)  # var(sum) = N var(one)
+        variance = 4 * np.square(self.sum) * sum_variance
+        if not half:
+            variance = unfold_half(variance, self.n)
+        return variance
+
+
+def symmetry_spectrum(r_theta_imgs, orders=[2, 4, 6, 8, 10], mask=None, dtype=np.float64):
+    """The power spectrum of the normalized angular correlation at only a few Fourier orders. The angular Fourier
+    coefficients of the polar images are found directly with a partial DFT against precomputed cos/sin tables, so
+    the correlation is never calculated. For unmasked rows this is the same as
+    power_spectrum(angular_correlation(img)) at the orders.
+
+    Parameters
+    ----------
+    r_theta_imgs: array_like
+        A (..., n_k, n_theta) stack of polar images. If it is a masked array and no mask is given its mask is used.
+    orders: list
+        The Fourier orders (symmetries) to calculate
+    mask: boolean array
+        The mask of the stack. Masked pixels are filled with the mean of their row and the coefficients are scaled
+        by the fraction of the row which is unmasked.
+    dtype: numpy dtype
+        The working precision.
+
+    Returns
+    ----------
+    spectrum: array-like
+        The power at each order. Dim (..., n_k, len(orders))
+    """
+    if mask is None and isinstance(r_theta_imgs, np.ma.masked_array):
+        mask = np.ma.getmaskarray(r_theta_imgs)
+    image = np.array(np.ma.getdata(r_theta_imgs), dtype=dtype)
+    n = image.shape[-1]
+    theta = np.arange(n) * 2 * np.pi / n
+    all_orders = np.concatenate([[0], orders])
+    cos_table = np.cos(np.outer(all_orders, theta)).astype(dtype)
+    sin_table = np.sin(np.outer(all_orders, theta)).astype(dtype)
+    if mask is not None:
+        # masked pixels are filled with the mean of the unmasked pixels in their row so the gaps add no symmetry
+        mask = np.broadcast_to(mask, image.shape)
+        image[mask] = 0
+        number_unmasked = np.sum(~mask, axis=-1, keepdims=True)
+        row_mean = np.divide(np.sum(image, axis=-1, keepdims=True), np.maximum(number_unmasked, 1)).astype(dtype)
+        image = np.where(mask, row_mean, image)
+    real = np.matmul(image, cos_table.T)
+    imaginary = np.matmul(image, sin_table.T)
+    if mask is not None:
+        scale = np.divide(n, np.maximum(number_unmasked, 1)).astype(dtype)
+        real[..., 1:] *= scale
+        imaginary[..., 1:] *= scale
+    power = np.square(real[..., 1:]) + np.square(imaginary[..., 1:])
+    mean_power = np.square(real[..., :1]) / n  # the mean of the correlation before it is normalized
+    spectrum = np.square(np.divide(power, np.where(mean_power == 0, 1, mean_power)))
+    spectrum[..., np.asarray(orders) == 0] = 0  # the normalized correlation has a mean of 0
+    return spectrum
+
+
 def get_S_Q(r_theta_img, plot=False):
     """Get the S of Q for the images.
 
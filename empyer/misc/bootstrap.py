@@ -0,0 +1,115 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+
+def resample_weights(n, n_replicates, seed=None):
+    """The weights of bootstrap replicates. Each replicate draws n patterns with replacement, which is the same as
+    weighting every pattern by the number of times it was drawn.
+
+    Parameters
+    ----------
+    n: int
+        The number of patterns
+    n_replicates: int
+        The number of replicates
+    seed: int or numpy SeedSequence
+        The seed of the random draws
+
+    Returns
+    ----------
+    weights: array-like
+        The number of times each pattern is drawn in each replicate. Dim (n_replicates, n)
+    """
+    rng = np.random.default_rng(seed)
+    return rng.multinomial(n, np.full(n, 1 / n), size=n_replicates).astype(np.float64)
+
+
+def bootstrap(estimator, statistics, n_replicates=200, seed=None, n_jobs=1, batch_size=50):
+    """Bootstrap replicates of some estimator from the per pattern statistics.
+
+    The statistics of every pattern are found once and every replicate is a weighted sum over them, so a replicate
+    never goes back to the data. The replicates are made in batches with one matrix product per batch. The batches
+    are seeded from one SeedSequence so the replicates are the same for any n_jobs.
+
+    Parameters
+    ----------
+    estimator: callable
+        estimator(weights, *statistics) gives the estimate for each row of a (n_batch, n) weight matrix. It must be
+        picklable (a module level function or a partial of one) if n_jobs isn't 1.
+    statistics: tuple
+        The per pattern statistics. Each is an array with the patterns along the first axis.
+    n_replicates: int
+        The number of replicates
+    seed: int
+        The seed of the random draws
+    n_jobs: int
+        The number of processes. -1 uses all of the cores.
+    batch_size: int
+        The number of replicates in each weight matrix
+
+    Returns
+    ----------
+    replicates: array-like
+        The estimate for every replicate. Dim (n_replicates, ...)
+    """
+    n = len(statistics[0])
+    sizes = [min(batch_size, n_replicates - start) for start in range(0, n_replicates, batch_size)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(estimator, statistics, n, size, batch_seed) for size, batch_seed in zip(sizes, seeds)]
+    if n_jobs == 1:
+        batches = [_replicate_batch(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs if n_jobs > 0 else None) as executor:
+            batches = list(executor.map(_replicate_batch, tasks))
+    return np.concatenate(batches, axis=0)
+
+
+def confidence_interval(replicates, level=0.95):
+    """The percentile confidence interval of some bootstrap replicates.
+
+    Parameters
+    ----------
+    replicates: array-like
+        The replicates along the first axis
+    level: float
+        The confidence level
+
+    Returns
+    ----------
+    lower: array-like
+        The lower bound
+    upper: array-like
+        The upper bound
+    """
+    tail = (1 - level) / 2 * 100
+    with np.errstate(invalid="ignore"):
+        lower, upper = np.nanpercentile(replicates, [tail, 100 - tail], axis=0)
+    return lower, upper
+
+
+def weighted_mean(weights, values):
+    """The weighted mean of some per pattern values for each row of the weights.
+
+    Parameters
+    ----------
+    weights: array-like
+        Dim (n_replicates, n)
+    values: array-like
+        Dim (n, ...)
+
+    Returns
+    ----------
+    mean: array-like
+        Dim (n_replicates, ...)
+    """
+    values = np.asarray(values)
+    mean = np.matmul(weights, np.reshape(values, (len(values), -1))) / np.sum(weights, axis=1, keepdims=True)
+    return np.reshape(mean, (len(weights), *values.shape[1:]))
+
+
+def _replicate_batch(task):
+    """One batch of replicates. Module level so it can be sent to another process.
+    """
+    estimator, statistics, n, size, seed = task
+    return estimator(resample_weights(n, size, seed=seed), *statistics)
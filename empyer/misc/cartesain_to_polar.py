@@ -1,10 +1,262 @@
+import os
+import time
+from multiprocessing import Pool, shared_memory, get_start_method
+
 import numpy as np
-from scipy.interpolate import RectBivariateSpline
+from scipy.sparse import csr_matrix
 
 from empyer.misc.image import ellipsoid_list_to_cartesian
+from empyer.misc.radial_profile import elliptical_coordinates
+
+
+class PolarTransformPlan(object):
+    """Precomputed mapping from an image in cartesian coordinates to polar coordinates.
+
+    The target grid and the interpolation weights only depend on the geometry (center, angle, lengths, radius and
+    phase_width) so they are calculated once and then applied to every diffraction pattern with the same geometry.
+
+    With method="linear" every polar pixel is bi-linearly interpolated from the four nearest detector pixels. With
+    method="rebin" every detector pixel (or sub-pixel) is instead accumulated into the polar bin it falls in and each
+    bin is the mean of its pixels, so every count on the detector is used exactly once. Bins which no pixel falls in
+    are flagged in empty.
+
+    With binning the polar grid is binned (like bin_2d) as part of the plan, so only the binned polar image is ever
+    made.
+    """
+    def __init__(self, image_shape, center=None, angle=None, lengths=None, radius=[0, 100], phase_width=720,
+                 dtype=np.float64, method="linear", splitting=1, binning=1):
+        """
+        Parameters
+        ------------------
+        image_shape: tuple
+            The (y, x) shape of the images to convert
+        center: list
+            [X,Y] coordinates for the center of the image
+        angle: float
+            Angle of rotation if the sample is elliptical
+        lengths: list
+            The major and minor lengths of the ellipse
+        radius: list
+            The inner and outer indexes to define the radius by.
+        phase_width: int
+            The number of "pixels" in the polar image along the x direction
+        dtype: numpy dtype
+            The working precision of the weights and the polar images
+        method: str
+            "linear" for bi-linear interpolation or "rebin" for intensity conserving rebinning
+        splitting: int
+            For method="rebin" each pixel is split into splitting x splitting sub-pixels which are binned separately.
+        binning: int
+            The polar grid is binned by this factor. Dim ((radius[1]-radius[0])//binning, phase_width//binning)
+        """
+        self.dtype = np.dtype(dtype)
+        self.image_shape = tuple(image_shape[-2:])
+        if center is None:
+            center = np.true_divide(self.image_shape, 2)
+        self.output_shape = (int(radius[1] - radius[0]), phase_width)
+        self.method = method
+        self.binning = binning
+        self._matrix = None
+        if method == "rebin":
+            self.indexes, self.weights = None, None
+            self._matrix, self.empty = rebin_matrix(self.image_shape, center, angle, lengths, radius, phase_width,
+                                                    splitting, self.dtype)
+            if binning != 1:
+                self._matrix, self.empty = bin_matrix(self._matrix, self.empty, binning, self.dtype)
+                self.output_shape = self.empty.shape
+            return
+        if method != "linear":
+            raise ValueError("method must be 'linear' or 'rebin' not " + str(method))
+        self.empty = np.zeros(self.output_shape, dtype=bool)
+        final_the = np.linspace(0, 2*np.pi, num=phase_width)
+        final_rad = np.arange(radius[0], radius[1], 1)
+        final_x, final_y = ellipsoid_list_to_cartesian(final_rad,
+                                                       final_the,
+                                                       center,
+                                                       axes_lengths=lengths,
+                                                       angle=angle)
+        self.indexes, self.weights = bilinear_weights(np.ravel(final_x), np.ravel(final_y), self.image_shape)
+        self.weights = self.weights.astype(self.dtype)
+        if binning != 1:
+            # the binned grid is one sparse matrix so the full resolution polar image is never made
+            self._matrix, self.empty = bin_matrix(self.matrix, self.empty, binning, self.dtype)
+            self.output_shape = self.empty.shape
+            self.indexes, self.weights = None, None
+
+    @property
+    def matrix(self):
+        """The plan as a sparse (output polar pixels x input image pixels) interpolation or rebinning matrix.
+        """
+        if self._matrix is None:
+            num_out = np.prod(self.output_shape)
+            rows = np.tile(np.arange(num_out), len(self.indexes))
+            self._matrix = csr_matrix((np.ravel(self.weights), (rows, np.ravel(self.indexes))),
+                                      shape=(num_out, np.prod(self.image_shape)))
+        return self._matrix
+
+    def apply(self, img):
+        """Converts one image using the precomputed indexes and weights (or the rebinning matrix).
+
+        Parameters
+        ------------------
+        img: array-like
+            A 2-d array with the shape image_shape
+
+        Returns
+        -----------
+        polar_img: array-like
+            The img in polar coordinates. Dim output_shape
+        """
+        intensity = np.ravel(np.asarray(img, dtype=self.dtype))
+        if self.indexes is None:
+            return np.reshape(self.matrix.dot(intensity), self.output_shape)
+        polar_img = np.sum(intensity[self.indexes] * self.weights, axis=0)
+        return np.reshape(polar_img, self.output_shape)
+
+    def apply_stack(self, imgs):
+        """Converts a stack of images at once using the sparse interpolation matrix.
+
+        Parameters
+        ------------------
+        imgs: array-like
+            A (..., image_shape) array of images
+
+        Returns
+        -----------
+        polar_imgs: array-like
+            The images in polar coordinates. Dim (..., output_shape)
+        """
+        imgs = np.asarray(imgs, dtype=self.dtype)
+        flat = np.reshape(imgs, (-1, np.prod(self.image_shape)))
+        polar_imgs = self.matrix.dot(flat.T).T
+        return np.reshape(polar_imgs, (*imgs.shape[:-2], *self.output_shape))
+
+
+def bilinear_weights(x, y, image_shape):
+    """Finds the four neighboring pixels and the bi-linear weights for each point. Points outside of the image are
+    clamped to the edge of the image.
+
+    Parameters
+    ------------------
+    x: array-like
+        The positions along the first axis of the image
+    y: array-like
+        The positions along the second axis of the image
+    image_shape: tuple
+        The shape of the image
+
+    Returns
+    -----------
+    indexes: array-like
+        (4, len(x)) flattened indexes into the image
+    weights: array-like
+        (4, len(x)) weights for each of the indexes
+    """
+    x = np.clip(x, 0, image_shape[0] - 1)
+    y = np.clip(y, 0, image_shape[1] - 1)
+    x0 = np.clip(np.floor(x).astype(int), 0, max(image_shape[0] - 2, 0))
+    y0 = np.clip(np.floor(y).astype(int), 0, max(image_shape[1] - 2, 0))
+    x1 = np.minimum(x0 + 1, image_shape[0] - 1)
+    y1 = np.minimum(y0 + 1, image_shape[1] - 1)
+    dx = x - x0
+    dy = y - y0
+    indexes = np.array([x0 * image_shape[1] + y0,
+                        x1 * image_shape[1] + y0,
+                        x0 * image_shape[1] + y1,
+                        x1 * image_shape[1] + y1])
+    weights = np.array([(1 - dx) * (1 - dy),
+                        dx * (1 - dy),
+                        (1 - dx) * dy,
+                        dx * dy])
+    return indexes, weights
+
+
+def rebin_matrix(image_shape, center, angle, lengths, radius, phase_width, splitting=1, dtype=np.float64):
+    """Builds the sparse matrix which takes the mean of the detector pixels falling in each polar bin. The polar bins
+    are centered on the same radii and angles as the bi-linear grid.
+
+    Parameters
+    ------------------
+    image_shape: tuple
+        The (y, x) shape of the images
+    center: list
+        [X,Y] coordinates for the center of the image
+    angle: float
+        Angle of rotation if the sample is elliptical
+    lengths: list
+        The major and minor lengths of the ellipse
+    radius: list
+        The inner and outer indexes to define the radius by.
+    phase_width: int
+        The number of "pixels" in the polar image along the x direction
+    splitting: int
+        Each pixel is split into splitting x splitting sub-pixels which are binned separately.
+    dtype: numpy dtype
+        The dtype of the matrix
+
+    Returns
+    -----------
+    matrix: csr_matrix
+        The (output polar pixels x input image pixels) rebinning matrix
+    empty: array-like
+        Boolean array of the polar bins without any pixels. Dim (radius[1]-radius[0]) x phase_width
+    """
+    num_rad = int(radius[1] - radius[0])
+    num_out = num_rad * phase_width
+    sub_pixels = (np.arange(splitting) + 0.5) / splitting - 0.5
+    x = np.add.outer(np.arange(image_shape[0]), sub_pixels)
+    y = np.add.outer(np.arange(image_shape[1]), sub_pixels)
+    x, y = np.meshgrid(np.ravel(x), np.ravel(y), indexing="ij")
+    r, theta = elliptical_coordinates(x, y, center, lengths=lengths, angle=angle)
+    r_bins = np.ravel(np.round(r).astype(int) - radius[0])
+    theta_bins = np.ravel(np.round(theta * (phase_width - 1) / (2 * np.pi)).astype(int))  # linspace(0, 2pi) grid
+    pixels = np.ravel(np.arange(np.prod(image_shape)).reshape(image_shape).repeat(splitting, axis=0)
+                      .repeat(splitting, axis=1))
+    inside = (r_bins >= 0) & (r_bins < num_rad)
+    bins = r_bins[inside] * phase_width + theta_bins[inside]
+    counts = np.bincount(bins, minlength=num_out)
+    matrix = csr_matrix(((1 / counts[bins]).astype(dtype), (bins, pixels[inside])),
+                        shape=(num_out, int(np.prod(image_shape))))
+    return matrix, np.reshape(counts == 0, (num_rad, phase_width))
+
+
+def bin_matrix(matrix, empty, binning, dtype=np.float64):
+    """Bins the output of a polar transform matrix the same way as bin_2d (the leading rows and columns which don't
+    fill a bin are dropped). Each binned pixel is the mean of the polar pixels in it which aren't empty.
+
+    Parameters
+    ------------------
+    matrix: csr_matrix
+        The (output polar pixels x input image pixels) matrix
+    empty: array-like
+        Boolean array of the empty polar bins. Dim (n_r, n_theta)
+    binning: int
+        The binning factor
+    dtype: numpy dtype
+        The dtype of the matrix
+
+    Returns
+    -----------
+    matrix: csr_matrix
+        The (binned polar pixels x input image pixels) matrix
+    empty: array-like
+        Boolean array of the binned pixels without any filled polar pixel. Dim (n_r//binning, n_theta//binning)
+    """
+    shape = np.shape(empty)
+    binned_shape = (shape[0] // binning, shape[1] // binning)
+    r, theta = np.meshgrid(np.arange(shape[0]) - shape[0] % binning,
+                           np.arange(shape[1]) - shape[1] % binning, indexing="ij")
+    inside = np.ravel((r >= 0) & (theta >= 0) & ~np.asarray(empty))
+    binned = np.ravel((r // binning) * binned_shape[1] + theta // binning)
+    counts = np.bincount(binned[inside], minlength=int(np.prod(binned_shape)))
+    fine = np.arange(len(binned))[inside]
+    binning_matrix = csr_matrix(((1 / counts[binned[inside]]).astype(dtype), (binned[inside], fine)),
+                                shape=(int(np.prod(binned_shape)), len(binned)))
+    return (binning_matrix @ matrix).tocsr(), np.reshape(counts == 0, binned_shape)
 
 
-def convert(img, center=None, angle=None, lengths=None, radius=[0,100], phase_width=720):
+def convert(img, center=None, angle=None, lengths=None, radius=[0,100], phase_width=720, plan=None,
+            transform_mask=True, dtype=np.float64):
     """ Function for converting an image in cartesian coordinates to polar coordinates.
 
     Parameters
@@ -21,38 +273,250 @@ def convert(img, center=None, angle=None, lengths=None, radius=[0,100], phase_wi
         The inner and outer indexes to define the radius by.
     phase_width: int
         The number of "pixels" in the polar image along the x direction
+    plan: PolarTransformPlan
+        A precomputed plan for the geometry. If given center, angle, lengths, radius and phase_width are ignored.
+    transform_mask: bool
+        Return a masked array with the mask of img in polar coordinates and the empty bins of the plan masked.
+        Otherwise the mask is ignored.
+    dtype: numpy dtype
+        The working precision if no plan is given.
 
     Returns
     -----------
     polar_img: array-like
         A numpy array of the input img  in polar coordiates. Dim (radius[1]-radius[0]) x phase_width
     """
+    if plan is None:
+        plan = PolarTransformPlan(np.shape(img),
+                                  center=center,
+                                  angle=angle,
+                                  lengths=lengths,
+                                  radius=radius,
+                                  phase_width=phase_width,
+                                  dtype=dtype)
+    masked = np.ma.is_masked(img)
+    if plan.method == "rebin" and masked:
+        polar_img = plan.apply(np.ma.filled(img, 0))  # the masked pixels add nothing to the sums
+        polar_mask = _rebin_unmasked(polar_img, np.ma.getmaskarray(img), plan)
+    else:
+        polar_img = plan.apply(np.ma.getdata(img))
+        polar_mask = convert_mask(np.ma.getmaskarray(img), plan=plan) if transform_mask and masked else None
+    if transform_mask and masked:
+        polar_img = np.ma.masked_array(polar_img, mask=polar_mask)
+    elif transform_mask and plan.empty.any():
+        polar_img = np.ma.masked_array(polar_img, mask=plan.empty.copy())
+    return polar_img
+
+
+def convert_stack(imgs, center=None, angle=None, lengths=None, radius=[0, 100], phase_width=720, plan=None,
+                  chunk_size=1000, dtype=np.float64):
+    """Converts a stack of images in cartesian coordinates to polar coordinates.  The images are flattened and
+    multiplied against the sparse interpolation matrix of the plan in blocks of chunk_size images.
+
+    Parameters
+    ------------------
+    imgs: array-like
+        A (..., y, x) array of images to convert to polar coordinates. Masked arrays are allowed.
+    center: list
+        [X,Y] coordinates for the center of the image
+    angle: float
+        Angle of rotation if the sample is elliptical
+    lengths: list
+        The major and minor lengths of the ellipse
+    radius: list
+        The inner and outer indexes to define the radius by.
+    phase_width: int
+        The number of "pixels" in the polar image along the x direction
+    plan: PolarTransformPlan
+        A precomputed plan for the geometry. If given center, angle, lengths, radius and phase_width are ignored.
+    chunk_size: int
+        The number of images multiplied at once.
+    dtype: numpy dtype
+        The working precision if no plan is given.
+
+    Returns
+    -----------
+    polar_imgs: array-like
+        The images in polar coordinates. Dim (..., radius[1]-radius[0], phase_width). A masked array if imgs is
+        a masked array or if the plan has empty bins.
+    """
+    if plan is None:
+        plan = PolarTransformPlan(np.shape(imgs),
+                                  center=center,
+                                  angle=angle,
+                                  lengths=lengths,
+                                  radius=radius,
+                                  phase_width=phase_width,
+                                  dtype=dtype)
+    nav_shape = np.shape(imgs)[:-2]
+    masked = isinstance(imgs, np.ma.masked_array)
+    rebin_masked = masked and plan.method == "rebin"
+    flat = np.reshape(imgs if rebin_masked else np.ma.getdata(imgs), (-1, *plan.image_shape))
+    polar_imgs = np.empty((len(flat), *plan.output_shape), dtype=plan.dtype)
+    for start in range(0, len(flat), chunk_size):
+        # for rebin the masked pixels add nothing to the sums
+        polar_imgs[start:start + chunk_size] = plan.apply_stack(np.ma.filled(flat[start:start + chunk_size], 0))
+    polar_imgs = np.reshape(polar_imgs, (*nav_shape, *plan.output_shape))
+    if rebin_masked:
+        polar_imgs = np.ma.masked_array(polar_imgs, mask=_rebin_unmasked(polar_imgs, np.ma.getmaskarray(imgs), plan,
+                                                                         chunk_size=chunk_size))
+    elif masked:
+        polar_imgs = np.ma.masked_array(polar_imgs,
+                                        mask=convert_mask(np.ma.getmaskarray(imgs), plan=plan, chunk_size=chunk_size))
+    elif plan.empty.any():
+        polar_imgs = np.ma.masked_array(polar_imgs, mask=np.broadcast_to(plan.empty, polar_imgs.shape).copy())
+    return polar_imgs
+
+
+def convert_mask(mask, plan, chunk_size=1000):
+    """Converts a boolean mask in cartesian coordinates to polar coordinates. A polar pixel is masked if the masked
+    pixels contribute more than 1e-5 of its interpolation weight or if it is an empty bin of the plan. With
+    method="rebin" each bin is the mean of its unmasked pixels, so a bin is only masked if all of its pixels are.
+    If every image in the stack has the same mask it is only converted once.
+
+    Parameters
+    ------------------
+    mask: array-like
+        A (..., y, x) boolean array
+    plan: PolarTransformPlan
+        The plan for the geometry.
+    chunk_size: int
+        The number of masks multiplied at once when the masks are different.
 
-    img_shape = np.shape(img)
-    initial_y, initial_x = range(0, img_shape[-2]), range(0, img_shape[-1])
-    if center is None:
-        center = np.true_divide(img_shape[-2:], 2)
-    final_the = np.linspace(0, 2*np.pi, num=phase_width)
-    final_rad = np.arange(radius[0], radius[1], 1)
-    final_x, final_y = ellipsoid_list_to_cartesian(final_rad,
-                                                   final_the,
-                                                   center,
-                                                   axes_lengths=lengths,
-                                                   angle=angle)
-    intensity = img.data
-
-    # setting masked values to negative values. Anything interpolated from masked values becomes negative
+    Returns
+    -----------
+    polar_mask: array-like
+        The boolean mask in polar coordinates. Dim (..., radius[1]-radius[0], phase_width)
+    """
+    if plan.method == "rebin":
+        return (_unmasked_weights(mask, plan, chunk_size=chunk_size) <= 0) | plan.empty
+    nav_shape = np.shape(mask)[:-2]
+    flat = np.reshape(mask, (-1, *plan.image_shape))
+    if np.all(flat == flat[0]):
+        polar_mask = (plan.apply_stack(flat[0]) > 1e-5) | plan.empty
+        return np.broadcast_to(polar_mask, (*nav_shape, *plan.output_shape)).copy()
+    polar_mask = np.empty((len(flat), *plan.output_shape), dtype=bool)
+    for start in range(0, len(flat), chunk_size):
+        polar_mask[start:start + chunk_size] = (plan.apply_stack(flat[start:start + chunk_size]) > 1e-5) | plan.empty
+    return np.reshape(polar_mask, (*nav_shape, *plan.output_shape))
+
+
+def _unmasked_weights(mask, plan, chunk_size=1000):
+    """The fraction of the weight of every polar pixel which comes from unmasked pixels. If every image in the stack
+    has the same mask it is only converted once.
+    """
+    nav_shape = np.shape(mask)[:-2]
+    flat = np.reshape(mask, (-1, *plan.image_shape))
+    if np.all(flat == flat[0]):
+        return np.broadcast_to(plan.apply_stack(~flat[0]), (*nav_shape, *plan.output_shape))
+    weights = np.empty((len(flat), *plan.output_shape), dtype=plan.dtype)
+    for start in range(0, len(flat), chunk_size):
+        weights[start:start + chunk_size] = plan.apply_stack(~flat[start:start + chunk_size])
+    return np.reshape(weights, (*nav_shape, *plan.output_shape))
+
+
+def _rebin_unmasked(polar_imgs, mask, plan, chunk_size=1000):
+    """Turns rebinned images, made with their masked pixels set to 0, into the mean of the unmasked pixels of every
+    bin in place. Returns the polar mask of the bins without any unmasked pixels.
+    """
+    weights = _unmasked_weights(mask, plan, chunk_size=chunk_size)
+    np.divide(polar_imgs, weights, out=polar_imgs, where=weights > 0)
+    return (weights <= 0) | plan.empty
+
+
+def convert_processes(imgs, plan, workers=None, chunk_size=100):
+    """Converts a stack of images to polar coordinates using a pool of processes. The output is kept in shared
+    memory so every worker writes its polar images in place. Only the block indexes and the timings are passed
+    between the processes.
+
+    Where processes are forked (linux) the workers read straight from the images (or the file behind a memmap)
+    that they inherit, so the images are never copied. Otherwise the images are copied once into shared memory,
+    which briefly doubles the memory of the images. Masked images converted with method="rebin" are always copied
+    once with their masked pixels set to 0.
+
+    Parameters
+    ------------------
+    imgs: array-like
+        A (..., y, x) array of images to convert to polar coordinates. Masked arrays are allowed.
+    plan: PolarTransformPlan
+        The plan for the geometry
+    workers: int
+        The number of processes. Defaults to the number of cpus
+    chunk_size: int
+        The number of images in each block given to a worker
+
+    Returns
+    -----------
+    polar_imgs: array-like
+        The images in polar coordinates. Dim (..., radius[1]-radius[0], phase_width)
+    throughput: dict
+        The number of images per second converted by each worker (by process id)
+    """
+    if workers is None:
+        workers = os.cpu_count()
+    nav_shape = np.shape(imgs)[:-2]
+    masked = isinstance(imgs, np.ma.masked_array)
+    rebin_masked = masked and plan.method == "rebin"
+    # for rebin the masked pixels must add nothing to the sums, which takes a copy with them set to 0
+    flat = np.reshape(np.ma.filled(imgs, 0) if rebin_masked else np.ma.getdata(imgs), (-1, *plan.image_shape))
+    in_shape, out_shape = flat.shape, (len(flat), *plan.output_shape)
+    shm_in = None
+    shm_out = shared_memory.SharedMemory(create=True, size=max(int(np.prod(out_shape)) * plan.dtype.itemsize, 1))
     try:
-        intensity[img.mask] = -999999
-    except AttributeError:
-        pass
-    spline = RectBivariateSpline(initial_x, initial_y, intensity, kx=1, ky=1)  # bi-linear spline (Takes 90% of time)
-    polar_img = np.array(spline.ev(final_x, final_y))
-    polar_img = np.reshape(polar_img, (int(radius[1]-radius[0]), phase_width))
-
-    # outputting new mask
-    polar_img[polar_img < -10] = -10
-    return polar_img
+        if get_start_method() == "fork":
+            _worker["imgs"] = flat  # inherited by the forked workers without a copy
+        else:
+            shm_in = shared_memory.SharedMemory(create=True, size=max(flat.nbytes, 1))
+            np.ndarray(in_shape, dtype=flat.dtype, buffer=shm_in.buf)[:] = flat
+        blocks = [(start, min(start + chunk_size, len(flat))) for start in range(0, len(flat), chunk_size)]
+        plan.matrix  # building the sparse matrix once before the plan is sent to the workers
+        with Pool(workers,
+                  initializer=_init_worker,
+                  initargs=(None if shm_in is None else shm_in.name, in_shape, flat.dtype, shm_out.name, out_shape,
+                            plan)) as pool:
+            timings = pool.map(_convert_block, blocks)
+        polar_imgs = np.ndarray(out_shape, dtype=plan.dtype, buffer=shm_out.buf).copy()
+    finally:
+        _worker.pop("imgs", None)
+        if shm_in is not None:
+            shm_in.close()
+            shm_in.unlink()
+        shm_out.close()
+        shm_out.unlink()
+    throughput = {}
+    for pid, num, seconds in timings:
+        total_num, total_seconds = throughput.get(pid, (0, 0))
+        throughput[pid] = (total_num + num, total_seconds + seconds)
+    throughput = {pid: num / max(seconds, 1e-12) for pid, (num, seconds) in throughput.items()}
+    polar_imgs = np.reshape(polar_imgs, (*nav_shape, *plan.output_shape))
+    if rebin_masked:
+        polar_imgs = np.ma.masked_array(polar_imgs, mask=_rebin_unmasked(polar_imgs, np.ma.getmaskarray(imgs), plan))
+    elif masked:
+        polar_imgs = np.ma.masked_array(polar_imgs, mask=convert_mask(np.ma.getmaskarray(imgs), plan=plan))
+    elif plan.empty.any():
+        polar_imgs = np.ma.masked_array(polar_imgs, mask=np.broadcast_to(plan.empty, polar_imgs.shape).copy())
+    return polar_imgs, throughput
+
+
+_worker = {}
 
 
+def _init_worker(in_name, in_shape, in_dtype, out_name, out_shape, plan):
+    """Attaches a worker process to the shared output array and to the shared input array unless the images were
+    inherited by forking.
+    """
+    if in_name is not None:
+        _worker["shm_in"] = shared_memory.SharedMemory(name=in_name)
+        _worker["imgs"] = np.ndarray(in_shape, dtype=in_dtype, buffer=_worker["shm_in"].buf)
+    _worker["shm_out"] = shared_memory.SharedMemory(name=out_name)
+    _worker["polar_imgs"] = np.ndarray(out_shape, dtype=plan.dtype, buffer=_worker["shm_out"].buf)
+    _worker["plan"] = plan
+
 
+def _convert_block(block):
+    """Converts the images [start, stop) and writes them directly into the shared output.
+    """
+    start, stop = block
+    tic = time.perf_counter()
+    _worker["polar_imgs"][start:stop] = _worker["plan"].apply_stack(_worker["imgs"][start:stop])
+    return os.getpid(), stop - start, time.perf_counter() - tic
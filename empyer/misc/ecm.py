@@ -1,21 +1,61 @@
 import numpy as np
+from empyer.misc import fft_backend
 
 
-def ecm(data):
+def ecm(data, axis=0, backend=None):
     """Calculates the correlation between some pixel and the same pixel at time t+tau
     Make sure that the data that is fed to the ecm method is the time data at some pixel value.
 
     Parameters
     ----------
     data: array_like
-        pixel values for some x,y position over a time series
+        pixel values for some x,y position over a time series. Any number of pixels can be correlated at once if the
+        time is along axis.
+    axis: int
+        The time axis
+    backend: str
+        The FFT backend ('numpy', 'scipy' or 'pyfftw'). Otherwise the one from fft_backend.set_backend is used.
     """
     # fast method uses a FFT and is a process which is O(n) = n log(n)
-    data_length = len(data)
-    data_fft = np.fft.fft(data)
-    time_correlation = np.fft.ifft(data_fft * np.conjugate(data_fft)).real
-    #print(len(time_correlation))
+    data = np.asarray(data)
+    data_length = data.shape[axis]
+    data_fft = fft_backend.rfft(data, axis=axis, backend=backend)
+    power = np.square(data_fft.real) + np.square(data_fft.imag)
+    time_correlation = fft_backend.irfft(power, n=data_length, axis=axis, backend=backend)
     # normalizing the data
+    mean = np.mean(data, axis=axis, keepdims=True)
     norm_correlation = time_correlation/data_length
-    norm_correlation = norm_correlation/np.mean(data)**2
+    norm_correlation = norm_correlation/np.where(mean == 0, 1, mean)**2  # pixels which are always 0 stay 0
     return norm_correlation
+
+
+def ecm_stack(data, axis=0, chunk_size=4096, backend=None):
+    """The ecm of every pixel of a time series of images (or any other array). The pixels are correlated chunk_size
+    at a time so the FFTs of the whole series never need to be in memory at once.
+
+    Parameters
+    ----------
+    data: array_like
+        The time series. Masked arrays are allowed and any pixel which is masked at some time is masked.
+    axis: int
+        The time axis
+    chunk_size: int
+        The number of pixels correlated at once
+    backend: str
+        The FFT backend ('numpy', 'scipy' or 'pyfftw'). Otherwise the one from fft_backend.set_backend is used.
+
+    Returns
+    ----------
+    correlation: array-like
+        The normalized time correlation of every pixel with the time axis replaced by tau. Same shape as the data.
+    """
+    series = np.moveaxis(np.ma.getdata(data), axis, 0)
+    flat = np.reshape(series, (len(series), -1))
+    correlation = np.empty(flat.shape)
+    for start in range(0, flat.shape[1], chunk_size):
+        correlation[:, start:start + chunk_size] = ecm(flat[:, start:start + chunk_size], axis=0, backend=backend)
+    correlation = np.moveaxis(np.reshape(correlation, series.shape), 0, axis)
+    if isinstance(data, np.ma.masked_array):
+        mask = np.any(np.ma.getmaskarray(data), axis=axis, keepdims=True)
+        correlation = np.ma.masked_array(correlation, mask=np.broadcast_to(mask, correlation.shape))
+    return correlation
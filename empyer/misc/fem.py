@@ -1,4 +1,8 @@
 import numpy as np
+import dask.array as da
+
+VERSIONS = ("omega", "rings", "annular_variance", "ring_variance")
+LEGACY_VERSIONS = {"omega": "ring_variance", "rings": "annular_variance"}  # the meanings of the keys in fem()
 
 
 def fem(r_theta_imgs, version="omega", binning=1, cut=40):
@@ -7,33 +11,329 @@ def fem(r_theta_imgs, version="omega", binning=1, cut=40):
     Parameters
     ----------
     r_theta_imgs: array_like
-        polar images
+        A (n_patterns, n_k, n_theta) stack of polar images. Masked values and NaNs are ignored.
     version: str
-        The name of the FEM equation to use
+        The name of the FEM equation to use. 'omega' is the mean of the normalized variances of every ring and
+        'rings' is the normalized variance of the annular means for every k, as they always have been here. The
+        same quantities are also called 'ring_variance' and 'annular_variance', which mean the same thing in fem,
+        FEMAccumulator and PolarSignal.fem.
     binning : int
         binning factor
     cut : int
         The cut off in pixels to not consider
+
+    Returns
+    ----------
+    int_vs_k: array-like
+        The variance for every k
+    """
+    accumulator = FEMAccumulator()
+    accumulator.add(r_theta_imgs[..., cut // binning:, :])
+    return accumulator.fem(LEGACY_VERSIONS.get(version, version))
+
+
+def annular_statistics(r_theta_imgs, mask=None):
+    """The annular mean and the normalized variance of every ring of a stack of polar images. Masked pixels and
+    NaNs are left out.
+
+    Parameters
+    ----------
+    r_theta_imgs: array_like
+        A (..., n_k, n_theta) stack of polar images. If it is a masked array and no mask is given its mask is used.
+    mask: boolean array
+        The mask of the stack.
+
+    Returns
+    ----------
+    annular_mean: array-like
+        The mean of every ring. NaN if every pixel of the ring is masked. Dim (..., n_k)
+    ring_variance: array-like
+        <I^2>/<I>^2 - 1 of every ring. NaN if every pixel of the ring is masked or the mean is 0. Dim (..., n_k)
+    """
+    if mask is None:
+        mask = np.ma.getmaskarray(r_theta_imgs)
+    image = np.asarray(np.ma.getdata(r_theta_imgs), dtype=np.float64)
+    valid = ~(np.broadcast_to(mask, image.shape) | np.isnan(image))
+    count = np.sum(valid, axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        annular_mean = np.sum(np.where(valid, image, 0), axis=-1) / count
+        # the deviations are squared (instead of taking <I^2> - <I>^2) so the variance doesn't lose precision
+        deviation = np.where(valid, image - annular_mean[..., np.newaxis], 0)
+        ring_variance = np.sum(np.square(deviation), axis=-1) / count / np.square(annular_mean)
+    return annular_mean, ring_variance
+
+
+class FEMAccumulator(object):
+    """Running moments for fluctuation electron microscopy.
+
+    Every chunk of polar patterns is reduced to the annular mean and the ring variance of each pattern, which are
+    then folded into per k counts, sums and sums of squares. So the variances are found in one pass over the polar
+    data and a chunk can be dropped as soon as it is added. The sums are taken about a fixed shift (the mean of the
+    first chunk) so the variance doesn't lose precision when the variance is much smaller than the mean.
+
+    With n_groups every pattern is given a label (a thickness bin, a cluster, a region...) and the sums of every group
+    are accumulated at once with bincount, so the variance of every group costs one pass over the data.
     """
-    imgs = r_theta_imgs
-    imgs = imgs[:, cut // binning:len(imgs), :]
-    if version is "omega":
-        I_2_avg = np.mean(np.power(imgs, 2), axis=2)
-        print(np.shape(I_2_avg))
-        I_avg_2 = np.power(np.mean(imgs, axis=2), 2)
-        print(np.shape(I_avg_2))
-        int_vs_k = np.mean(np.divide(np.subtract(I_2_avg, I_avg_2), I_avg_2), axis=0)
-        print(np.shape(int_vs_k))
+    def __init__(self, n_groups=None):
+        """
+        Parameters
+        ------------------
+        n_groups: int
+            The number of groups. Otherwise every pattern is in one group.
+        """
+        self.n_groups = n_groups
+        self.count = None
+        self.shift = None
+        self.sum = None
+        self.sum_squares = None
+        self.ring_count = None
+        self.ring_sum = None
+
+    def add(self, r_theta_imgs, mask=None, labels=None):
+        """Adds a chunk of polar patterns.
+
+        Parameters
+        ------------------
+        r_theta_imgs: array-like
+            A (..., n_k, n_theta) stack of polar images. Masked values and NaNs are ignored.
+        mask: boolean array
+            The mask of the stack. Otherwise the mask of r_theta_imgs is used.
+        labels: array-like
+            The group of every pattern (only with n_groups). Patterns with a negative label are left out.
+        """
+        self.add_statistics(*annular_statistics(r_theta_imgs, mask=mask), labels=labels)
+
+    def add_statistics(self, annular_mean, ring_variance, labels=None):
+        """Adds the per pattern statistics from annular_statistics.
+
+        Parameters
+        ------------------
+        annular_mean: array-like
+            The annular mean of every pattern. Dim (..., n_k)
+        ring_variance: array-like
+            The ring variance of every pattern. Dim (..., n_k)
+        labels: array-like
+            The group of every pattern (only with n_groups). Patterns with a negative label are left out.
+        """
+        n_k = np.shape(annular_mean)[-1]
+        annular_mean = np.reshape(annular_mean, (-1, n_k))
+        ring_variance = np.reshape(ring_variance, (-1, n_k))
+        if labels is None:
+            labels = np.zeros(len(annular_mean), dtype=int)
+        labels = np.ravel(labels).astype(int)
+        valid = ~np.isnan(annular_mean) & (labels >= 0)[:, np.newaxis]
+        ring_valid = np.isfinite(ring_variance) & (labels >= 0)[:, np.newaxis]
+        if self.shift is None:
+            shape = (1 if self.n_groups is None else self.n_groups, n_k)
+            self.count = np.zeros(shape)
+            self.sum = np.zeros(shape)
+            self.sum_squares = np.zeros(shape)
+            self.ring_count = np.zeros(shape)
+            self.ring_sum = np.zeros(shape)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                self.shift = np.nan_to_num(np.sum(np.where(valid, annular_mean, 0), axis=0) / np.sum(valid, axis=0))
+        deviation = np.where(valid, annular_mean - self.shift, 0)
+        # every (group, k) is one bin so all of the groups are summed by one bincount
+        bins = np.maximum(labels, 0)[:, np.newaxis] * n_k + np.arange(n_k)
+        for total, weights in [(self.count, valid), (self.sum, deviation), (self.sum_squares, np.square(deviation)),
+                               (self.ring_count, ring_valid),
+                               (self.ring_sum, np.where(ring_valid, ring_variance, 0))]:
+            total += np.reshape(np.bincount(np.ravel(bins), weights=np.ravel(weights), minlength=total.size),
+                                total.shape)
+
+    def annular_variance(self):
+        """The normalized variance of the annular means, <A^2>/<A>^2 - 1 for every k (and group).
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_deviation = self.sum / self.count
+            variance = self.sum_squares / self.count - np.square(mean_deviation)
+            return self._groups(variance / np.square(self.shift + mean_deviation))
+
+    def ring_variance(self):
+        """The mean of the ring variances of every pattern for every k (and group).
+        """
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return self._groups(self.ring_sum / self.ring_count)
+
+    def omega(self):
+        """<A>^2/<A^2> - 1 of the annular means A for every k (and group), which is what PolarSignal.fem has always
+        called 'omega'.
+        """
+        return _omega(self.annular_variance())
+
+    def _groups(self, result):
+        """Drops the group axis if there aren't any groups.
+        """
+        if self.n_groups is None:
+            return result[0]
+        return result
+
+    def fem(self, version="omega"):
+        """The variance for some version of FEM.
+
+        Parameters
+        ------------------
+        version: str
+            'omega' (<A>^2/<A^2> - 1 of the annular means), 'rings' or 'ring_variance' (the mean ring variance) or
+            'annular_variance' (<A^2>/<A>^2 - 1 of the annular means). The same meanings as PolarSignal.fem.
+
+        Returns
+        -----------
+        int_vs_k: array-like
+            The variance for every k
+        """
+        if version == "omega":
+            return self.omega()
+        if version in ("rings", "ring_variance"):
+            return self.ring_variance()
+        if version == "annular_variance":
+            return self.annular_variance()
+        raise ValueError("version must be in " + str(VERSIONS) + " not " + str(version))
+
+
+def weighted_fem(weights, annular_mean, ring_variance, version="omega"):
+    """The variance for some version of FEM with every pattern weighted, for each row of the weights. With weights of
+    1 this is the same as FEMAccumulator. Used for bootstrap replicates from the statistics of annular_statistics.
+
+    Parameters
+    ----------
+    weights: array-like
+        The weight of every pattern. Dim (n_replicates, n)
+    annular_mean: array-like
+        The annular mean of every pattern. Dim (n, n_k)
+    ring_variance: array-like
+        The ring variance of every pattern. Dim (n, n_k)
+    version: str
+        'omega', 'rings', 'ring_variance' or 'annular_variance', see FEMAccumulator.fem
+
+    Returns
+    ----------
+    int_vs_k: array-like
+        The variance for every k. Dim (n_replicates, n_k)
+    """
+    if version not in VERSIONS:
+        raise ValueError("version must be in " + str(VERSIONS) + " not " + str(version))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        if version in ("rings", "ring_variance"):
+            ring_valid = np.isfinite(ring_variance)
+            return np.matmul(weights, np.where(ring_valid, ring_variance, 0)) / np.matmul(weights, ring_valid)
+        valid = ~np.isnan(annular_mean)
+        shift = np.nan_to_num(np.sum(np.where(valid, annular_mean, 0), axis=0) / np.sum(valid, axis=0))
+        deviation = np.where(valid, annular_mean - shift, 0)
+        count = np.matmul(weights, valid)
+        mean_deviation = np.matmul(weights, deviation) / count
+        variance = np.matmul(weights, np.square(deviation)) / count - np.square(mean_deviation)
+        annular_variance = variance / np.square(shift + mean_deviation)
+    if version == "omega":
+        return _omega(annular_variance)
+    return annular_variance
+
+
+def _omega(annular_variance):
+    """<A>^2/<A^2> - 1 from the normalized variance <A^2>/<A>^2 - 1 of the annular means A.
+    """
+    return -annular_variance / (1 + annular_variance)  # 1/(1 + v) - 1 without the cancellation
+
+
+def variable_resolution_fem(r_theta_imgs, window_sizes=(1, 2, 4, 8), version="omega", step=None, mask=None,
+                            chunk_size=100):
+    """Variable resolution FEM, V(k, R), from one summed-area table of the polar patterns.
+
+    Summing the patterns in a w x w window of probe positions stands in for a probe w times larger. The polar
+    transform is linear, so the window sums of the polar patterns are the polar patterns of the window sums. The
+    sum over any window is four lookups in the table, so each window size only costs the reduction.
+
+    The table is built one row of probe positions at a time with a running sum, and only the rows which some window
+    still needs are kept, so the whole table never exists. The patterns are read in bands of rows: the chunks of the
+    first navigation axis of a dask array (each is computed once) or chunk_size patterns of a numpy array. The
+    table is float64 whatever the dtype of the patterns, so the window sums don't lose precision.
+
+    Parameters
+    ----------
+    r_theta_imgs: array_like
+        A (ny, nx, n_k, n_theta) or (n, n_k, n_theta) grid of polar images, numpy or dask. Masked values and NaNs are
+        ignored, a window sum is masked where any of its patterns is.
+    window_sizes: list
+        The widths of the windows in probe positions
+    version: str
+        'omega', 'rings', 'ring_variance' or 'annular_variance', see FEMAccumulator.fem
+    step: int
+        The spacing of the windows. Otherwise the windows don't overlap.
+    mask: boolean array
+        The mask of the images. Otherwise the mask of r_theta_imgs is used.
+    chunk_size: int
+        The number of window sums reduced at once
+
+    Returns
+    ----------
+    int_vs_k: array-like
+        The variance for every k at each window size. Dim (len(window_sizes), n_k)
+    """
+    if version not in VERSIONS:
+        raise ValueError("version must be in " + str(VERSIONS) + " not " + str(version))
+    if r_theta_imgs.ndim == 3:
+        r_theta_imgs = r_theta_imgs[np.newaxis]
+    if mask is not None:
+        mask = np.broadcast_to(mask, r_theta_imgs.shape[-4:])
+    ny, nx = r_theta_imgs.shape[:2]
+    if isinstance(r_theta_imgs, da.Array):
+        bands = np.cumsum((0,) + r_theta_imgs.chunks[0])
     else:
-        print(np.shape(r_theta_imgs))
-        avg2 = np.mean(np.power(np.mean(r_theta_imgs, axis=1), 2), axis=0)
-        print(np.shape(avg2))
-        avg1 = np.power(np.mean(np. mean(r_theta_imgs, axis=1), axis=0), 2)
-        print(np.shape(avg1))
-        int_vs_k = np.divide(np.subtract(avg2, avg1), avg1)
-        plt.plot(avg2)
-        plt.plot(avg1)
-        plt.show()
-        plt.plot(int_vs_k)
-        plt.show()
-    return int_vs_k
\ No newline at end of file
+        bands = np.append(np.arange(0, ny, max(chunk_size // nx, 1)), ny)
+    windows = []  # the width, the starting rows and columns and the FEMAccumulator of every window size
+    for width in window_sizes:
+        y_width, x_width = min(width, ny), min(width, nx)
+        windows.append((y_width,
+                        x_width,
+                        np.arange(0, ny - y_width + 1, step or y_width),
+                        np.arange(0, nx - x_width + 1, step or x_width),
+                        FEMAccumulator()))
+    last_use = {}  # the last table row which needs each kept row
+    for y_width, x_width, ys, xs, accumulator in windows:
+        for y in ys:
+            last_use[y] = max(last_use.get(y, 0), y + y_width)
+            last_use[y + y_width] = max(last_use.get(y + y_width, 0), y + y_width)
+    center = None
+    table = invalid_table = None
+    kept = {}
+    for first, stop in zip(bands[:-1], bands[1:]):
+        band = r_theta_imgs[first:stop]
+        if isinstance(band, da.Array):
+            band = band.compute()
+        band_invalid = np.ma.getmaskarray(band) if mask is None else mask[first:stop]
+        band = np.ma.getdata(band)
+        band_invalid = band_invalid | np.isnan(band)
+        if center is None:
+            # the table holds the deviations from the mean pattern of the first band so the differences of large sums
+            # don't lose precision
+            center = np.sum(np.where(band_invalid, 0, band), axis=(0, 1), dtype=np.float64)
+            center /= np.maximum(np.sum(~band_invalid, axis=(0, 1)), 1)
+            table = np.zeros((nx + 1, *band.shape[2:]))
+            invalid_table = np.zeros((nx + 1, *band.shape[2:]), dtype=np.int32)
+            if 0 in last_use:
+                kept[0] = table.copy(), invalid_table.copy()
+        for y, (row, row_invalid) in enumerate(zip(band, band_invalid), start=first + 1):  # y is the row of the table
+            deviation = np.subtract(row, center, dtype=np.float64)
+            deviation[row_invalid] = 0
+            table[1:] += np.cumsum(deviation, axis=0, out=deviation)
+            invalid_table[1:] += np.cumsum(row_invalid, axis=0)
+            if y in last_use:
+                kept[y] = table.copy(), invalid_table.copy()
+            for y_width, x_width, ys, xs, accumulator in windows:
+                if y - y_width not in ys:
+                    continue
+                top, invalid_top = kept[y - y_width]
+                for start in range(0, len(xs), chunk_size):
+                    columns = xs[start:start + chunk_size]
+                    window = _window_sums(table, top, columns, x_width)
+                    window += center * (y_width * x_width)
+                    accumulator.add(window, mask=_window_sums(invalid_table, invalid_top, columns, x_width) > 0)
+            kept = {row: tables for row, tables in kept.items() if last_use[row] > y}
+    return np.array([accumulator.fem(version) for y_width, x_width, ys, xs, accumulator in windows])
+
+
+def _window_sums(bottom, top, xs, x_width):
+    """The sums over the windows starting at every x from the rows of a summed-area table at the bottom and the top
+    of the windows. Dim (len(xs), ...)
+    """
+    return bottom[xs + x_width] - bottom[xs] - top[xs + x_width] + top[xs]
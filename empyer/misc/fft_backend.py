@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+import warnings
+
+import numpy as np
+from scipy import fft as scipy_fft
+
+try:
+    import pyfftw
+except ImportError:
+    pyfftw = None
+
+BACKENDS = ("numpy", "scipy", "pyfftw")
+_backend = {"name": "scipy", "workers": -1}
+_local = threading.local()  # every thread has its own pyfftw plans, the plans reuse their input and output arrays
+
+
+def set_backend(name="scipy", workers=-1):
+    """Sets the FFT backend used by angular_correlation, power_spectrum and ecm when no backend is passed.
+
+    Parameters
+    ----------
+    name: str
+        'numpy' (single threaded), 'scipy' (multi-threaded with workers) or 'pyfftw' (multi-threaded with the plans
+        cached for every shape). If pyfftw isn't installed numpy is used instead.
+    workers: int
+        The number of threads for the scipy and pyfftw backends. -1 uses all of the cores. This is only used by
+        the main thread. The FFTs of lazy signals run inside the threads of dask (which already keep every core
+        busy) and always use one thread each.
+    """
+    _backend["name"] = _check_backend(name)
+    _backend["workers"] = workers
+
+
+def get_backend():
+    """The current FFT backend and number of workers.
+
+    Returns
+    ----------
+    name: str
+        The name of the backend
+    workers: int
+        The number of threads
+    """
+    return _backend["name"], _backend["workers"]
+
+
+def rfft(a, n=None, axis=-1, backend=None):
+    """The real FFT of a along some axis with the current (or given) backend.
+
+    Parameters
+    ----------
+    a: array-like
+        The real input array. Single precision input gives a single precision output.
+    n: int
+        The length of the transform
+    axis: int
+        The axis to transform
+    backend: str
+        The backend for this call only. Otherwise the backend from set_backend is used.
+
+    Returns
+    ----------
+    a_fft: array-like
+        The non-negative frequencies of the FFT
+    """
+    a = np.asarray(a)
+    name, workers = _resolve(backend)
+    if name == "scipy":
+        return scipy_fft.rfft(a, n=n, axis=axis, workers=workers)
+    if name == "pyfftw":
+        return _pyfftw_transform("rfft", a, n=n, axis=axis, workers=workers)
+    return np.fft.rfft(a, n=n, axis=axis).astype(np.result_type(a.dtype, np.complex64), copy=False)
+
+
+def irfft(a, n=None, axis=-1, backend=None, overwrite_x=False):
+    """The inverse of rfft along some axis with the current (or given) backend.
+
+    Parameters
+    ----------
+    a: array-like
+        The non-negative frequencies of some real signal
+    n: int
+        The length of the output. Otherwise 2*(a.shape[axis]-1)
+    axis: int
+        The axis to transform
+    backend: str
+        The backend for this call only. Otherwise the backend from set_backend is used.
+    overwrite_x: bool
+        a can be destroyed (scipy only)
+
+    Returns
+    ----------
+    signal: array-like
+        The real signal
+    """
+    a = np.asarray(a)
+    name, workers = _resolve(backend)
+    if name == "scipy":
+        return scipy_fft.irfft(a, n=n, axis=axis, workers=workers, overwrite_x=overwrite_x)
+    if name == "pyfftw":
+        return _pyfftw_transform("irfft", a, n=n, axis=axis, workers=workers)
+    return np.fft.irfft(a, n=n, axis=axis).astype(np.result_type(a.real.dtype, np.float32), copy=False)
+
+
+def benchmark(shape=(200, 720), n_patterns=32, repeat=5, backends=BACKENDS, dtype=np.float64):
+    """Times the autocorrelation (an rfft and an irfft) of a stack of polar patterns with every backend.
+
+    Parameters
+    ----------
+    shape: tuple
+        The (n_k, n_theta) shape of the polar patterns
+    n_patterns: int
+        The number of patterns transformed at once
+    repeat: int
+        The best of repeat runs is kept. The first run isn't timed so the pyfftw plans are already made.
+    backends: tuple
+        The backends to time. Backends which aren't installed are skipped.
+    dtype: numpy dtype
+        The precision of the patterns
+
+    Returns
+    ----------
+    times: dict
+        The best time in seconds for each backend
+    """
+    stack = np.random.random((n_patterns, *shape)).astype(dtype)
+    times = {}
+    for name in backends:
+        if _check_backend(name, warn=False) != name:
+            continue
+        irfft(rfft(stack, backend=name), n=shape[-1], backend=name)
+        best = np.inf
+        for i in range(repeat):
+            tic = time.perf_counter()
+            irfft(rfft(stack, backend=name), n=shape[-1], backend=name)
+            best = min(best, time.perf_counter() - tic)
+        times[name] = best
+    return times
+
+
+def _check_backend(name, warn=True):
+    """The backend that is actually used for some name.
+    """
+    if name not in BACKENDS:
+        raise ValueError("The FFT backend must be in " + str(BACKENDS) + " not " + str(name))
+    if name == "pyfftw" and pyfftw is None:
+        if warn:
+            warnings.warn("pyfftw isn't installed so numpy is used for the FFTs")
+        return "numpy"
+    return name
+
+
+def _resolve(backend):
+    """The backend and workers of some call. Calls from any other thread than the main one (the dask scheduler,
+    thread pools) use one worker so the threads don't oversubscribe the cores.
+    """
+    name = _backend["name"] if backend is None else _check_backend(backend)
+    if threading.current_thread() is not threading.main_thread():
+        return name, 1
+    return name, _backend["workers"]
+
+
+def _pyfftw_transform(kind, a, n, axis, workers):
+    """Runs a cached pyfftw plan. The plans are made once for every shape so batches of the same shape only pay the
+    planning cost once. The plans are cached per thread as a plan writes into its own input and output arrays.
+    """
+    threads = workers if workers > 0 else os.cpu_count()  # pyfftw.config.NUM_THREADS is 1 unless set in the env
+    key = (kind, a.shape, a.dtype.str, n, axis, threads)
+    if not hasattr(_local, "plans"):
+        _local.plans = {}  # keyed by the kind of transform, shape, dtype, length, axis and threads
+    plans = _local.plans
+    if key not in plans:
+        plans[key] = getattr(pyfftw.builders, kind)(pyfftw.empty_aligned(a.shape, dtype=a.dtype),
+                                                    n=n,
+                                                    axis=axis,
+                                                    threads=threads,
+                                                    planner_effort="FFTW_MEASURE")
+    return plans[key](a).copy()  # the output array of the plan is reused by the next call
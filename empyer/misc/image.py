@@ -15,22 +15,23 @@ def bin_2d(image, binning_factor):
 
     Parameters
     ----------
-    image : 2-d array
+    image : array
+        A 2-d image or a (..., y, x) stack of images which are binned along the last two axes
 
     binning_factor : int
 
     Returns
     ----------
-    new_image : 2-d array
+    new_image : array
     """
     sh = np.shape(image)
 
-    dim1_cut = sh[0]%binning_factor
-    dim2_cut = sh[1]%binning_factor
-    cut_image = image[dim1_cut:, dim2_cut:]  # in case the image is not a multiple of the binning factor
+    dim1_cut = sh[-2]%binning_factor
+    dim2_cut = sh[-1]%binning_factor
+    cut_image = image[..., dim1_cut:, dim2_cut:]  # in case the image is not a multiple of the binning factor
 
-    new_image = cut_image.reshape(sh[0] // binning_factor, binning_factor, sh[1] // binning_factor, binning_factor).mean(
-        -1).mean(1)
+    new_image = cut_image.reshape(*sh[:-2], sh[-2] // binning_factor, binning_factor, sh[-1] // binning_factor,
+                                  binning_factor).mean(-1).mean(-2)
 
     return new_image
 
@@ -0,0 +1,191 @@
+import numpy as np
+from scipy.sparse import csr_matrix
+
+
+class RadialProfilePlan(object):
+    """Precomputed elliptical radial bin for every detector pixel.
+
+    Every pixel (or every sub-pixel when the pixels are split) is assigned to the ring of the ellipse it falls on, so
+    the radial profile of any pattern with the same geometry is a weighted bincount of its pixels. A block of patterns
+    is binned by one bincount, with the bins of every pattern offset so they don't overlap. Split pixels are spread
+    over several rings so the bincount is stored as a sparse (rings x pixels) matrix instead.
+    """
+    def __init__(self, image_shape, center=None, angle=None, lengths=None, radius=[0, 100], splitting=1,
+                 block_size=32):
+        """
+        Parameters
+        ------------------
+        image_shape: tuple
+            The (y, x) shape of the images to integrate
+        center: list
+            [X,Y] coordinates for the center of the image
+        angle: float
+            Angle of rotation if the sample is elliptical
+        lengths: list
+            The major and minor lengths of the ellipse
+        radius: list
+            The inner and outer indexes to define the radius by.
+        splitting: int
+            Each pixel is split into splitting x splitting sub-pixels which are binned separately.
+        block_size: int
+            The number of patterns binned by each bincount. The offset bins of a block are kept, which takes
+            block_size times the memory of the bins.
+        """
+        self.image_shape = tuple(image_shape[-2:])
+        if center is None:
+            center = np.true_divide(self.image_shape, 2)
+        self.num_bins = int(radius[1] - radius[0])
+        sub_pixels = (np.arange(splitting) + 0.5) / splitting - 0.5
+        x = np.add.outer(np.arange(self.image_shape[0]), sub_pixels)
+        y = np.add.outer(np.arange(self.image_shape[1]), sub_pixels)
+        x, y = np.meshgrid(np.ravel(x), np.ravel(y), indexing="ij")
+        r = elliptical_radius(x, y, center, lengths=lengths, angle=angle)
+        bins = np.ravel(np.round(r).astype(int) - radius[0])
+        pixels = np.ravel(np.arange(np.prod(self.image_shape)).reshape(self.image_shape).repeat(splitting, axis=0)
+                          .repeat(splitting, axis=1))
+        inside = (bins >= 0) & (bins < self.num_bins)
+        self.splitting = splitting
+        if splitting == 1:
+            self.bins = np.where(inside, bins, self.num_bins)  # pixels outside of the radius go in an extra bin
+            self.counts = np.bincount(self.bins, minlength=self.num_bins + 1)[:self.num_bins]
+            # the bins of the i-th pattern of a block are offset by i*(num_bins+1)
+            self.block_bins = np.ravel(np.add.outer(np.arange(block_size) * (self.num_bins + 1), self.bins))
+            self.block_size = block_size
+        else:
+            self.matrix = csr_matrix((np.full(np.sum(inside), 1 / splitting**2), (bins[inside], pixels[inside])),
+                                     shape=(self.num_bins, np.prod(self.image_shape)))
+            self.counts = np.ravel(self.matrix.sum(axis=1))
+
+    def apply_stack(self, imgs):
+        """Sums a stack of images into the radial bins.
+
+        Parameters
+        ------------------
+        imgs: array-like
+            A (..., image_shape) array of images
+
+        Returns
+        -----------
+        sums: array-like
+            The summed intensity in every ring. Dim (..., radius[1]-radius[0])
+        """
+        imgs = np.asarray(imgs)
+        flat = np.reshape(imgs, (-1, np.prod(self.image_shape)))
+        if self.splitting == 1:
+            sums = np.empty((len(flat), self.num_bins))
+            for start in range(0, len(flat), self.block_size):
+                block = flat[start:start + self.block_size]
+                sums[start:start + len(block)] = np.reshape(np.bincount(self.block_bins[:block.size],
+                                                                        weights=np.ravel(block),
+                                                                        minlength=len(block) * (self.num_bins + 1)),
+                                                            (len(block), self.num_bins + 1))[:, :self.num_bins]
+        else:
+            sums = self.matrix.dot(flat.T).T
+        return np.reshape(sums, (*imgs.shape[:-2], self.num_bins))
+
+
+def elliptical_radius(x, y, center, lengths=None, angle=None):
+    """The radius of the ellipse passing through each point. This is the inverse of ellipsoid_list_to_cartesian.
+
+    Parameters
+    ----------
+    x: array-like
+        positions along the first axis of the image
+    y: array-like
+        positions along the second axis of the image
+    center: array_like
+        center of the ellipsoid
+    lengths: list
+        The major and minor lengths of the ellipse
+    angle: float
+        angle of the major axis in radians
+
+    Returns
+    ----------
+    r: array-like
+        The radius for each point
+    """
+    return elliptical_coordinates(x, y, center, lengths=lengths, angle=angle)[0]
+
+
+def elliptical_coordinates(x, y, center, lengths=None, angle=None):
+    """The elliptical radius and angle of each point. This is the inverse of ellipsoid_list_to_cartesian.
+
+    Parameters
+    ----------
+    x: array-like
+        positions along the first axis of the image
+    y: array-like
+        positions along the second axis of the image
+    center: array_like
+        center of the ellipsoid
+    lengths: list
+        The major and minor lengths of the ellipse
+    angle: float
+        angle of the major axis in radians
+
+    Returns
+    ----------
+    r: array-like
+        The radius for each point
+    theta: array-like
+        The angle for each point in the range [0, 2pi)
+    """
+    if lengths is not None:
+        axes_avg = sum(lengths)/2
+        h_o = max(lengths)/axes_avg  # major
+        k_o = min(lengths)/axes_avg
+    else:
+        h_o = 1
+        k_o = 1
+    if angle is None:
+        angle = 0
+    dx = np.subtract(x, center[0])
+    dy = np.subtract(y, center[1])
+    x_circle = (dx*np.cos(angle) + dy*np.sin(angle))/h_o
+    y_circle = (dy*np.cos(angle) - dx*np.sin(angle))/k_o
+    r = np.sqrt(x_circle**2 + y_circle**2)
+    theta = np.mod(np.arctan2(x_circle, y_circle), 2*np.pi)
+    return r, theta
+
+
+def radial_profile(imgs, plan, chunk_size=1000):
+    """Finds the mean intensity in every elliptical ring for a stack of images. Masked pixels are excluded and rings
+    without any unmasked pixels are masked.
+
+    Parameters
+    ----------
+    imgs: array-like
+        A (..., y, x) array of images. Masked arrays are allowed.
+    plan: RadialProfilePlan
+        The plan for the geometry
+    chunk_size: int
+        The number of images reduced at once.
+
+    Returns
+    ----------
+    profile: masked array
+        The mean intensity versus radius. Dim (..., radius[1]-radius[0])
+    """
+    nav_shape = np.shape(imgs)[:-2]
+    flat = np.reshape(imgs, (-1, *plan.image_shape))
+    masked = isinstance(flat, np.ma.masked_array) and np.ma.is_masked(flat)
+    if masked:
+        unmasked = ~np.ma.getmaskarray(flat)
+        shared = np.all(unmasked == unmasked[0])
+        if shared:
+            counts = plan.apply_stack(unmasked[0])  # one normalization for every pattern
+    else:
+        counts = plan.counts
+    sums = np.empty((len(flat), plan.num_bins))
+    norms = np.empty((len(flat), plan.num_bins))
+    for start in range(0, len(flat), chunk_size):
+        block = np.ma.getdata(flat[start:start + chunk_size])
+        if masked:
+            block = block * unmasked[start:start + chunk_size]
+            if not shared:
+                counts = plan.apply_stack(unmasked[start:start + chunk_size])
+        sums[start:start + chunk_size] = plan.apply_stack(block)
+        norms[start:start + chunk_size] = counts
+    profile = np.ma.masked_array(np.divide(sums, np.where(norms > 0, norms, 1)), mask=norms <= 0)
+    return np.reshape(profile, (*nav_shape, plan.num_bins))
@@ -0,0 +1,275 @@
+import numpy as np
+import dask.array as da
+import h5py
+
+from empyer.misc.cartesain_to_polar import convert_stack
+from empyer.misc.angular_correlation import angular_correlation_stack, power_spectrum, PowerSpectrumAccumulator
+from empyer.signals.em_signal import _navigation_chunks
+from empyer.signals.polar_signal import PolarSignal, LazyPolarSignal, _set_order_axis
+from empyer.signals.correlation_signal import CorrelationSignal, LazyCorrelationSignal, _summed_power_signals
+from empyer.signals.power_signal import PowerSignal, LazyPowerSignal
+from empyer.signals.fourier_signal import FourierSignal, LazyFourierSignal
+
+STAGES = ("polar", "correlation", "power", "coefficients", "summed_power")
+SUFFIXES = {"polar": "_polar.hdf5", "correlation": "_angular.hdf5", "power": "_angularPower.hdf5",
+            "coefficients": "_fourier.hdf5", "summed_power": "_summedPower.hdf5",
+            "summed_power_variance": "_summedPowerVariance.hdf5"}
+SUMMED = ("summed_power",)  # stages which are folded into a running sum instead of being kept for every pattern
+
+
+def run(signal,
+        stages=("power",),
+        file_name=None,
+        chunk_size=100,
+        phase_width=720,
+        radius=[0, -1],
+        method="linear",
+        splitting=1,
+        binning_factor=1,
+        cut=0,
+        normalize=True,
+        dtype=np.float64,
+        half=False,
+        orders=[2, 4, 6, 8, 10]):
+    """Takes a diffraction signal to a power spectrum in one pass over the navigation axes.
+
+    Blocks of chunk_size patterns are converted to polar coordinates, correlated and then the power spectrum is taken
+    before the next block is read. Only the stages which are asked for are kept so the other stages never exist for
+    more than chunk_size patterns. Every dask block of a lazy signal is read once. The cut and the binning are part of
+    the polar transform so the inner rings and the full resolution polar patterns are never made.
+
+    With a file_name the files of the kept stages are made before the first block is processed and every block is
+    written to them as soon as it is made, so the memory doesn't grow with the size of the dataset. The files are
+    closed after the last block and the signals returned are then lazy and read from them, opened again read only. Without a file_name every kept stage is held in memory.
+
+    Parameters
+    ----------
+    signal: DiffractionSignal
+        The (lazy) diffraction signal. Any mask on the signal is carried through to the correlation.
+    stages: tuple
+        The stages to return. Any of 'polar', 'correlation', 'power', 'coefficients' (the complex angular Fourier
+        coefficients which come from the same FFTs as the correlation) and 'summed_power' (the power spectrum of the
+        summed correlation, accumulated chunk by chunk so the correlations don't have to be kept)
+    file_name: str
+        If given each stage is saved as file_name + '_polar.hdf5', '_angular.hdf5', '_angularPower.hdf5',
+        '_fourier.hdf5' or '_summedPower.hdf5' (and '_summedPowerVariance.hdf5'). The mask of a masked stage is saved
+        next to its data as 'mask'.
+    chunk_size: int
+        The number of patterns processed at once
+    phase_width: int
+        The number of pixels in the x direction of the polar signal
+    radius: list
+        The inner and outer radius of the polar signal in pixels or in the units of the signal axes
+    method: str
+        'linear' or 'rebin'. See DiffractionSignal.calculate_polar_spectrum
+    splitting: int
+        The sub-pixel splitting for method='rebin'
+    binning_factor: int
+        Binning factor of the polar patterns (and so of every later stage)
+    cut: int
+        The number of pixels cut off from the inner radius
+    normalize: bool
+        Normalize the correlation
+    dtype: numpy dtype
+        The working precision of every stage
+    half: bool
+        Only keep the angles 0-pi of the correlation and the non-negative orders of the power spectrum
+    orders: list
+        The orders of the 'coefficients' stage
+
+    Returns
+    ----------
+    signals: dict
+        The PolarSignal, CorrelationSignal, PowerSignal and FourierSignal for each of the stages asked for. The
+        'summed_power' stage also gives its variance as 'summed_power_variance'
+    """
+    for stage in stages:
+        if stage not in STAGES:
+            raise ValueError("stages must be in " + str(STAGES) + " not " + str(stage))
+    correlate = any(stage in ("correlation", "power", "coefficients", "summed_power") for stage in stages)
+    plan = signal.get_polar_plan(phase_width=phase_width, radius=radius, dtype=dtype, method=method,
+                                 splitting=splitting, binning_factor=binning_factor, cut=cut)
+    nav_shape = signal.data.shape[:-2]
+    n_patterns = int(np.prod(nav_shape))
+    outputs = {}
+    staged = {}
+    accumulator = PowerSpectrumAccumulator(dtype=dtype, n=plan.output_shape[1])
+    nav_chunks = signal.data.chunksize[:-2] if signal._lazy else None
+    files = {}  # the files of the streamed stages, open for writing until the last block is written
+    try:
+        for index, block in _navigation_chunks(signal.data, chunk_size):
+            results = {"polar": convert_stack(block, plan=plan)}
+            if correlate:
+                correlation = angular_correlation_stack(results["polar"],
+                                                        mask=np.ma.getmaskarray(results["polar"]),
+                                                        normalize=normalize,
+                                                        dtype=dtype,
+                                                        half=half,
+                                                        orders=orders if "coefficients" in stages else None)
+                if "coefficients" in stages:
+                    correlation, results["coefficients"] = correlation
+                results["correlation"] = correlation
+            if "power" in stages:
+                results["power"] = power_spectrum(results["correlation"], dtype=dtype, half=half,
+                                                  n=plan.output_shape[1])
+            if "summed_power" in stages:
+                accumulator.add(results["correlation"])
+            for stage in stages:
+                if stage in SUMMED:
+                    continue
+                if stage not in outputs:
+                    shape = (n_patterns, *results[stage].shape[1:])
+                    masked = isinstance(results[stage], np.ma.masked_array)
+                    if file_name is None:
+                        outputs[stage] = np.empty(shape, dtype=results[stage].dtype)
+                        if masked:
+                            outputs[stage] = np.ma.masked_array(outputs[stage], mask=False)
+                    else:
+                        staged[stage], files[stage], outputs[stage] = _create_file(file_name + SUFFIXES[stage],
+                                                                                   stage,
+                                                                                   (*nav_shape, *shape[1:]),
+                                                                                   results[stage].dtype,
+                                                                                   masked,
+                                                                                   signal,
+                                                                                   nav_chunks=nav_chunks,
+                                                                                   phase_width=phase_width,
+                                                                                   binning_factor=binning_factor,
+                                                                                   cut=cut,
+                                                                                   half=half,
+                                                                                   orders=orders)
+                if file_name is None:
+                    outputs[stage][index] = results[stage]
+                else:
+                    _write_flat(outputs[stage], index, results[stage], nav_shape)
+    finally:
+        for h5file in files.values():
+            h5file.close()
+
+    signals = {}
+    if "summed_power" in stages:
+        signals["summed_power"], signals["summed_power_variance"] = _summed_power_signals(
+            accumulator,
+            k_scale=signal.axes_manager[-1].scale*binning_factor,
+            k_units=signal.axes_manager[-1].units,
+            k_offset=signal._pixel_cut(cut)*signal.axes_manager[-1].scale,
+            half=half,
+            return_variance=True)
+    for stage in stages:
+        if stage in SUMMED:
+            continue
+        if file_name is not None:
+            # the lazy signal reads from the finished file, opened again read only
+            data, mask = _datasets(h5py.File(file_name + SUFFIXES[stage], "r"))
+            staged[stage].data = da.from_array(data, chunks=data.chunks)
+            if mask is not None:
+                staged[stage].data = da.ma.masked_array(staged[stage].data,
+                                                        mask=da.from_array(mask, chunks=mask.chunks))
+            signals[stage] = staged[stage]
+            continue
+        signals[stage] = _to_signal(stage,
+                                    np.reshape(outputs[stage], (*nav_shape, *outputs[stage].shape[1:])),
+                                    signal,
+                                    phase_width=phase_width,
+                                    binning_factor=binning_factor,
+                                    cut=cut,
+                                    half=half,
+                                    orders=orders)
+    if file_name is not None:
+        for stage in signals:
+            if stage not in outputs:  # the other stages were written while they were made
+                signals[stage].save(filename=file_name + SUFFIXES[stage], overwrite=True)
+    return signals
+
+
+def _create_file(filename, stage, shape, dtype, masked, signal, nav_chunks=None, **kwargs):
+    """Saves an empty lazy signal for some stage so the file and its axes exist before the data is made. The
+    (all zero) data compresses to almost nothing so nothing the size of the stage is ever held in memory. The file is
+    chunked like the navigation axes of the input (or one row of the navigation axes in each chunk) so every block of
+    the input is written into its own chunks of the file.
+
+    Returns
+    ----------
+    staged: LazySignal
+        The signal of the stage
+    h5file: h5py.File
+        The file, open for writing. It has to be closed once every block is written.
+    datasets: tuple
+        The h5py data set of the data and of the mask (None if the stage isn't masked)
+    """
+    if nav_chunks is None:
+        nav_chunks = (1,) * (len(shape) - 3) + (shape[-3],)
+    staged = _to_signal(stage, da.zeros(shape, dtype=dtype, chunks=nav_chunks + shape[-2:]), signal, lazy=True,
+                        **kwargs)
+    staged.save(filename=filename, overwrite=True)
+    h5file = h5py.File(filename, "r+")
+    data, mask = _datasets(h5file)
+    if masked:
+        mask = data.parent.create_dataset("mask", shape=shape, dtype=bool, chunks=data.chunks, fillvalue=False)
+    return staged, h5file, (data, mask)
+
+
+def _datasets(h5file):
+    """The h5py data set of the data and of the mask (None if there is no mask) in a file made by _create_file.
+    """
+    experiments = h5file["Experiments"]
+    group = [experiments[name] for name in experiments if "data" in experiments[name]][0]
+    return group["data"], group.get("mask")
+
+
+def _write_flat(datasets, index, values, nav_shape):
+    """Writes some patterns at their positions of the flattened navigation axes into a data set with the full
+    navigation shape. Each run of consecutive positions within one row of the navigation axes is one slice.
+    """
+    data, mask = datasets
+    row = nav_shape[-1]
+    breaks = np.flatnonzero((np.diff(index) != 1) | (index[1:] % row == 0)) + 1
+    for first, stop in zip(np.concatenate(([0], breaks)), np.concatenate((breaks, [len(index)]))):
+        position = np.unravel_index(index[first], nav_shape)
+        where = (*position[:-1], slice(position[-1], position[-1] + stop - first))
+        data[where] = np.ma.getdata(values[first:stop])
+        if mask is not None:
+            mask[where] = np.ma.getmaskarray(values[first:stop])
+
+
+def _to_signal(stage, data, signal, phase_width, binning_factor, cut, half, orders, lazy=False):
+    """Wraps the data of one stage in its signal with the same axes as the step by step methods.
+    """
+    passed_meta_data = signal.metadata.as_dictionary()
+    if signal.metadata.Signal.has_item('Ellipticity'):
+        del(passed_meta_data['Signal']['Ellipticity'])
+    k_scale = signal.axes_manager[-1].scale*binning_factor
+    offset = signal._pixel_cut(cut)*signal.axes_manager[-1].scale
+    theta_scale = 2*np.pi/phase_width*binning_factor
+    if stage == "polar":
+        staged = (LazyPolarSignal if lazy else PolarSignal)(data, metadata=passed_meta_data)
+        if not lazy:
+            staged.add_mask()
+    else:
+        if stage == "correlation":
+            staged = (LazyCorrelationSignal if lazy else CorrelationSignal)(data, metadata=passed_meta_data)
+            if half:
+                staged.metadata.set_item("Signal.Correlation.full_width", phase_width // binning_factor)
+        elif stage == "power":
+            staged = (LazyPowerSignal if lazy else PowerSignal)(data)
+        else:
+            staged = (LazyFourierSignal if lazy else FourierSignal)(data)
+    staged.axes_manager.navigation_axes = signal.axes_manager.navigation_axes
+    if stage == "coefficients":
+        _set_order_axis(staged, orders)
+    elif stage == "power":
+        staged.set_axes(-2,
+                        name="FourierCoefficient",
+                        scale=1,
+                        units="a.u.",
+                        offset=.5)
+    else:
+        staged.set_axes(-2,
+                        name="Radians",
+                        scale=theta_scale,
+                        units="rad")
+    staged.set_axes(-1,
+                    name="k",
+                    scale=k_scale,
+                    units=signal.axes_manager[-1].units,
+                    offset=offset)
+    return staged
@@ -1,6 +1,10 @@
-from empyer.signals.em_signal import EMSignal
-from empyer.signals.power_signal import PowerSignal
-from empyer.misc.angular_correlation import power_spectrum
+from functools import partial
+
+import numpy as np
+
+from empyer.signals.em_signal import EMSignal, _navigation_chunks
+from empyer.signals.power_signal import PowerSignal, LazyPowerSignal
+from empyer.misc.angular_correlation import power_spectrum, PowerSpectrumAccumulator
 from hyperspy._signals.lazy import LazySignal
 
 
@@ -40,7 +44,7 @@ class CorrelationSignal(EMSignal):
         res.__init__(**res._to_dictionary())
         return res
 
-    def get_power_spectrum(self, method="FFT"):
+    def get_power_spectrum(self, method="FFT", dtype=np.float64, half=False):
         """
         Calculate a power spectrum from the correlation signal
 
@@ -48,15 +52,27 @@ class CorrelationSignal(EMSignal):
         ----------
         method : str
             'FFT' gives fourier transformation of the angular power spectrum.  Currently the only method available
+        dtype : numpy dtype
+            The working precision. np.float32 uses single precision FFTs and halves the memory.
+        half : bool
+            Only store the non-negative Fourier orders. The power spectrum is symmetric so this halves the memory
+            without losing anything.
         """
-        power_signal = self.map(power_spectrum,
-                                method=method,
-                                inplace=False,
-                                show_progressbar=False)
+        full_width = self.metadata.get_item("Signal.Correlation.full_width", self.data.shape[-1])
+        width = full_width // 2 + 1 if half else full_width
+        transform = partial(power_spectrum, method=method, dtype=dtype, half=half, n=full_width)
+        if self._lazy:
+            data = self.data.rechunk({self.data.ndim - 1: -1})
+            power_signal = data.map_blocks(transform, dtype=dtype, chunks=(*data.chunks[:-1], (width,)))
+        else:
+            power_signal = transform(self.data)  # all of the patterns at once
         passed_meta_data = self.metadata.as_dictionary()
         if self.metadata.has_item('Masks'):
             del (passed_meta_data['Masks'])
-        power = PowerSignal(power_signal)
+        if self._lazy:
+            power = LazyPowerSignal(power_signal)
+        else:
+            power = PowerSignal(power_signal)
         power.axes_manager.navigation_axes = self.axes_manager.navigation_axes
 
         power.set_axes(-2,
@@ -71,12 +87,66 @@ class CorrelationSignal(EMSignal):
                        offset=self.axes_manager[-1].offset)
         return power
 
-    def get_summed_power_spectrum(self):
+    def get_summed_power_spectrum(self, dtype=np.float64, half=False, chunk_size=100, return_variance=False):
         """Returns the power spectrum from the summed correlation signal.
+
+        The correlations are added to a PowerSpectrumAccumulator chunk_size patterns at a time, so lazy signals are
+        only read one chunk at a time and the summed correlation is never made.
+
+        Parameters
+        ----------
+        dtype : numpy dtype
+            The working precision.
+        half : bool
+            Only return the non-negative Fourier orders.
+        chunk_size : int
+            The number of patterns added at once
+        return_variance : bool
+            Also return the variance of the summed power spectrum (for error bars)
+        Returns
+        ----------
+        power : PowerSignal
+            The power spectrum of the summed correlation
+        variance : PowerSignal
+            Only if return_variance
         """
         # TODO: Add in the ability to get the summed power spectrum over an axis.
-        summed_pow = self.sum(axis=(0, 1))
-        return summed_pow.get_power_spectrum()
+        accumulator = PowerSpectrumAccumulator(dtype=dtype,
+                                               n=self.metadata.get_item("Signal.Correlation.full_width",
+                                                                        self.data.shape[-1]))
+        for index, block in _navigation_chunks(self.data, chunk_size):
+            accumulator.add(block)
+        return _summed_power_signals(accumulator,
+                                     k_scale=self.axes_manager[-1].scale,
+                                     k_units=self.axes_manager[-1].units,
+                                     k_offset=self.axes_manager[-1].offset,
+                                     half=half,
+                                     return_variance=return_variance)
+
+
+def _summed_power_signals(accumulator, k_scale=1, k_units=None, k_offset=0, half=False, return_variance=False):
+    """The PowerSignal (and variance) of a PowerSpectrumAccumulator with the k axis of the correlations.
+    """
+    spectra = [accumulator.power_spectrum(half=half)]
+    if return_variance:
+        spectra.append(accumulator.variance(half=half))
+    signals = []
+    for spectrum in spectra:
+        power = PowerSignal(spectrum)
+        power.set_axes(-2,
+                       name="FourierCoefficient",
+                       scale=1,
+                       units="a.u.",
+                       offset=.5)
+        power.set_axes(-1,
+                       name="k",
+                       scale=k_scale,
+                       units=k_units,
+                       offset=k_offset)
+        signals.append(power)
+    if return_variance:
+        return tuple(signals)
+    return signals[0]
 
 
 class LazyCorrelationSignal(LazySignal,CorrelationSignal):
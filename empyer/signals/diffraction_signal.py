@@ -1,10 +1,16 @@
 import numpy as np
+import dask.array as da
+from concurrent.futures import ThreadPoolExecutor
 
 from empyer.misc.ellipse_analysis import solve_ellipse
-from empyer.misc.cartesain_to_polar import convert
+from empyer.misc.radial_profile import RadialProfilePlan, radial_profile
+from empyer.misc.ecm import ecm_stack
+from empyer.misc.cartesain_to_polar import convert, convert_stack, convert_mask, convert_processes, PolarTransformPlan
+from empyer.misc.fem import variable_resolution_fem
 from empyer.signals.em_signal import EMSignal
-from empyer.signals.polar_signal import PolarSignal
+from empyer.signals.polar_signal import PolarSignal, LazyPolarSignal, _window_signal
 from hyperspy._signals.lazy import LazySignal
+from hyperspy._signals.signal1d import Signal1D, LazySignal1D
 
 
 class DiffractionSignal(EMSignal):
@@ -122,7 +128,14 @@ class DiffractionSignal(EMSignal):
                                  parallel=False,
                                  inplace=False,
                                  segments=None,
-                                 num_points=500):
+                                 num_points=500,
+                                 engine="map",
+                                 dtype=np.float64,
+                                 workers=None,
+                                 method="linear",
+                                 splitting=1,
+                                 binning_factor=1,
+                                 cut=0):
         """Take the Diffraction Pattern and unwrap the diffraction pattern.
 
         Parameters
@@ -136,6 +149,35 @@ class DiffractionSignal(EMSignal):
             more for large pixel size)
         inplace: boolean
             replaces diffraction pattern data with polar equivalent
+        segments: int
+            Fit the ellipse separately for segments x segments regions of the navigation axes. Every segment is
+            converted as one block with its own plan (parallel converts the segments in separate threads)
+        num_points: int
+            number of points to define each segmented ellipse by
+        engine: str
+            'map' converts each pattern separately. 'sparse' multiplies blocks of flattened patterns against one
+            sparse interpolation matrix (inplace and parallel are ignored). 'processes' splits the patterns into
+            blocks converted by a pool of processes writing into shared memory. The patterns per second of each
+            worker are stored in metadata.Signal.conversion_throughput. Lazy signals are always converted chunk by
+            chunk with the sparse matrix and return a LazyPolarSignal.
+        dtype: numpy dtype
+            The working precision of the polar signal. np.float32 halves the memory of the polar signal.
+        workers: int
+            The number of processes used by the 'processes' engine. Defaults to the number of cpus
+        method: str
+            'linear' bi-linearly interpolates each polar pixel. 'rebin' accumulates every detector pixel into the
+            polar bin it falls in and takes the mean, which conserves the intensity at low k where the polar grid
+            over-samples the detector and at high k where it under-samples it. Masked pixels are left out of the
+            mean and bins without any unmasked pixels are masked.
+        splitting: int
+            For method='rebin' each pixel is split into splitting x splitting sub-pixels. Larger splittings fill
+            the bins at low k.
+        binning_factor: int
+            Bin the polar signal (like bin_2d) as part of the transform so the full resolution is never made. The
+            same as PolarSignal.autocorrelation(binning_factor) but cheaper.
+        cut: int or float
+            The number of pixels or distance cut off from the inner radius before the transform. The same as
+            PolarSignal.autocorrelation(cut) but the inner rings are never made.
 
         Returns
         -------
@@ -143,33 +185,43 @@ class DiffractionSignal(EMSignal):
             Polar signal returned
         """
 
-        if not self.metadata.Signal.Ellipticity.calibrated:
-            self.determine_ellipse()
-        rag = None
-        if self._lazy:
-            rag = False
-        if isinstance(radius[0], float)or isinstance(radius[1], float):
-            radius[0] = self.axes_manager.signal_axes[-1].value2index(radius[0])
-            radius[1] = self.axes_manager.signal_axes[-1].value2index(radius[1])
-        if radius[1] == -1:
-            radius[1] = int(min(np.subtract(self.axes_manager.signal_shape, self.metadata.Signal.Ellipticity.center))-1)
-
+        throughput = None
         if segments is None:
-            polar_signal = self.map(convert,
-                                    center=self.metadata.Signal.Ellipticity.center,
-                                    angle=self.metadata.Signal.Ellipticity.angle,
-                                    lengths=self.metadata.Signal.Ellipticity.lengths,
-                                    phase_width=phase_width,
-                                    radius=radius,
-                                    parallel=parallel,
-                                    inplace=inplace,
-                                    show_progressbar=False)
+            plan = self.get_polar_plan(phase_width=phase_width,
+                                       radius=radius,
+                                       dtype=dtype,
+                                       method=method,
+                                       splitting=splitting,
+                                       binning_factor=binning_factor,
+                                       cut=cut)
+            if self._lazy:
+                polar_signal = self._lazy_convert(plan)
+            elif engine == "sparse":
+                polar_signal = convert_stack(self.data, plan=plan)
+            elif engine == "processes":
+                polar_signal, throughput = convert_processes(self.data, plan=plan, workers=workers)
+            elif engine == "map":
+                polar_mask = None
+                if isinstance(self.data, np.ma.masked_array):
+                    polar_mask = convert_mask(np.ma.getmaskarray(self.data), plan=plan)
+                polar_signal = self.map(convert,
+                                        plan=plan,
+                                        transform_mask=False,
+                                        parallel=parallel,
+                                        inplace=inplace,
+                                        show_progressbar=False)
+                if inplace:
+                    polar_signal = self
+                if polar_mask is None and plan.empty.any():
+                    polar_mask = np.broadcast_to(plan.empty, polar_signal.data.shape).copy()
+                polar_signal = np.ma.masked_array(polar_signal.data, mask=polar_mask)
+            else:
+                raise ValueError("engine must be one of 'map', 'sparse' or 'processes' not " + str(engine))
         else:
+            radius = self._pixel_radius(radius, cut=cut)
             len_of_segments = np.array(self.axes_manager.navigation_shape) // segments
             extra_len = np.array(self.axes_manager.navigation_shape) % segments
-            centers = np.zeros(shape=(*self.axes_manager.navigation_shape, 2))
-            lengths = np.zeros(shape=(*self.axes_manager.navigation_shape, 2))
-            angle = np.zeros(shape=self.axes_manager.navigation_shape)
+            segment_plans = []
             for i in range(segments):
                 for j in range(segments):
                     extra = [extra_len[0] * (i == segments-1), extra_len[1] * (j == segments-1)]
@@ -177,39 +229,326 @@ class DiffractionSignal(EMSignal):
                     sp1 = int((i+1)*len_of_segments[0]+extra[0])
                     s2 = int(j*len_of_segments[1])
                     sp2 = int((j+1)*len_of_segments[1]+extra[1])
-                    centers[s1:sp1, s2:sp2, :], lengths[s1:sp1, s2:sp2, :], angle[s1:sp1, s2:sp2] = solve_ellipse(self.inav[s1:sp1, s2:sp2].sum().data,num_points=num_points)
-
-            ellip = (('center', np.reshape(centers, (-1, 2))),
-                     ('lengths', np.reshape(lengths, (-1, 2))),
-                     ('angle', np.reshape(angle, -1)))
-            polar_signal = self._map_iterate(convert,
-                                             iterating_kwargs=ellip,
-                                             parallel=parallel,
-                                             inplace=inplace,
-                                             show_progressbar=False,
-                                             radius=radius,
-                                             phase_width=phase_width)
-            print("done")
-
+                    center, lengths, angle = solve_ellipse(self.inav[s1:sp1, s2:sp2].sum().data,
+                                                           num_points=num_points)
+                    plan = PolarTransformPlan(self.data.shape[-2:],
+                                              center=center,
+                                              angle=angle,
+                                              lengths=lengths,
+                                              phase_width=phase_width,
+                                              radius=radius,
+                                              dtype=dtype,
+                                              method=method,
+                                              splitting=splitting,
+                                              binning=binning_factor)
+                    # inav is (x, y) while the data is (y, x)
+                    segment_plans.append(((slice(s2, sp2), slice(s1, sp1)), plan))
+            polar_signal = self._convert_segments(segment_plans, parallel=parallel)
 
         passed_meta_data = self.metadata.as_dictionary()
         if self.metadata.Signal.has_item('Ellipticity'):
             del(passed_meta_data['Signal']['Ellipticity'])
 
-        polar = PolarSignal(polar_signal, metadata=passed_meta_data)
-        polar.mask_below(value=-9)
+        if self._lazy:
+            polar = LazyPolarSignal(polar_signal, metadata=passed_meta_data)
+        else:
+            polar = PolarSignal(polar_signal, metadata=passed_meta_data)
+        polar.add_mask()
+        if throughput is not None:
+            polar.metadata.set_item("Signal.conversion_throughput", list(throughput.values()))
 
         polar.axes_manager.navigation_axes = self.axes_manager.navigation_axes
         polar.set_axes(-2,
                        name="Radians",
-                       scale=2*np.pi/phase_width,
+                       scale=2*np.pi/phase_width*binning_factor,
                        units="rad")
         polar.set_axes(-1,
                        name="k",
-                       scale=self.axes_manager[-1].scale,
-                       units=self.axes_manager[-1].units)
+                       scale=self.axes_manager[-1].scale*binning_factor,
+                       units=self.axes_manager[-1].units,
+                       offset=self._pixel_cut(cut)*self.axes_manager[-1].scale)
         return polar
 
+    def variable_resolution_fem(self, window_sizes=[1, 2, 4, 8], version="omega", step=None, phase_width=720,
+                                radius=[0, -1], dtype=np.float64, method="linear", splitting=1, binning_factor=1,
+                                cut=0, chunk_size=100):
+        """Variable resolution FEM, the variance versus k for a number of effective probe sizes.
+
+        Every pattern is converted to polar coordinates once with a single plan. The polar transform is linear, so the
+        window sums of the polar patterns are the polar patterns of the summed diffraction patterns, and every window
+        size is then found from one summed-area table instead of rebinning and converting the signal again. The
+        patterns are converted a band of rows of the navigation axes at a time as the table is built (about
+        chunk_size patterns for an in memory signal, one chunk of the first navigation axis for a lazy one), so the
+        polar signal is never held in memory as a whole.
+
+        Parameters
+        ----------
+        window_sizes : list
+            The widths of the windows in probe positions
+        version : str
+            The name of the FEM equation to use. 'omega', 'rings', 'annular_variance' or 'ring_variance', see
+            PolarSignal.fem.
+        step : int
+            The spacing of the windows in probe positions. Otherwise the windows don't overlap.
+        phase_width: int
+            The number of pixels in the x direction of the polar signal
+        radius: list
+            The inner and outer radius in pixels or in the units of the signal axes
+        dtype: numpy dtype
+            The working precision of the polar patterns. The summed-area table is always float64.
+        method: str
+            'linear' or 'rebin'. See calculate_polar_spectrum
+        splitting: int
+            The sub-pixel splitting for method='rebin'
+        binning_factor: int
+            The polar grid is binned by this factor
+        cut: int or float
+            The number of pixels or distance cut off from the inner radius
+        chunk_size : int
+            The number of window sums reduced at once
+
+        Returns
+        -------
+        int_vs_k : Signal1D
+            The variance versus k with the window sizes as the navigation axis
+        """
+        plan = self.get_polar_plan(phase_width=phase_width,
+                                   radius=radius,
+                                   dtype=dtype,
+                                   method=method,
+                                   splitting=splitting,
+                                   binning_factor=binning_factor,
+                                   cut=cut)
+        data = self.data
+        if not self._lazy:
+            rows = max(chunk_size // data.shape[-3], 1) if data.ndim > 3 else data.shape[0]
+            data = da.from_array(data, chunks=(rows, *data.shape[1:]), asarray=False)
+        int_vs_k = variable_resolution_fem(self._lazy_convert(plan, data=data),
+                                           window_sizes=window_sizes,
+                                           version=version,
+                                           step=step,
+                                           chunk_size=chunk_size)
+        return _window_signal(int_vs_k,
+                              window_sizes,
+                              self.axes_manager.navigation_axes[0],
+                              k_scale=self.axes_manager[-1].scale*binning_factor,
+                              k_units=self.axes_manager[-1].units,
+                              k_offset=self._pixel_cut(cut)*self.axes_manager[-1].scale)
+
+    def get_polar_plan(self, phase_width=720, radius=[0, -1], dtype=np.float64, method="linear", splitting=1,
+                       binning_factor=1, cut=0):
+        """Builds the polar transform for the calibrated ellipse. The ellipse is determined first if the signal isn't
+        calibrated.
+
+        Parameters
+        -------
+        phase_width: int
+            The number of pixels in the x direction
+        radius: list
+            The inner and outer radius in pixels or in the units of the signal axes. -1 is the largest full ring.
+        dtype: numpy dtype
+            The working precision of the polar signal.
+        method: str
+            'linear' or 'rebin'. See calculate_polar_spectrum
+        splitting: int
+            The sub-pixel splitting for method='rebin'
+        binning_factor: int
+            The polar grid is binned by this factor
+        cut: int or float
+            The number of pixels or distance cut off from the inner radius
+
+        Returns
+        -------
+        plan: PolarTransformPlan
+            The plan which converts a pattern of this signal to polar coordinates
+        """
+        if not self.metadata.Signal.Ellipticity.calibrated:
+            self.determine_ellipse()
+        return PolarTransformPlan(self.data.shape[-2:],
+                                  center=self.metadata.Signal.Ellipticity.center,
+                                  angle=self.metadata.Signal.Ellipticity.angle,
+                                  lengths=self.metadata.Signal.Ellipticity.lengths,
+                                  phase_width=phase_width,
+                                  radius=self._pixel_radius(radius, cut=cut),
+                                  dtype=dtype,
+                                  method=method,
+                                  splitting=splitting,
+                                  binning=binning_factor)
+
+    def _pixel_radius(self, radius, cut=0):
+        """The inner and outer radius in pixels. The cut is added to the inner radius.
+        """
+        if not self.metadata.Signal.Ellipticity.calibrated:
+            self.determine_ellipse()
+        radius = list(radius)
+        if isinstance(radius[0], float)or isinstance(radius[1], float):
+            radius[0] = self.axes_manager.signal_axes[-1].value2index(radius[0])
+            radius[1] = self.axes_manager.signal_axes[-1].value2index(radius[1])
+        if radius[1] == -1:
+            radius[1] = int(min(np.subtract(self.axes_manager.signal_shape, self.metadata.Signal.Ellipticity.center))-1)
+        radius[0] += self._pixel_cut(cut)
+        return radius
+
+    def _pixel_cut(self, cut):
+        """The cut in pixels. Floats are a distance in the units of the signal axes.
+        """
+        if isinstance(cut, float):
+            return int(round(cut / self.axes_manager[-1].scale))
+        return cut
+
+    def get_radial_profile(self, radius=[0, -1], splitting=1):
+        """Find the mean intensity in every elliptical ring of each diffraction pattern without unwrapping the
+        patterns. The calibrated ellipse is used to find the ring of every detector pixel once and then each pattern
+        is reduced with a bincount. Masked pixels are excluded.
+
+        Parameters
+        -------
+        radius: list
+            The inner and outer radius in pixels or in the units of the signal axes
+        splitting: int
+            Split every pixel into splitting x splitting sub-pixels (slower but smoother at small k)
+
+        Returns
+        -------
+        profile: Signal1D
+            The intensity versus k for every diffraction pattern
+        """
+        radius = self._pixel_radius(radius)
+        plan = RadialProfilePlan(self.data.shape[-2:],
+                                 center=self.metadata.Signal.Ellipticity.center,
+                                 angle=self.metadata.Signal.Ellipticity.angle,
+                                 lengths=self.metadata.Signal.Ellipticity.lengths,
+                                 radius=radius,
+                                 splitting=splitting)
+        if self._lazy:
+            data = self.data.rechunk({self.data.ndim - 2: -1, self.data.ndim - 1: -1})
+            profile = LazySignal1D(data.map_blocks(radial_profile,
+                                                   plan=plan,
+                                                   drop_axis=data.ndim - 1,
+                                                   chunks=(*data.chunks[:-2], (plan.num_bins,)),
+                                                   dtype=float,
+                                                   meta=np.ma.masked_array(np.empty((0,) * (data.ndim - 1)))))
+        else:
+            profile = Signal1D(radial_profile(self.data, plan=plan))
+        profile.axes_manager.navigation_axes = self.axes_manager.navigation_axes
+        profile.axes_manager[-1].name = "k"
+        profile.axes_manager[-1].scale = self.axes_manager[-1].scale
+        profile.axes_manager[-1].units = self.axes_manager[-1].units
+        profile.axes_manager[-1].offset = radius[0] * self.axes_manager[-1].scale
+        return profile
+
+    def get_ecm(self, time_axis=None, ring_average=False, radius=[0, -1], splitting=1, chunk_size=4096):
+        """Electron correlation microscopy. The normalized time autocorrelation g2(tau) of every detector pixel at
+        every position, found with FFTs along the time axis for all of the pixels at once.
+
+        Parameters
+        -------
+        time_axis: int or str
+            The navigation axis which is time (index or name). Otherwise the last navigation axis.
+        ring_average: bool
+            Average g2 over every elliptical ring of the detector (see get_radial_profile)
+        radius: list
+            The inner and outer radius of the rings in pixels or in the units of the signal axes
+        splitting: int
+            Split every pixel into splitting x splitting sub-pixels for the ring average
+        chunk_size: int
+            The number of pixels correlated at once. Lazy signals are correlated one chunk at a time with the whole
+            time axis in every chunk.
+
+        Returns
+        -------
+        correlation: DiffractionSignal or Signal1D
+            g2 with the time axis replaced by tau. If ring_average the g2 versus k for every tau.
+        """
+        if time_axis is None:
+            time_axis = self.axes_manager.navigation_axes[-1]
+        else:
+            time_axis = self.axes_manager[time_axis]
+        axis = time_axis.index_in_array
+        if ring_average:
+            radius = self._pixel_radius(radius)  # the ellipse is found from the patterns not from g2
+        if self._lazy:
+            data = self.data.rechunk({axis: -1})
+            meta = np.empty((0,) * data.ndim)
+            if isinstance(data._meta, np.ma.masked_array):
+                meta = np.ma.masked_array(meta)
+            correlation = data.map_blocks(ecm_stack, axis=axis, chunk_size=chunk_size, dtype=float, meta=meta)
+        else:
+            correlation = ecm_stack(self.data, axis=axis, chunk_size=chunk_size)
+        correlation = self._deepcopy_with_new_data(correlation)
+        correlation.metadata.set_item("Signal.Ellipticity", self.metadata.Signal.Ellipticity.as_dictionary())
+        tau_axis = correlation.axes_manager[time_axis.index_in_axes_manager]
+        tau_axis.name = "tau"
+        tau_axis.offset = 0
+        if ring_average:
+            return correlation.get_radial_profile(radius=radius, splitting=splitting)
+        return correlation
+
+    def _lazy_convert(self, plan, data=None):
+        """Maps the polar transform over the navigation chunks of the dask array without computing it.
+
+        Parameters
+        -------
+        plan: PolarTransformPlan
+            The plan used for every chunk
+        data: dask array
+            The data to convert. Defaults to all of the data in the signal
+
+        Returns
+        -------
+        polar_data: dask array
+            The lazy polar data. Dim (..., radius[1]-radius[0], phase_width)
+        """
+        if data is None:
+            data = self.data
+        data = data.rechunk({data.ndim - 2: -1, data.ndim - 1: -1})  # full signal in each chunk
+        meta = data._meta
+        if plan.empty.any():
+            meta = np.ma.masked_array(meta)  # empty bins are masked
+        return data.map_blocks(convert_stack,
+                               plan=plan,
+                               chunks=(*data.chunks[:-2], (plan.output_shape[0],), (plan.output_shape[1],)),
+                               dtype=plan.dtype,
+                               meta=meta)
+
+    def _convert_segments(self, segment_plans, parallel=False):
+        """Converts each block of patterns with the plan for its segment.
+
+        Parameters
+        -------
+        segment_plans: list
+            (navigation slices, PolarTransformPlan) for every segment
+        parallel: bool
+            Convert the segments in separate threads
+
+        Returns
+        -------
+        polar_data: array-like
+            The polar data for all of the segments. Dim (..., radius[1]-radius[0], phase_width)
+        """
+        output_shape = segment_plans[0][1].output_shape
+        if self._lazy:
+            blocks = {(sl[0].start, sl[1].start): self._lazy_convert(plan, self.data[sl]) for sl, plan in segment_plans}
+            rows = sorted(set(key[0] for key in blocks))
+            columns = sorted(set(key[1] for key in blocks))
+            return da.concatenate([da.concatenate([blocks[(r, c)] for c in columns], axis=1) for r in rows], axis=0)
+
+        polar_data = np.ma.masked_array(np.empty((*self.data.shape[:-2], *output_shape),
+                                                 dtype=segment_plans[0][1].dtype),
+                                        mask=False)
+
+        def convert_segment(segment):
+            sl, plan = segment
+            polar_data[sl] = convert_stack(self.data[sl], plan=plan)
+
+        if parallel:
+            with ThreadPoolExecutor() as executor:
+                list(executor.map(convert_segment, segment_plans))
+        else:
+            for segment in segment_plans:
+                convert_segment(segment)
+        return polar_data
+
 
 class LazyDiffractionSignal(LazySignal, DiffractionSignal):
 
@@ -1,4 +1,5 @@
 import numpy as np
+import dask.array as da
 
 from hyperspy.signals import Signal2D
 from hyperspy.misc.slicing import SpecialSlicers
@@ -137,7 +138,10 @@ class EMSignal(Signal2D):
             Unmask any pixel with a value below value
         """
         self.add_mask()
-        self.data.mask[self.data < value] = not unmask
+        if self._lazy:
+            self._set_lazy_mask(self.data < value, not unmask)
+        else:
+            self.data.mask[self.data < value] = not unmask
 
     def mask_above(self, value, unmask=False):
         """Applies a mask to every pixel with a value below some value
@@ -150,7 +154,10 @@ class EMSignal(Signal2D):
             Unmask any pixel with a value above value
         """
         self.add_mask()
-        self.data.mask[self.data > value] = not unmask
+        if self._lazy:
+            self._set_lazy_mask(self.data > value, not unmask)
+        else:
+            self.data.mask[self.data > value] = not unmask
 
     def mask_where(self, condition):
         """Mask at some condition
@@ -162,23 +169,57 @@ class EMSignal(Signal2D):
 
         """
         self.add_mask()
-        self.data.mask[condition] = True
+        if self._lazy:
+            self._set_lazy_mask(condition, True)
+        else:
+            self.data.mask[condition] = True
         return
 
     def mask_border(self, pixels=1):
         self.add_mask()
         if not isinstance(pixels, int):
             pixels = (self.axes_manager.signal_axes[0].value2index(pixels))
-        self.data.mask[..., -pixels:] = True
-        self.data.mask[..., : pixels] = True
-        self.data.mask[..., : pixels, :] = True
-        self.data.mask[..., -pixels:, :] = True
+        border = np.zeros(self.data.shape[-2:], dtype=bool)
+        border[..., -pixels:] = True
+        border[..., : pixels] = True
+        border[..., : pixels, :] = True
+        border[..., -pixels:, :] = True
+        if self._lazy:
+            self._set_lazy_mask(border, True)
+        else:
+            self.data.mask[..., border] = True
 
     def add_mask(self):
-        if not isinstance(self.data, np.ma.masked_array):
+        if self._lazy:
+            if not isinstance(self.data._meta, np.ma.masked_array):
+                # lazy mask so that the data is never loaded into memory
+                self.data = da.ma.masked_array(self.data,
+                                               mask=da.zeros(self.data.shape, chunks=self.data.chunks, dtype=bool))
+        elif not isinstance(self.data, np.ma.masked_array):
             self.data = np.ma.asarray(self.data)
             self.data.mask = False  # setting all values to unmasked
 
+    def _set_lazy_mask(self, condition, value):
+        """Sets the mask of a lazy signal to value wherever condition is True without computing the data.
+        """
+        mask = da.where(condition, value, da.ma.getmaskarray(self.data))
+        self.data = da.ma.masked_array(da.ma.getdata(self.data), mask=mask)
+
+    def _region(self, slices, condition=True):
+        """A lazy boolean array with the shape of the data which is condition inside of the slices and False outside.
+        """
+        region = da.zeros(self.data.shape, chunks=self.data.chunks, dtype=bool)
+        region[slices] = condition
+        return region
+
+    def _order_index(self, symmetry):
+        """The index of some Fourier order along the FourierCoefficient axis. Signals with only some orders list them
+        in metadata.Signal.orders, otherwise the index is the order.
+        """
+        if self.metadata.has_item("Signal.orders"):
+            return list(self.metadata.Signal.orders).index(symmetry)
+        return symmetry
+
     def reset_mask(self):
         if isinstance(self.data, np.ma.masked_array):
             self.data.mask = False  # setting all values to unmasked
@@ -207,7 +248,12 @@ class EMSignal(Signal2D):
         r = np.sqrt(x_ind ** 2 + y_ind ** 2)
         inside = r < radius
         x_ind, y_ind = x_ind[inside]+int(center[0]), y_ind[inside]+int(center[1])
-        self.data.mask[..., x_ind, y_ind] = True
+        if self._lazy:
+            circle = np.zeros(self.data.shape[-2:], dtype=bool)
+            circle[x_ind, y_ind] = True
+            self._set_lazy_mask(circle, True)
+        else:
+            self.data.mask[..., x_ind, y_ind] = True
         return
 
     def get_signal_axes_values(self):
@@ -245,11 +291,15 @@ class MaskSlicer(SpecialSlicers):
             self.obj.signal.add_mask()
             array_slices = tuple([slice1 if not (slice1 == slice(None, None, None)) else slice2 for
                                   slice1, slice2 in zip(self.obj.slice, array_slices)])
-            self.obj.signal.data.mask[array_slices] = value
+            signal = self.obj.signal
         else:
             array_slices = self.obj._get_array_slices(key, self.isNavigation)
-            self.obj.add_mask()
-            self.obj.data.mask[array_slices] = value
+            signal = self.obj
+            signal.add_mask()
+        if signal._lazy:
+            signal._set_lazy_mask(signal._region(array_slices), value)
+        else:
+            signal.data.mask[array_slices] = value
 
     def __getitem__(self, key, out=None):
         if isinstance(self.obj, MaskPasser):
@@ -282,7 +332,10 @@ class MaskPasser():
             Mask any values in the slice below the maximum value
         """
         self.signal.add_mask()
-        self.signal.data.mask[self.slice][(self.signal.data[self.slice] < maximum)] = True
+        if self.signal._lazy:
+            self.signal._set_lazy_mask(self.signal._region(self.slice) & (self.signal.data < maximum), True)
+        else:
+            self.signal.data.mask[self.slice][(self.signal.data[self.slice] < maximum)] = True
         return
 
     def mask_above(self, minimum):
@@ -294,7 +347,10 @@ class MaskPasser():
             Mask any values in the slice above the minimum value
         """
         self.signal.add_mask()
-        self.signal.data.mask[self.slice][(self.signal.data[self.slice] > minimum)] = True
+        if self.signal._lazy:
+            self.signal._set_lazy_mask(self.signal._region(self.slice) & (self.signal.data > minimum), True)
+        else:
+            self.signal.data.mask[self.slice][(self.signal.data[self.slice] > minimum)] = True
         return
 
     def mask_where(self, condition):
@@ -307,7 +363,10 @@ class MaskPasser():
 
         """
         self.signal.add_mask()
-        self.signal.data.mask[self.slice][condition] = True
+        if self.signal._lazy:
+            self.signal._set_lazy_mask(self.signal._region(self.slice, condition), True)
+        else:
+            self.signal.data.mask[self.slice][condition] = True
         return
 
     def mask_circle(self, center, radius, unmask=False):
@@ -333,10 +392,68 @@ class MaskPasser():
         r = np.sqrt(x_ind ** 2 + y_ind ** 2)
         inside = r < radius
         x_ind, y_ind = x_ind[inside]+int(center[0]), y_ind[inside]+int(center[1])
-        self.signal.data.mask[self.slice][..., x_ind, y_ind] = not unmask
+        if self.signal._lazy:
+            circle = np.zeros(self.signal.data.shape[-2:], dtype=bool)
+            circle[x_ind, y_ind] = True
+            self.signal._set_lazy_mask(self.signal._region(self.slice) & circle, not unmask)
+        else:
+            self.signal.data.mask[self.slice][..., x_ind, y_ind] = not unmask
         return
 
 
+def _navigation_chunks(data, chunk_size, positions=None):
+    """Yields the patterns in chunks of at most chunk_size, one block of the data at a time.
+
+    The blocks of lazy data are read as they are chunked (any chunking of the navigation axes works) so at most one
+    block of the data is held in memory. Each block is computed once and then split into chunks, so no block of the
+    data is read twice. The chunks come in the order of the blocks, so every chunk comes with the positions of its
+    patterns in the flattened navigation axes.
+
+    Parameters
+    ----------
+    data: array-like
+        A (..., y, x) numpy or dask array
+    chunk_size: int
+        The largest number of patterns in a chunk
+    positions: array-like
+        Only the patterns at these positions of the flattened navigation axes. Blocks without any of them are never
+        read.
+
+    Yields
+    ----------
+    index: array-like
+        The positions of the patterns of the chunk in the flattened navigation axes
+    chunk: array-like
+        The patterns of the chunk
+    """
+    nav_shape = data.shape[:-2]
+    if isinstance(data, da.Array):
+        blocks = []
+        for block_index in np.ndindex(*data.numblocks[:-2]):
+            offsets = [sum(chunks[:i]) for chunks, i in zip(data.chunks, block_index)]
+            ranges = [np.arange(offset, offset + chunks[i])
+                      for offset, chunks, i in zip(offsets, data.chunks, block_index)]
+            index = np.ravel(np.ravel_multi_index(np.meshgrid(*ranges, indexing="ij"), nav_shape))
+            blocks.append((index, data.blocks[(*block_index, slice(None), slice(None))]))
+    else:
+        blocks = [(np.arange(int(np.prod(nav_shape))), data)]
+    for index, block in blocks:
+        inside = None
+        if positions is not None:
+            inside = np.flatnonzero(np.isin(index, positions))
+            if len(inside) == 0:
+                continue
+            index = index[inside]
+        if isinstance(block, da.Array):
+            block = block.compute()
+        block = block.reshape((-1, *block.shape[-2:]))
+        for start in range(0, len(index), chunk_size):
+            if inside is None:
+                yield index[start:start + chunk_size], block[start:start + chunk_size]
+            else:
+                yield index[start:start + chunk_size], block[inside[start:start + chunk_size]]
+
+
 class LazyEMSignal(LazySignal,EMSignal):
 
     _lazy = True
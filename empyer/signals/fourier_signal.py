@@ -0,0 +1,121 @@
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.colors import hsv_to_rgb
+
+from hyperspy._signals.complex_signal2d import ComplexSignal2D, LazyComplexSignal2D
+from hyperspy.signals import Signal2D
+from empyer.signals.em_signal import EMSignal
+
+
+class FourierSignal(ComplexSignal2D, EMSignal):
+    """Create a Fourier Signal from a complex numpy array.
+
+    The complex angular Fourier coefficients of the polar patterns for some orders at every k. Unlike the power
+    spectrum the phase is kept, so the in-plane orientation of n-fold symmetric clusters can be mapped.
+
+    Parameters
+    ----------
+    data : numpy array
+       The signal data. It can be an array of any dimensions.
+    axes : dictionary (optional)
+        Dictionary to define the axes (see the
+        documentation of the AxesManager class for more details).
+    attributes : dictionary (optional)
+        A dictionary whose items are stored as attributes.
+    metadata : dictionary (optional)
+        A dictionary containing a set of parameters
+        that will to stores in the `metadata` attribute.
+        Some parameters might be mandatory in some cases.
+    original_metadata : dictionary (optional)
+        A dictionary containing a set of parameters
+        that will to stores in the `original_metadata` attribute. It
+        typically contains all the parameters that has been
+        imported from the original data file.
+    """
+    _signal_type = "fourier_signal"
+
+    def __init__(self, *args, **kwargs):
+        ComplexSignal2D.__init__(self, *args, **kwargs)
+        self.metadata.set_item("Signal.type", "fourier_signal")
+
+    def as_lazy(self, *args, **kwargs):
+        """Returns the signal as a lazy signal.
+        """
+        res = super().as_lazy(*args, **kwargs)
+        res.__class__ = LazyFourierSignal
+        res.__init__(**res._to_dictionary())
+        return res
+
+    def get_magnitude_map(self, symmetry, k_region=[3.0, 6.0]):
+        """Creates a 2 dimensional map of the magnitude of some order.
+
+        Parameters
+        ----------
+        symmetry: int
+            The order to map
+        k_region: array-like
+           upper and lower k values to integrate over, allows both ints and floats for indexing
+        Returns
+        ----------
+        magnitude_map: Signal2D
+            The summed magnitude of the coefficients in the k region
+        """
+        return self.isig[self._order_index(symmetry), k_region[0]:k_region[1]].amplitude.sum(axis=[-1]).transpose()
+
+    def get_orientation_map(self, symmetry, k_region=[3.0, 6.0]):
+        """Creates a 2 dimensional map of the orientation of some order. The coefficients in the k region are summed
+        so the orientation is weighted by their magnitude.
+
+        Parameters
+        ----------
+        symmetry: int
+            The order to map
+        k_region: array-like
+           upper and lower k values to integrate over, allows both ints and floats for indexing
+        Returns
+        ----------
+        orientation_map: Signal2D
+            The angle of the symmetry axis in radians from 0 to 2pi/symmetry
+        """
+        summed = self.isig[self._order_index(symmetry), k_region[0]:k_region[1]].sum(axis=[-1]).transpose()
+        orientation = np.mod(-np.angle(summed.data) / symmetry, 2 * np.pi / symmetry)
+        orientation_map = Signal2D(orientation)
+        for new_axis, axis in zip(orientation_map.axes_manager.signal_axes, summed.axes_manager.signal_axes):
+            new_axis.name = axis.name
+            new_axis.scale = axis.scale
+            new_axis.offset = axis.offset
+            new_axis.units = axis.units
+        return orientation_map
+
+    def plot_orientation_map(self, symmetry, k_region=[3.0, 6.0], **kwargs):
+        """Plots the orientation of some order as the hue and its magnitude as the brightness. Takes all of the
+        arguments that imshow does.
+
+        Parameters
+        -------------
+        symmetry: int
+            The order to map
+        k_region: array-like
+           upper and lower k values to integrate over, allows both ints and floats for indexing
+        Returns
+        -------------
+        rgb: array-like
+            The plotted colors
+        """
+        orientation = self.get_orientation_map(symmetry, k_region=k_region).data
+        magnitude = self.get_magnitude_map(symmetry, k_region=k_region).data
+        hsv = np.stack([orientation * symmetry / (2 * np.pi),
+                        np.ones_like(orientation),
+                        magnitude / max(np.max(magnitude), 1e-12)], axis=-1)
+        rgb = hsv_to_rgb(hsv)
+        plt.imshow(rgb, **kwargs)
+        plt.title(str(symmetry) + "-fold orientation")
+        return rgb
+
+
+class LazyFourierSignal(LazyComplexSignal2D, FourierSignal):
+
+    _lazy = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
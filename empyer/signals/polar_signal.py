@@ -1,10 +1,20 @@
+from functools import partial
+
 import numpy as np
-from empyer.signals.em_signal import EMSignal
-from empyer.signals.correlation_signal import CorrelationSignal
-from empyer.misc.angular_correlation import angular_correlation
-from empyer.misc.image import square
-from hyperspy.utils import stack
+import dask.array as da
+from dask import delayed
+from empyer.signals.em_signal import EMSignal, _navigation_chunks
+from empyer.signals.correlation_signal import CorrelationSignal, LazyCorrelationSignal, _summed_power_signals
+from empyer.signals.power_signal import PowerSignal, LazyPowerSignal
+from empyer.signals.fourier_signal import FourierSignal, LazyFourierSignal
+from empyer.misc.angular_correlation import angular_correlation_stack, mask_normalization, unique_masks
+from empyer.misc.angular_correlation import symmetry_spectrum, angular_cross_correlation_stack
+from empyer.misc.angular_correlation import cross_mask_normalization, PowerSpectrumAccumulator
+from empyer.misc.fem import FEMAccumulator, VERSIONS as FEM_VERSIONS, annular_statistics, weighted_fem
+from empyer.misc.fem import variable_resolution_fem
+from empyer.misc.bootstrap import bootstrap, confidence_interval, weighted_mean
 from hyperspy._signals.lazy import LazySignal
+from hyperspy._signals.signal1d import Signal1D
 
 
 class PolarSignal(EMSignal):
@@ -40,11 +50,15 @@ class PolarSignal(EMSignal):
         res.__init__(**res._to_dictionary())
         return res
 
-    def autocorrelation(self, binning_factor=1, cut=0, normalize=True):
+    def autocorrelation(self, binning_factor=1, cut=0, normalize=True, dtype=np.float64, chunk_size=32, half=False,
+                        orders=None):
         # TODO: Add the ability to cutoff like slicing (maybe use np.s)
         """Create a Correlation Signal from a numpy array.
 
 
+        The cut and the binning can also be done when the polar signal is made (see
+        DiffractionSignal.calculate_polar_spectrum), so the inner rings and the full resolution are never calculated.
+
         Parameters
         ----------
         binning_factor : int
@@ -53,133 +67,623 @@ class PolarSignal(EMSignal):
             The number of pixels or distance to cut off image
         normalize : boolean
             normalize with autocorrelation
+        dtype : numpy dtype
+            The working precision. np.float32 uses single precision FFTs and halves the memory.
+        chunk_size : int
+            The number of patterns correlated at once. Small blocks stay in cache and are faster than very large
+            ones. Lazy signals are correlated chunk by chunk instead.
+        half : bool
+            Only store the angles 0-pi. The correlation is symmetric so this halves the memory without losing
+            anything.
+        orders : list
+            Also return the complex angular Fourier coefficients at these orders from the same FFTs. For lazy signals
+            both come from one task per chunk, so computing (or storing) them together with dask.compute reads and
+            transforms every chunk once.
         Returns
         ----------
         angle : CorrelationSignal
 
+        fourier : FourierSignal
+            Only if orders is given.
         """
         if isinstance(cut, float):
             cut = self.axes_manager.signal_axes[1].value2index(cut)
         self.add_mask()
-        if isinstance(self.data, np.ma.masked_array):
-            mask = np.reshape(self.data.mask, newshape=(-1, *reversed(self.axes_manager.signal_shape)))
-        correlation = self._map_iterate(angular_correlation,
-                                        iterating_kwargs=(('mask', mask),),
-                                        binning=binning_factor,
-                                        cut_off=cut,
-                                        normalize=normalize,
-                                        inplace=False)
+        signal_shape = self.data.shape[-2:]
+        correlation_shape = ((signal_shape[0] - cut) // binning_factor, signal_shape[1] // binning_factor)
+        full_width = correlation_shape[1]
+        if half:
+            correlation_shape = (correlation_shape[0], full_width // 2 + 1)
+        complex_dtype = np.result_type(dtype, np.complex64)
+        if self._lazy and orders is not None:
+            data = self.data.rechunk({self.data.ndim - 2: -1, self.data.ndim - 1: -1})  # full signal in each chunk
+            correlation, coefficients = _correlation_blocks(data,
+                                                            correlation_shape,
+                                                            orders,
+                                                            binning=binning_factor,
+                                                            cut_off=cut,
+                                                            normalize=normalize,
+                                                            dtype=dtype,
+                                                            half=half)
+        elif self._lazy:
+            data = self.data.rechunk({self.data.ndim - 2: -1, self.data.ndim - 1: -1})  # full signal in each chunk
+            correlation = data.map_blocks(partial(angular_correlation_stack,
+                                                  binning=binning_factor,
+                                                  cut_off=cut,
+                                                  normalize=normalize,
+                                                  dtype=dtype,
+                                                  half=half),
+                                          dtype=dtype,
+                                          chunks=(*data.chunks[:-2], *((length,) for length in correlation_shape)),
+                                          meta=np.empty((0,) * data.ndim, dtype=dtype))
+        else:
+            flat = np.reshape(self.data, (-1, *signal_shape))
+            # the mask normalization is only calculated once for every distinct mask (beam stop, detector gaps...)
+            masks, inverse = unique_masks(np.ma.getmaskarray(flat))
+            number_unmasked = mask_normalization(masks, binning=binning_factor, cut_off=cut, dtype=dtype)
+            correlation = np.empty((len(flat), *correlation_shape), dtype=dtype)
+            if orders is not None:
+                coefficients = np.empty((len(flat), correlation_shape[0], len(orders)), dtype=complex_dtype)
+            for start in range(0, len(flat), chunk_size):
+                block = flat[start:start + chunk_size]
+                if len(masks) == 1:
+                    block_unmasked = number_unmasked[0]
+                else:
+                    block_unmasked = number_unmasked[inverse[start:start + chunk_size]]
+                result = angular_correlation_stack(block,
+                                                   binning=binning_factor,
+                                                   cut_off=cut,
+                                                   normalize=normalize,
+                                                   dtype=dtype,
+                                                   half=half,
+                                                   number_unmasked=block_unmasked,
+                                                   orders=orders)
+                if orders is not None:
+                    result, coefficients[start:start + chunk_size] = result
+                correlation[start:start + chunk_size] = result
+            correlation = np.reshape(correlation, (*self.data.shape[:-2], *correlation_shape))
+            if orders is not None:
+                coefficients = np.reshape(coefficients, (*self.data.shape[:-2], correlation_shape[0], len(orders)))
         passed_meta_data = self.metadata.as_dictionary()
-        angular = CorrelationSignal(correlation, metadata=passed_meta_data)
+        if self._lazy:
+            angular = LazyCorrelationSignal(correlation, metadata=passed_meta_data)
+        else:
+            angular = CorrelationSignal(correlation, metadata=passed_meta_data)
+        if half:
+            angular.metadata.set_item("Signal.Correlation.full_width", full_width)
         shift = cut // binning_factor
         angular.axes_manager.navigation_axes = self.axes_manager.navigation_axes
         angular.set_axes(-2,
                          name="Radians",
                          scale=self.axes_manager[-2].scale*binning_factor,
                          units="rad")
-        offset = shift * self.axes_manager[-1].scale*binning_factor
+        offset = self.axes_manager[-1].offset + shift * self.axes_manager[-1].scale*binning_factor
         angular.set_axes(-1,
                          name="k",
                          scale=self.axes_manager[-1].scale*binning_factor,
                          units=self.axes_manager[-1].units,
                          offset=offset)
-        return angular
+        if orders is None:
+            return angular
+        if self._lazy:
+            fourier = LazyFourierSignal(coefficients)
+        else:
+            fourier = FourierSignal(coefficients)
+        fourier.axes_manager.navigation_axes = self.axes_manager.navigation_axes
+        _set_order_axis(fourier, orders)
+        fourier.set_axes(-1,
+                         name="k",
+                         scale=self.axes_manager[-1].scale*binning_factor,
+                         units=self.axes_manager[-1].units,
+                         offset=offset)
+        return angular, fourier
+
+    def get_summed_power_spectrum(self, binning_factor=1, cut=0, normalize=True, dtype=np.float64, chunk_size=32,
+                                  half=False, return_variance=False):
+        """The power spectrum of the summed correlation signal without ever storing the correlation signal. Each
+        chunk of patterns is correlated and folded into a PowerSpectrumAccumulator before the next one is correlated.
+        Equal to autocorrelation().get_summed_power_spectrum().
+
+        Parameters
+        ----------
+        binning_factor : int
+            Binning factor to speed up calculations
+        cut : int or float
+            The number of pixels or distance to cut off image
+        normalize : boolean
+            normalize with autocorrelation
+        dtype : numpy dtype
+            The working precision.
+        chunk_size : int
+            The number of patterns correlated at once. Every dask block of a lazy signal is read once.
+        half : bool
+            Only return the non-negative Fourier orders.
+        return_variance : bool
+            Also return the variance of the summed power spectrum (for error bars)
+        Returns
+        ----------
+        power : PowerSignal
+            The power spectrum of the summed correlation
+        variance : PowerSignal
+            Only if return_variance
+        """
+        if isinstance(cut, float):
+            cut = self.axes_manager.signal_axes[1].value2index(cut)
+        self.add_mask()
+        accumulator = PowerSpectrumAccumulator(dtype=dtype)
+        for index, block in _navigation_chunks(self.data, chunk_size):
+            accumulator.add(angular_correlation_stack(block,
+                                                      binning=binning_factor,
+                                                      cut_off=cut,
+                                                      normalize=normalize,
+                                                      dtype=dtype))
+        k_scale = self.axes_manager[-1].scale*binning_factor
+        return _summed_power_signals(accumulator,
+                                     k_scale=k_scale,
+                                     k_units=self.axes_manager[-1].units,
+                                     k_offset=self.axes_manager[-1].offset + cut // binning_factor * k_scale,
+                                     half=half,
+                                     return_variance=return_variance)
+
+    def cross_correlation(self, k_pairs=None, binning_factor=1, cut=0, normalize=True, dtype=np.float64,
+                          chunk_size=8):
+        """Create a Correlation Signal of the angular cross correlation C(k1, k2, dphi) between the rings of every
+        pattern. Speckles from the same cluster at different k are correlated at the angle between them.
+
+        The FFT of every ring is only taken once and the patterns are correlated chunk_size at a time. Every pair of
+        rings gives n_k times more data than the autocorrelation so k_pairs can restrict it to the pairs of interest.
+        Without k_pairs the result rarely fits in memory (a 256 x 256 scan with 200 rings and 720 angles is about
+        15 TB in float64) so it is always a LazyCorrelationSignal, correlated chunk by chunk as it is computed, plotted
+        or saved.
+
+        Parameters
+        ----------
+        k_pairs : array-like
+            A (n_pairs, 2) list of the (k1, k2) indexes to correlate, counted after the cut and the binning. The
+            pairs are stored in metadata.Signal.k_pairs. Otherwise every ring is correlated with every other ring and
+            k1 is added as the last navigation axis.
+        binning_factor : int
+            Binning factor to speed up calculations
+        cut : int or float
+            The number of pixels or distance to cut off image
+        normalize : boolean
+            normalize with the mean intensity of both rings
+        dtype : numpy dtype
+            The working precision. np.float32 uses single precision FFTs and halves the memory.
+        chunk_size : int
+            The number of patterns correlated at once. Lazy signals are correlated chunk by chunk instead.
+        Returns
+        ----------
+        cross : CorrelationSignal
+            The cross correlation with signal axes (Radians, k2) or (Radians, pair). A LazyCorrelationSignal without
+            k_pairs.
+        """
+        if isinstance(cut, float):
+            cut = self.axes_manager.signal_axes[1].value2index(cut)
+        if k_pairs is not None:
+            k_pairs = np.reshape(k_pairs, (-1, 2))
+        self.add_mask()
+        signal_shape = self.data.shape[-2:]
+        n_k = (signal_shape[0] - cut) // binning_factor
+        correlation_shape = (n_k, signal_shape[1] // binning_factor)
+        if k_pairs is None:
+            correlation_shape = (n_k, *correlation_shape)
+        else:
+            correlation_shape = (len(k_pairs), correlation_shape[1])
+        lazy = self._lazy or k_pairs is None
+        if lazy:
+            if self._lazy:
+                data = self.data.rechunk({self.data.ndim - 2: -1, self.data.ndim - 1: -1})  # full signal in each chunk
+            else:
+                nav_shape = self.data.shape[:-2]
+                nav_chunks = (1,) * len(nav_shape[:-1]) + tuple(min(chunk_size, length) for length in nav_shape[-1:])
+                data = da.from_array(self.data, chunks=(*nav_chunks, *signal_shape), asarray=False)
+            correlation = data.map_blocks(partial(angular_cross_correlation_stack,
+                                                  k_pairs=k_pairs,
+                                                  binning=binning_factor,
+                                                  cut_off=cut,
+                                                  normalize=normalize,
+                                                  dtype=dtype),
+                                          dtype=dtype,
+                                          chunks=(*data.chunks[:-2], *((length,) for length in correlation_shape)),
+                                          new_axis=[data.ndim - 2] if k_pairs is None else None,
+                                          meta=np.empty((0,) * (data.ndim + (k_pairs is None)), dtype=dtype))
+        else:
+            flat = np.reshape(self.data, (-1, *signal_shape))
+            masks, inverse = unique_masks(np.ma.getmaskarray(flat))
+            number_unmasked = None
+            if len(masks) == 1:  # otherwise each chunk finds its own distinct masks
+                number_unmasked = cross_mask_normalization(masks[0], k_pairs=k_pairs, binning=binning_factor,
+                                                           cut_off=cut, dtype=dtype)
+            correlation = np.empty((len(flat), *correlation_shape), dtype=dtype)
+            for start in range(0, len(flat), chunk_size):
+                correlation[start:start + chunk_size] = angular_cross_correlation_stack(flat[start:start + chunk_size],
+                                                                                        k_pairs=k_pairs,
+                                                                                        binning=binning_factor,
+                                                                                        cut_off=cut,
+                                                                                        normalize=normalize,
+                                                                                        dtype=dtype,
+                                                                                        number_unmasked=number_unmasked)
+            correlation = np.reshape(correlation, (*self.data.shape[:-2], *correlation_shape))
+        passed_meta_data = self.metadata.as_dictionary()
+        if lazy:
+            cross = LazyCorrelationSignal(correlation, metadata=passed_meta_data)
+        else:
+            cross = CorrelationSignal(correlation, metadata=passed_meta_data)
+        k_scale = self.axes_manager[-1].scale*binning_factor
+        offset = self.axes_manager[-1].offset + cut // binning_factor * k_scale
+        cross.set_axes(-2,
+                       name="Radians",
+                       scale=self.axes_manager[-2].scale*binning_factor,
+                       units="rad")
+        if k_pairs is None:
+            for new_axis, axis in zip(cross.axes_manager.navigation_axes[1:], self.axes_manager.navigation_axes):
+                new_axis.name = axis.name
+                new_axis.scale = axis.scale
+                new_axis.offset = axis.offset
+                new_axis.units = axis.units
+            for axis, name in zip([cross.axes_manager.navigation_axes[0], cross.axes_manager[-1]], ["k1", "k2"]):
+                axis.name = name
+                axis.scale = k_scale
+                axis.offset = offset
+                axis.units = self.axes_manager[-1].units
+        else:
+            cross.axes_manager.navigation_axes = self.axes_manager.navigation_axes
+            cross.metadata.set_item("Signal.k_pairs", k_pairs.tolist())
+            cross.set_axes(-1,
+                           name="pair",
+                           scale=1,
+                           units="a.u.")
+        return cross
+
+    def get_symmetry_spectrum(self, orders=[2, 4, 6, 8, 10], dtype=np.float64, chunk_size=100):
+        """Create a Power Signal with only some of the Fourier orders directly from the polar signal.
+
+        The angular Fourier coefficients are found with a partial DFT so the correlation signal and the full power
+        spectrum are never calculated. For unmasked patterns this equals
+        autocorrelation().get_power_spectrum() at the orders.
+
+        Parameters
+        ----------
+        orders : list
+            The Fourier orders (symmetries) to calculate
+        dtype : numpy dtype
+            The working precision.
+        chunk_size : int
+            The number of patterns transformed at once. Lazy signals are transformed chunk by chunk instead.
+        Returns
+        ----------
+        power : PowerSignal
+            The power at each of the orders. The orders are stored in metadata.Signal.orders
+        """
+        self.add_mask()
+        signal_shape = self.data.shape[-2:]
+        if self._lazy:
+            data = self.data.rechunk({self.data.ndim - 2: -1, self.data.ndim - 1: -1})  # full signal in each chunk
+            spectrum = data.map_blocks(partial(symmetry_spectrum, orders=orders, dtype=dtype),
+                                       dtype=dtype,
+                                       chunks=(*data.chunks[:-1], (len(orders),)),
+                                       meta=np.empty((0,) * data.ndim, dtype=dtype))
+        else:
+            flat = np.reshape(self.data, (-1, *signal_shape))
+            spectrum = np.empty((len(flat), signal_shape[0], len(orders)), dtype=dtype)
+            for start in range(0, len(flat), chunk_size):
+                spectrum[start:start + chunk_size] = symmetry_spectrum(flat[start:start + chunk_size],
+                                                                       orders=orders,
+                                                                       dtype=dtype)
+            spectrum = np.reshape(spectrum, (*self.data.shape[:-2], signal_shape[0], len(orders)))
+        if self._lazy:
+            power = LazyPowerSignal(spectrum)
+        else:
+            power = PowerSignal(spectrum)
+        power.axes_manager.navigation_axes = self.axes_manager.navigation_axes
+        _set_order_axis(power, orders)
+        power.set_axes(-1,
+                       name="k",
+                       scale=self.axes_manager[-1].scale,
+                       units=self.axes_manager[-1].units,
+                       offset=self.axes_manager[-1].offset)
+        return power
 
     def correlation_lengths(self):
         """Calculates the average correlation length across the sample 
         """
 
-    def fem(self, version="omega", indicies=None):
+    def fem(self, version="omega", indicies=None, chunk_size=100):
         """Calculated the variance among some image
 
+        The polar data is only read once. Every chunk of patterns is reduced to its annular means and ring variances
+        and folded into a FEMAccumulator, so in-memory and lazy signals are handled the same way. Masked pixels and
+        NaNs are ignored.
+
         Parameters
         ----------
         version : str
             The name of the FEM equation to use. 'rings' calculates the mean of the variances of all the patterns at
-            some k.  'omega' calculates the variance of the annular means for every value of k.
-        patterns: indicies
-            Calculates the FEM pattern using only some of the patterns based on their indexes
+            some k.  'omega' calculates <A>^2/<A^2> - 1 of the annular means A for every value of k (as it always
+            has). 'annular_variance' is the normalized variance of the annular means, <A^2>/<A>^2 - 1, and
+            'ring_variance' is the same as 'rings'.
+        indicies: array-like
+            Calculates the FEM pattern using only some of the patterns. Either a list of navigation indexes or a
+            boolean array, both in the same (x, y) order as inav, so indicies=[[x, y]] and a mask which is only True
+            at mask[x, y] select the same pattern. The mask has the shape of axes_manager.navigation_shape. The
+            patterns are gathered straight from the data without making a signal for each of them.
+        chunk_size : int
+            The number of patterns reduced at once
+        Returns
+        ----------
+        int_vs_k : Signal1D
+            The variance versus k
         """
-        print("Here")
-
-        if version is "omega":
-            if indicies:
-                var = stack([self.inav[ind] for ind in indicies])
-                annular_mean = var.nanmean(axis=-2)
-                annular_mean_squared = annular_mean.nanmean() ** 2
-                v = (annular_mean ** 2).nanmean()
-                int_vs_k = (annular_mean_squared / v) - 1
-            else:
-                with self.unfolded(unfold_navigation=True, unfold_signal=False):
-                    annular_mean = self.nanmean(axis=-2)
-                    annular_mean_squared = annular_mean.nanmean()**2
-                    v = (annular_mean ** 2).nanmean()
-                    int_vs_k = (annular_mean_squared / v) - 1
-                self.set_signal_type("PolarSignal")
-
-        if version is 'rings':
-            if indicies:
-                s = stack([self.inav[ind] for ind in indicies])
-                ring_squared_average = (s ** 2).nanmean(axis=-2)
-                ring_squared = s.nanmean(axis=-2) ** 2
-                int_vs_k = (ring_squared_average / ring_squared) - 1
-            else:
-                with self.unfolded(unfold_navigation=True, unfold_signal=False):
-                    ring_squared_average = (self ** 2).nanmean(axis=-2)
-                    ring_squared = self.nanmean(axis=-2) ** 2
-                    int_vs_k = (ring_squared_average / ring_squared) - 1
-                self.set_signal_type("PolarSignal")
-        int_vs_k.axes_manager[0].units = "$nm^{-1}$"
-        int_vs_k.axes_manager[0].name = "k"
-        return int_vs_k
-"""
-        if not self.metadata.has_item('HAADF'):
-            print("No thickness filter applied...")
-            if version is 'rings':
-                var = self.nanmean(axis=-1)
-                var.map(square)
-                var = var.nanmean()
-                center = self.nanmean(axis=-1).nanmean()
-                center.map(square)
-                int_vs_k = (var - center) / center
-                print(int_vs_k.axes_manager)
-            elif version is 'omega':
-                var = self.map(square, show_progressbar=False, inplace=False).nanmean().nanmean(axis=1)
-                center = self.nanmean(axis=-1)
-                center.map(square)
-                center = center.nanmean()
-                int_vs_k = (var - center) / center
-                print(int_vs_k.axes_manager)
+        if version not in FEM_VERSIONS:
+            raise ValueError("version must be in " + str(FEM_VERSIONS) + " not " + str(version))
+        accumulator = FEMAccumulator()
+        for index, block in _navigation_chunks(self.data, chunk_size, positions=self._navigation_positions(indicies)):
+            accumulator.add(block)
+        return self._k_signal(accumulator.fem(version))
+
+    def grouped_fem(self, labels=None, version="omega", chunk_size=100):
+        """Calculates the variance among the patterns of every group (thickness bins, clusters, regions...) at once.
+
+        Every chunk of patterns is reduced to its annular means and ring variances and the moments of every group
+        are summed together with bincount, so all of the groups take one pass over the data.
+
+        Parameters
+        ----------
+        labels : array-like
+            An integer label for every pattern in the same (x, y) order as inav, so labels[x, y] is the group of
+            inav[x, y] and labels has the shape of axes_manager.navigation_shape, like the boolean indicies of fem.
+            Patterns with a negative label are left out. Otherwise the patterns are binned by thickness with
+            thickness_filter (which needs the HAADF intensities) and the patterns outside of the thickness bins are
+            left out.
+        version : str
+            The name of the FEM equation to use. 'omega', 'rings', 'annular_variance' or 'ring_variance', see fem.
+        chunk_size : int
+            The number of patterns reduced at once
+        Returns
+        ----------
+        int_vs_k : Signal1D
+            The variance versus k for every group. The groups are the navigation axis.
+        """
+        if version not in FEM_VERSIONS:
+            raise ValueError("version must be in " + str(FEM_VERSIONS) + " not " + str(version))
+        nav_shape = self.data.shape[:-2]
+        thickness = None
+        if labels is None:
+            if not self.metadata.has_item('HAADF'):
+                raise ValueError("The labels must be given if there are no HAADF intensities to bin by thickness")
+            th_filter, thickness = self.thickness_filter()
+            labels = np.asarray(th_filter).astype(int) - 1  # bin 0 are the outliers
+        labels = np.asarray(labels)
+        if labels.shape != nav_shape[::-1]:
+            raise ValueError("The labels must have the navigation shape " + str(nav_shape[::-1]) +
+                             " (in the order of inav)")
+        labels = np.ravel(np.transpose(labels)).astype(int)  # inav order is the reverse of the data
+        n_groups = len(thickness) if thickness is not None else max(np.max(labels) + 1, 1)
+        accumulator = FEMAccumulator(n_groups=n_groups)
+        for index, block in _navigation_chunks(self.data, chunk_size):
+            accumulator.add(block, labels=labels[index])
+        int_vs_k = self._k_signal(accumulator.fem(version))
+        if thickness is not None:
+            int_vs_k.axes_manager[0].name = "thickness"
+            int_vs_k.axes_manager[0].offset = thickness[0]
+            int_vs_k.axes_manager[0].scale = thickness[1] - thickness[0]
         else:
-            filt, thickness = self.thickness_filter()
-            if version is 'rings':
-                int_vs_k = []
-                for i, th in enumerate(thickness):
-                    index = np.where(filt.transpose() == i+1)
-                    index = tuple(zip(index[0], index[1]))
-                    var = stack([self.inav[ind] for ind in index])
-                    v = var.map(square, inplace=False).nanmean().nanmean(axis=-2)
-                    center = var.nanmean(axis=-2)
-                    center.map(square)
-                    center = center.nanmean()
-                    int_vs_k.append((v - center) / center)
-            if version is 'omega':
-                int_vs_k = []
-                for i, th in enumerate(thickness):
-                    index = np.where(filt.transpose() == i+1)
-                    index = tuple(zip(index[0], index[1]))
-                    var = stack([self.inav[ind] for ind in index])
-                    v = var.map(square, inplace=False).nanmean(axis=-2)
-                    center = var.nanmean(axis=-2)
-                    center.map(square)
-                    center = center.nanmean()
-                    int_vs_k.append(((v - center) / center).nanmean())
-            int_vs_k = stack(int_vs_k)
-            int_vs_k.axes_manager.navigation_axes[0].offset = thickness[0]
-            int_vs_k.axes_manager.navigation_axes[0].scale = thickness[1] - thickness[0]
-"""
+            int_vs_k.axes_manager[0].name = "group"
+        return int_vs_k
+
+    def bootstrap_fem(self, version="omega", n_replicates=200, level=0.95, seed=None, n_jobs=1, indicies=None,
+                      chunk_size=100):
+        """Calculates the variance among some image with bootstrap confidence intervals.
+
+        The annular mean and ring variance of every pattern are found in one pass over the data. Each replicate then
+        redraws the patterns with replacement as a weighted sum over those statistics, so the replicates never go
+        back to the polar data.
+
+        Parameters
+        ----------
+        version : str
+            The name of the FEM equation to use. 'omega', 'rings', 'annular_variance' or 'ring_variance', see fem.
+        n_replicates : int
+            The number of bootstrap replicates
+        level : float
+            The confidence level of the interval
+        seed : int
+            The seed of the random draws. The replicates are the same for any n_jobs.
+        n_jobs : int
+            The number of processes making the replicates. -1 uses all of the cores.
+        indicies: array-like
+            Only use some of the patterns, see fem.
+        chunk_size : int
+            The number of patterns reduced at once
+        Returns
+        ----------
+        int_vs_k : Signal1D
+            The variance versus k
+        lower : Signal1D
+            The lower bound of the confidence interval
+        upper : Signal1D
+            The upper bound of the confidence interval
+        """
+        if version not in FEM_VERSIONS:
+            raise ValueError("version must be in " + str(FEM_VERSIONS) + " not " + str(version))
+        indexes, statistics = [], []
+        for index, block in _navigation_chunks(self.data, chunk_size, positions=self._navigation_positions(indicies)):
+            indexes.append(index)
+            statistics.append(annular_statistics(block))
+        order = np.argsort(np.concatenate(indexes))  # the order of the navigation axes whatever the chunks are
+        annular_mean, ring_variance = [np.concatenate(stat, axis=0)[order] for stat in zip(*statistics)]
+        int_vs_k = weighted_fem(np.ones((1, len(annular_mean))), annular_mean, ring_variance, version=version)[0]
+        replicates = bootstrap(partial(weighted_fem, version=version),
+                               (annular_mean, ring_variance),
+                               n_replicates=n_replicates,
+                               seed=seed,
+                               n_jobs=n_jobs)
+        lower, upper = confidence_interval(replicates, level=level)
+        return self._k_signal(int_vs_k), self._k_signal(lower), self._k_signal(upper)
+
+    def bootstrap_symmetry_spectrum(self, orders=[2, 4, 6, 8, 10], n_replicates=200, level=0.95, seed=None,
+                                    n_jobs=1, dtype=np.float64, chunk_size=100):
+        """The summed symmetry spectrum (the mean of get_symmetry_spectrum over every pattern) with bootstrap
+        confidence intervals. The symmetry spectra are only found once and each replicate is a weighted mean of them.
+
+        Parameters
+        ----------
+        orders : list
+            The Fourier orders (symmetries) to calculate
+        n_replicates : int
+            The number of bootstrap replicates
+        level : float
+            The confidence level of the interval
+        seed : int
+            The seed of the random draws. The replicates are the same for any n_jobs.
+        n_jobs : int
+            The number of processes making the replicates. -1 uses all of the cores.
+        dtype : numpy dtype
+            The working precision.
+        chunk_size : int
+            The number of patterns transformed at once
+        Returns
+        ----------
+        power : PowerSignal
+            The mean symmetry spectrum
+        lower : PowerSignal
+            The lower bound of the confidence interval
+        upper : PowerSignal
+            The upper bound of the confidence interval
+        """
+        spectrum = self.get_symmetry_spectrum(orders=orders, dtype=dtype, chunk_size=chunk_size).data
+        if self._lazy:
+            spectrum = spectrum.compute()
+        spectrum = np.reshape(spectrum, (-1, *spectrum.shape[-2:]))
+        mean = np.mean(spectrum, axis=0)
+        replicates = bootstrap(weighted_mean, (spectrum,), n_replicates=n_replicates, seed=seed, n_jobs=n_jobs)
+        signals = []
+        for data in (mean, *confidence_interval(replicates, level=level)):
+            power = PowerSignal(data)
+            _set_order_axis(power, orders)
+            power.set_axes(-1,
+                           name="k",
+                           scale=self.axes_manager[-1].scale,
+                           units=self.axes_manager[-1].units,
+                           offset=self.axes_manager[-1].offset)
+            signals.append(power)
+        return tuple(signals)
+
+    def variable_resolution_fem(self, window_sizes=[1, 2, 4, 8], version="omega", step=None, chunk_size=100):
+        """Variable resolution FEM, the variance versus k for a number of effective probe sizes.
+
+        The patterns in every window of window_size x window_size probe positions are summed to stand in for a larger
+        probe. The sums come from one summed-area table over the navigation axes so every window size is found from
+        the same pass over the data. The table is built a band of rows of the navigation axes at a time, so a lazy
+        signal is read one chunk of its first navigation axis at a time and never loaded into memory as a whole.
+
+        Parameters
+        ----------
+        window_sizes : list
+            The widths of the windows in probe positions
+        version : str
+            The name of the FEM equation to use. 'omega', 'rings', 'annular_variance' or 'ring_variance', see fem.
+        step : int
+            The spacing of the windows in probe positions. Otherwise the windows don't overlap.
+        chunk_size : int
+            The number of window sums reduced at once
+        Returns
+        ----------
+        int_vs_k : Signal1D
+            The variance versus k with the window sizes as the navigation axis. The sizes are listed in
+            metadata.Signal.window_sizes
+        """
+        int_vs_k = variable_resolution_fem(self.data, window_sizes=window_sizes, version=version, step=step,
+                                           chunk_size=chunk_size)
+        return _window_signal(int_vs_k,
+                              window_sizes,
+                              self.axes_manager.navigation_axes[0],
+                              k_scale=self.axes_manager[-1].scale,
+                              k_units=self.axes_manager[-1].units,
+                              k_offset=self.axes_manager[-1].offset)
+
+    def _k_signal(self, int_vs_k):
+        """Wraps some variance versus k (for every group) in a Signal1D with the k axis of the polar signal.
+        """
+        int_vs_k = Signal1D(int_vs_k)
+        int_vs_k.axes_manager[-1].name = "k"
+        int_vs_k.axes_manager[-1].units = self.axes_manager[-1].units
+        int_vs_k.axes_manager[-1].scale = self.axes_manager[-1].scale
+        int_vs_k.axes_manager[-1].offset = self.axes_manager[-1].offset
+        return int_vs_k
+
+    def _navigation_positions(self, indicies):
+        """The sorted positions in the flattened navigation axes of some navigation indexes or of a boolean
+        navigation mask, both in the (x, y) order of inav.
+        """
+        if indicies is None:
+            return None
+        nav_shape = self.data.shape[:-2]
+        indicies = np.asarray(indicies)
+        if indicies.dtype == bool:
+            if indicies.shape != nav_shape[::-1]:
+                raise ValueError("The boolean mask must have the navigation shape " + str(nav_shape[::-1]) +
+                                 " (in the order of inav)")
+            return np.flatnonzero(np.transpose(indicies))  # inav order is the reverse of the data
+        indicies = np.reshape(indicies, (-1, len(nav_shape)))[:, ::-1]  # inav order is the reverse of the data
+        return np.sort(np.ravel_multi_index(tuple(indicies.T), nav_shape))
+
+
+def _set_order_axis(signal, orders):
+    """Sets up the FourierCoefficient axis of a signal with only some orders. The orders are also listed in
+    metadata.Signal.orders
+    """
+    signal.metadata.set_item("Signal.orders", list(orders))
+    spacing = np.diff(orders)
+    evenly_spaced = len(orders) > 1 and np.all(spacing == spacing[0])
+    signal.set_axes(-2,
+                    name="FourierCoefficient",
+                    scale=spacing[0] if evenly_spaced else 1,
+                    units="a.u.",
+                    offset=orders[0] if evenly_spaced else 0)
+
+
+def _window_signal(int_vs_k, window_sizes, navigation_axis, k_scale=1, k_units=None, k_offset=0):
+    """Wraps the variance versus k for some window sizes in a Signal1D. The window axis is in the units of the
+    navigation axis if the window sizes are evenly spaced.
+    """
+    int_vs_k = Signal1D(int_vs_k)
+    int_vs_k.metadata.set_item("Signal.window_sizes", list(window_sizes))
+    spacing = np.diff(window_sizes)
+    evenly_spaced = len(window_sizes) > 1 and np.all(spacing == spacing[0])
+    int_vs_k.axes_manager[0].name = "R"
+    if evenly_spaced:
+        int_vs_k.axes_manager[0].units = navigation_axis.units
+        int_vs_k.axes_manager[0].scale = spacing[0] * navigation_axis.scale
+        int_vs_k.axes_manager[0].offset = window_sizes[0] * navigation_axis.scale
+    int_vs_k.axes_manager[-1].name = "k"
+    int_vs_k.axes_manager[-1].units = k_units
+    int_vs_k.axes_manager[-1].scale = k_scale
+    int_vs_k.axes_manager[-1].offset = k_offset
+    return int_vs_k
 
 
+def _correlation_blocks(data, correlation_shape, orders, dtype=np.float64, **kwargs):
+    """The correlation and the Fourier coefficients of a dask array of polar patterns. Every block is correlated by
+    one delayed task which both outputs are taken from, so a block is only read and transformed once for the two.
+    """
+    complex_dtype = np.result_type(dtype, np.complex64)
+    blocks = data.to_delayed()
+    correlations = np.empty(blocks.shape, dtype=object)
+    coefficients = np.empty(blocks.shape, dtype=object)
+    for index in np.ndindex(*blocks.shape):
+        nav_shape = tuple(chunks[i] for chunks, i in zip(data.chunks[:-2], index))
+        result = delayed(angular_correlation_stack, nout=2)(blocks[index], orders=orders, dtype=dtype, **kwargs)
+        correlations[index] = da.from_delayed(result[0],
+                                              shape=(*nav_shape, *correlation_shape),
+                                              dtype=dtype,
+                                              meta=np.empty((0,) * data.ndim, dtype=dtype))
+        coefficients[index] = da.from_delayed(result[1],
+                                              shape=(*nav_shape, correlation_shape[0], len(orders)),
+                                              dtype=complex_dtype,
+                                              meta=np.empty((0,) * data.ndim, dtype=complex_dtype))
+    return da.block(correlations.tolist()), da.block(coefficients.tolist())
 
 
 class LazyPolarSignal(LazySignal,PolarSignal):
@@ -58,13 +58,13 @@ class PowerSignal(EMSignal):
             i = self.isig[:, :].sum(axis=[0, 1, 2])
 
         elif isinstance(symmetry, int):
-            i = self.isig[symmetry, :].sum()
+            i = self.isig[self._order_index(symmetry), :].sum()
             print(i)
 
         else:
             i = Signal1D(data=np.zeros(self.axes_manager.signal_shape[1]))
             for sym in symmetry:
-               i = self.isig[sym, :].sum() + i
+               i = self.isig[self._order_index(sym), :].sum() + i
         return i
 
     def get_map(self, k_region=[3.0, 6.0], symmetry=None):
@@ -85,12 +85,13 @@ class PowerSignal(EMSignal):
             sym_map = self.isig[:, k_region[0]:k_region[1]].sum(axis=[-1, -2]).transpose()
 
         elif isinstance(symmetry, int):
-            sym_map = self.isig[symmetry, k_region[0]:k_region[1]].sum(axis=[-1]).transpose()
+            sym_map = self.isig[self._order_index(symmetry), k_region[0]:k_region[1]].sum(axis=[-1]).transpose()
 
         else:
             sym_map = Signal2D(data=np.zeros(self.axes_manager.navigation_shape))
             for sym in symmetry:
-                sym_map = self.isig[sym, k_region[0]:k_region[1]].sum(axis=[-1]).transpose() + sym_map
+                sym_map = (self.isig[self._order_index(sym), k_region[0]:k_region[1]].sum(axis=[-1]).transpose() +
+                           sym_map)
         return sym_map
 
     def plot_symmetries(self, k_region=[3.0, 6.0], symmetry=[2, 4, 6, 8, 10], *args, **kwargs):
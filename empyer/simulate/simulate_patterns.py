@@ -136,10 +136,11 @@ def simulate_pattern(symmetry, k, num_clusters, probe_size, r, center, angle=Non
     return image
 
 
-def simulate_cube(probe=2, positions=101, length=50, number_clusters=50, radius=5, accept_angle=None):
+def simulate_cube(probe=2, positions=101, length=50, number_clusters=50, radius=5, accept_angle=None,
+                  dtype=np.float64):
     """The general concept here is you start with a bunch of random positions for the clusters.  For all of the
     positions you then calculate the intensity of the spots and every diffraction pattern is just what patterns are
-    at some postion..."""
+    at some postion...  dtype sets the precision of the simulated 4-D dataset."""
     pos_values = range(radius, positions-radius)
     pos = list(zip(*[np.random.choice(pos_values, number_clusters),
                            np.random.choice(pos_values, number_clusters)]))
@@ -153,7 +154,7 @@ def simulate_cube(probe=2, positions=101, length=50, number_clusters=50, radius=
                                  angle=0,
                                  lengths=[75, 75],
                                  acceptAngle=accept_angle) for s in symmetry]
-    four = np.ones((positions, positions, 256, 256))
+    four = np.ones((positions, positions, 256, 256), dtype=dtype)
     c = circle(radius=radius, center=pos, dim=(positions, positions))
     circlesize = np.divide(np.shape(c),2)
     for pos, pat in zip(pos, patterns):
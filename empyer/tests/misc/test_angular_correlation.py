@@ -1,7 +1,10 @@
 from unittest import TestCase
 import numpy as np
 import matplotlib.pyplot as plt
-from empyer.misc.angular_correlation import angular_correlation, power_spectrum
+from empyer.misc.angular_correlation import angular_correlation, angular_correlation_stack, power_spectrum, unfold_half
+from empyer.misc.angular_correlation import mask_normalization, unique_masks, symmetry_spectrum
+from empyer.misc.angular_correlation import angular_cross_correlation_stack
+import time
 
 
 class TestBinning(TestCase):
@@ -25,3 +28,89 @@ class TestBinning(TestCase):
     def test_power_spectrum(self):
         ac1 = angular_correlation(self.test1, normalize=False)
         ac2 = angular_correlation(self.test1, self.mask)
+
+    def test_single_precision(self):
+        ac64 = angular_correlation(self.test1.copy(), self.mask)
+        ac32 = angular_correlation(self.test1.copy(), self.mask, dtype=np.float32)
+        self.assertEqual(ac32.dtype, np.float32)
+        np.testing.assert_allclose(ac32, ac64, atol=1e-4)
+        pow64 = power_spectrum(ac64)
+        pow32 = power_spectrum(ac32, dtype=np.float32)
+        self.assertEqual(pow32.dtype, np.float32)
+        np.testing.assert_allclose(pow32, pow64, rtol=1e-3, atol=1e-3*np.max(pow64))
+
+    def test_stack(self):
+        stack = np.random.rand(50, 30, 360)
+        masks = np.zeros((50, 30, 360), dtype=bool)
+        masks[::2, 0:10, 20:60] = True
+        batched_time = []
+        looped_time = []
+        for i in range(3):  # the best of a few runs so a stall doesn't decide the test
+            start = time.time()
+            batched = angular_correlation_stack(stack, masks, cut_off=2)
+            batched_time.append(time.time() - start)
+            start = time.time()
+            looped = np.array([angular_correlation(img, m, cut_off=2) for img, m in zip(stack, masks)])
+            looped_time.append(time.time() - start)
+        self.assertLess(min(batched_time), min(looped_time))
+        np.testing.assert_array_almost_equal(batched, looped)
+        shared = angular_correlation_stack(stack, masks[0])
+        np.testing.assert_array_almost_equal(shared[1], angular_correlation(stack[1], masks[0]))
+
+    def test_binning_mask(self):
+        ac = angular_correlation(self.test1, self.mask, binning=2)
+        self.assertTupleEqual(ac.shape, (90, 360))
+        self.assertTrue(np.all(np.isfinite(ac)))
+
+    def test_half(self):
+        ac = angular_correlation(self.test1, self.mask)
+        half = angular_correlation(self.test1, self.mask, half=True)
+        self.assertTupleEqual(half.shape, (180, 361))
+        np.testing.assert_array_almost_equal(unfold_half(half, 720), ac)
+        power = power_spectrum(ac)
+        np.testing.assert_allclose(power, np.fft.fft(ac, axis=1).real**2, atol=1e-8*np.max(power))
+        half_power = power_spectrum(half, half=True, n=720)
+        self.assertTupleEqual(half_power.shape, (180, 361))
+        np.testing.assert_allclose(half_power, power[:, :361], atol=1e-8*np.max(power))
+
+    def test_unique_masks(self):
+        masks = np.zeros((6, 18, 72), dtype=bool)
+        masks[:, 0:3, 10:20] = True
+        masks[4, 5, :] = True
+        unique, inverse = unique_masks(masks)
+        self.assertEqual(len(unique), 2)
+        np.testing.assert_array_equal(unique[inverse], masks)
+        stack = np.random.rand(6, 18, 72)
+        deduplicated = angular_correlation_stack(stack, masks)
+        expected = np.array([angular_correlation(img, m) for img, m in zip(stack, masks)])
+        np.testing.assert_array_almost_equal(deduplicated, expected)
+        number_unmasked = mask_normalization(masks[0], binning=2, cut_off=2)
+        np.testing.assert_array_almost_equal(angular_correlation_stack(stack[:4], masks[:4], binning=2, cut_off=2,
+                                                                       number_unmasked=number_unmasked),
+                                             angular_correlation_stack(stack[:4], masks[:4], binning=2, cut_off=2))
+
+    def test_symmetry_spectrum(self):
+        stack = np.random.rand(4, 180, 720) + 1
+        theta = np.arange(720) * 2 * np.pi / 720
+        stack[:, 100] += np.cos(6 * theta)
+        symmetry = symmetry_spectrum(stack, orders=[2, 4, 6])
+        power = power_spectrum(angular_correlation_stack(stack))
+        np.testing.assert_allclose(symmetry, power[:, :, [2, 4, 6]], rtol=1e-6, atol=1e-9)
+        masked = symmetry_spectrum(stack, orders=[2, 4, 6], mask=self.mask)
+        self.assertLess(np.max(masked[:, :90]), 1)  # the mask doesn't add any symmetry
+        self.assertGreater(masked[0, 100, 2], 1000)
+
+    def test_cross_correlation(self):
+        stack = np.random.rand(3, 12, 40)
+        mask = np.random.rand(3, 12, 40) > .9
+        cross = angular_cross_correlation_stack(stack, mask=mask)
+        self.assertTupleEqual(cross.shape, (3, 12, 12, 40))
+        np.testing.assert_allclose(np.moveaxis(np.diagonal(cross, axis1=1, axis2=2), -1, 1),
+                                   angular_correlation_stack(stack, mask=mask), atol=1e-12)
+        unmasked = ~mask[0]
+        image = stack[0] * unmasked
+        direct = np.array([np.sum(image[1] * np.roll(image[7], -shift)) * 40 /
+                           max(np.sum(unmasked[1] * np.roll(unmasked[7], -shift)), 1) for shift in range(40)])
+        np.testing.assert_allclose(cross[0, 1, 7], direct / np.mean(direct) - 1, atol=1e-12)
+        pairs = angular_cross_correlation_stack(stack, k_pairs=[[1, 7], [3, 3]], mask=mask)
+        np.testing.assert_allclose(pairs, cross[:, [1, 3], [7, 3]], atol=1e-12)
@@ -0,0 +1,46 @@
+from unittest import TestCase
+from functools import partial
+import numpy as np
+from empyer.misc.bootstrap import resample_weights, bootstrap, confidence_interval, weighted_mean
+from empyer.misc.fem import fem, annular_statistics, weighted_fem
+
+
+class TestBootstrap(TestCase):
+    def setUp(self):
+        self.imgs = np.random.poisson(50, size=(40, 20, 90)).astype(float)
+        self.statistics = annular_statistics(self.imgs)
+
+    def test_weights(self):
+        weights = resample_weights(40, 7, seed=1)
+        self.assertEqual(weights.shape, (7, 40))
+        np.testing.assert_array_equal(np.sum(weights, axis=1), 40)
+        np.testing.assert_array_equal(weights, resample_weights(40, 7, seed=1))
+
+    def test_weighted_fem(self):
+        ones = np.ones((1, 40))
+        np.testing.assert_allclose(weighted_fem(ones, *self.statistics, version="annular_variance")[0],
+                                   fem(self.imgs, version="annular_variance", cut=0), rtol=1e-8)
+        np.testing.assert_allclose(weighted_fem(ones, *self.statistics, version="ring_variance")[0],
+                                   fem(self.imgs, version="ring_variance", cut=0), rtol=1e-8)
+        annular_mean = np.mean(self.imgs, axis=-1)
+        omega = np.mean(annular_mean, axis=0)**2 / np.mean(annular_mean**2, axis=0) - 1
+        np.testing.assert_allclose(weighted_fem(ones, *self.statistics)[0], omega, rtol=1e-6)
+        weights = np.zeros((1, 40))
+        weights[0, :10] = 2  # drawing the first ten patterns twice
+        np.testing.assert_allclose(weighted_fem(weights, *self.statistics, version="annular_variance")[0],
+                                   fem(self.imgs[:10], version="annular_variance", cut=0), rtol=1e-8)
+
+    def test_bootstrap(self):
+        estimator = partial(weighted_fem, version="omega")
+        replicates = bootstrap(estimator, self.statistics, n_replicates=120, seed=3, batch_size=50)
+        self.assertEqual(replicates.shape, (120, 20))
+        np.testing.assert_array_equal(replicates, bootstrap(estimator, self.statistics, n_replicates=120, seed=3,
+                                                            batch_size=50))
+        parallel = bootstrap(estimator, self.statistics, n_replicates=120, seed=3, batch_size=50, n_jobs=2)
+        np.testing.assert_allclose(parallel, replicates)
+        lower, upper = confidence_interval(replicates, level=0.9)
+        self.assertTrue(np.all(lower <= upper))
+        spectra = np.random.rand(40, 20, 5)
+        means = bootstrap(weighted_mean, (spectra,), n_replicates=10, seed=3)
+        self.assertEqual(means.shape, (10, 20, 5))
+        np.testing.assert_allclose(weighted_mean(np.ones((1, 40)), spectra)[0], np.mean(spectra, axis=0))
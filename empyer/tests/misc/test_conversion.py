@@ -1,8 +1,13 @@
 from unittest import TestCase
 import numpy as np
-from empyer.misc.cartesain_to_polar import convert
-from empyer.misc.image import random_ellipse
+from scipy.interpolate import RectBivariateSpline
+from empyer.misc.cartesain_to_polar import convert, convert_stack, convert_mask, convert_processes, PolarTransformPlan
+from empyer.misc.image import ellipsoid_list_to_cartesian
+from empyer.misc.image import random_ellipse, bin_2d
 from timeit import timeit
+import os
+import tempfile
+import time
 
 
 class TestConvert(TestCase):
@@ -24,5 +29,148 @@ class TestConvert(TestCase):
         even = np.sum(conversion, axis=0)
         self.assertLess((s > max(s)/2).sum(), 4)
 
+    def test_plan_matches_spline(self):
+        img = np.random.rand(512, 512)
+        plan = PolarTransformPlan(np.shape(img), center=self.center, angle=self.angle, lengths=self.lengths,
+                                  radius=[0, 300], phase_width=360)
+        final_x, final_y = ellipsoid_list_to_cartesian(np.arange(0, 300),
+                                                       np.linspace(0, 2*np.pi, num=360),
+                                                       self.center,
+                                                       axes_lengths=self.lengths,
+                                                       angle=self.angle)
+        spline = RectBivariateSpline(range(512), range(512), img, kx=1, ky=1)
+        expected = np.reshape(spline.ev(final_x, final_y), (300, 360))
+        np.testing.assert_array_almost_equal(plan.apply(img), expected)
 
+    def test_plan_reuse(self):
+        plan = PolarTransformPlan(np.shape(self.d), center=self.center, angle=self.angle, lengths=self.lengths)
+        imgs = np.random.rand(5, 512, 512)
+        for img in imgs:
+            np.testing.assert_array_almost_equal(convert(img, plan=plan),
+                                                 convert(img, center=self.center, angle=self.angle,
+                                                         lengths=self.lengths))
 
+    def test_convert_stack(self):
+        imgs = np.ma.masked_array(np.random.rand(2, 3, 512, 512))
+        imgs.mask = np.zeros((2, 3, 512, 512), dtype=bool)
+        imgs.mask[:, :, 240:260, 0:256] = True
+        plan = PolarTransformPlan((512, 512), center=self.center, angle=self.angle, lengths=self.lengths)
+        sparse_time = []
+        per_pattern_time = []
+        for i in range(3):  # the best of a few runs so a stall doesn't decide the test
+            start = time.time()
+            stacked = convert_stack(imgs, plan=plan, chunk_size=4)
+            sparse_time.append(time.time() - start)
+            start = time.time()
+            mapped = np.ma.stack([np.ma.stack([convert(img, plan=plan) for img in row]) for row in imgs])
+            per_pattern_time.append(time.time() - start)
+        self.assertLess(min(sparse_time), min(per_pattern_time))
+        self.assertTupleEqual(np.shape(stacked), (2, 3, 100, 720))
+        np.testing.assert_array_equal(stacked.mask, mapped.mask)
+        np.testing.assert_array_almost_equal(stacked.data, mapped.data)
+
+    def test_convert_mask(self):
+        img = np.ma.masked_array(np.random.rand(512, 512))
+        img.mask = np.zeros((512, 512), dtype=bool)
+        img.mask[240:260, 0:256] = True
+        original = img.data.copy()
+        polar = convert(img, center=self.center, angle=self.angle, lengths=self.lengths)
+        np.testing.assert_array_equal(img.data, original)  # the input isn't changed
+        self.assertEqual(polar.mask.dtype, bool)
+        self.assertTrue(polar.mask.any())
+        self.assertGreaterEqual(polar.min(), 0)
+
+    def test_shared_mask(self):
+        plan = PolarTransformPlan((512, 512), center=self.center, angle=self.angle, lengths=self.lengths)
+        mask = np.zeros((4, 512, 512), dtype=bool)
+        mask[:, 240:260, 0:256] = True
+        shared = convert_mask(mask, plan=plan)
+        mask[1, 270:280, :] = True
+        different = convert_mask(mask, plan=plan)
+        np.testing.assert_array_equal(shared[0], different[0])
+        np.testing.assert_array_equal(different[1], convert_mask(mask[1], plan=plan))
+        self.assertTrue(np.any(shared[1] != different[1]))
+
+    def test_single_precision(self):
+        imgs = np.random.rand(3, 512, 512) * 1000
+        plan64 = PolarTransformPlan((512, 512), center=self.center, angle=self.angle, lengths=self.lengths)
+        plan32 = PolarTransformPlan((512, 512), center=self.center, angle=self.angle, lengths=self.lengths,
+                                    dtype=np.float32)
+        polar32 = convert_stack(imgs, plan=plan32)
+        self.assertEqual(polar32.dtype, np.float32)
+        self.assertEqual(convert(imgs[0], plan=plan32).dtype, np.float32)
+        np.testing.assert_allclose(polar32, convert_stack(imgs, plan=plan64), rtol=1e-5)
+
+    def test_convert_processes(self):
+        imgs = np.ma.masked_array(np.random.rand(2, 5, 512, 512))
+        imgs.mask = np.zeros((2, 5, 512, 512), dtype=bool)
+        imgs.mask[:, :, 240:260, 0:256] = True
+        plan = PolarTransformPlan((512, 512), center=self.center, angle=self.angle, lengths=self.lengths)
+        polar, throughput = convert_processes(imgs, plan=plan, workers=2, chunk_size=3)
+        self.assertGreaterEqual(len(throughput), 1)
+        self.assertTrue(all(rate > 0 for rate in throughput.values()))
+        expected = convert_stack(imgs, plan=plan)
+        np.testing.assert_array_equal(polar.mask, expected.mask)
+        np.testing.assert_array_almost_equal(polar.data, expected.data)
+        with tempfile.TemporaryDirectory() as directory:
+            mapped = np.memmap(os.path.join(directory, "imgs.dat"), dtype=np.float64, mode="w+", shape=(10, 512, 512))
+            mapped[:] = np.reshape(imgs.data, (10, 512, 512))
+            polar, throughput = convert_processes(mapped, plan=plan, workers=2, chunk_size=3)
+            np.testing.assert_array_almost_equal(polar.data, np.reshape(convert_stack(imgs.data, plan=plan).data,
+                                                                        (10, *plan.output_shape)))
+            del mapped
+
+    def test_rebin(self):
+        x, y = np.meshgrid(np.arange(512), np.arange(512), indexing="ij")
+        img = np.sin(x / 30) + np.cos(y / 45) + 2
+        linear = convert(img, center=self.center, angle=self.angle, lengths=self.lengths, radius=[0, 200])
+        plan = PolarTransformPlan(np.shape(img), center=self.center, angle=self.angle, lengths=self.lengths,
+                                  radius=[0, 200], method="rebin", splitting=2)
+        rebinned = convert(img, plan=plan)
+        self.assertTrue(rebinned.mask[0].any())  # the center is over-sampled by the polar grid
+        self.assertFalse(rebinned.mask[100:150].any())  # larger rings can leave the detector
+        np.testing.assert_allclose(rebinned[100:150], linear[100:150], atol=0.05)
+
+    def test_binned_plan(self):
+        img = np.random.rand(512, 512)
+        for method in ["linear", "rebin"]:
+            plan = PolarTransformPlan(np.shape(img), center=self.center, angle=self.angle, lengths=self.lengths,
+                                      radius=[51, 150], method=method)
+            binned = PolarTransformPlan(np.shape(img), center=self.center, angle=self.angle, lengths=self.lengths,
+                                        radius=[51, 150], method=method, binning=2)
+            self.assertTupleEqual(binned.output_shape, (49, 360))
+            self.assertLess(binned.matrix.nnz, plan.matrix.nnz)
+            filled = bin_2d(~plan.empty, 2)  # the empty bins are left out of the binned mean
+            expected = bin_2d(np.ma.filled(convert(img, plan=plan), 0), 2) / np.where(filled > 0, filled, 1)
+            np.testing.assert_array_almost_equal(np.ma.filled(convert(img, plan=binned), 0)[:25], expected[:25])
+
+    def test_rebin_conserves_intensity(self):
+        img = np.random.rand(512, 512)
+        plan = PolarTransformPlan(np.shape(img), center=self.center, angle=self.angle, lengths=self.lengths,
+                                  radius=[0, 150], method="rebin")
+        polar = convert(img, plan=plan)
+        pixels_per_bin = np.reshape(plan.matrix.getnnz(axis=1), plan.output_shape)
+        used = np.unique(plan.matrix.nonzero()[1])
+        self.assertAlmostEqual(np.sum(polar.filled(0) * pixels_per_bin), np.sum(np.ravel(img)[used]))
+        stack = convert_stack(np.stack([img, img]), plan=plan)
+        np.testing.assert_array_equal(stack.mask[1], polar.mask)
+
+    def test_rebin_mask(self):
+        img = np.ma.masked_array(np.ones((512, 512)), mask=np.zeros((512, 512), dtype=bool))
+        img[::2, :] = -1000
+        img.mask[::2, :] = True  # every other row so the large bins keep some of their pixels
+        img[:, 300:] = -1000
+        img.mask[:, 300:] = True
+        plan = PolarTransformPlan(np.shape(img), center=self.center, angle=self.angle, lengths=self.lengths,
+                                  radius=[0, 200], method="rebin")
+        polar = convert(img, plan=plan)
+        unmasked = np.reshape(plan.matrix.dot(np.ravel(~img.mask)), plan.output_shape)
+        np.testing.assert_array_equal(polar.mask, (unmasked <= 0) | plan.empty)
+        self.assertTrue(np.any((unmasked > 0) & (unmasked < 1)))  # partly masked bins are kept
+        np.testing.assert_allclose(polar.compressed(), 1)  # the mean of the unmasked pixels
+        stack = np.ma.stack([img, np.ma.masked_array(np.ma.getdata(img), mask=False)])
+        polar_stack = convert_stack(stack, plan=plan, chunk_size=1)
+        np.testing.assert_array_equal(polar_stack.mask[0], polar.mask)
+        np.testing.assert_allclose(polar_stack[0].compressed(), 1)
+        np.testing.assert_array_equal(polar_stack.mask[1], plan.empty)
+        np.testing.assert_array_equal(convert_mask(stack.mask, plan=plan), polar_stack.mask)
@@ -1,6 +1,6 @@
 from unittest import TestCase
 import numpy as np
-from empyer.misc.ecm import ecm
+from empyer.misc.ecm import ecm, ecm_stack
 
 
 class TestECM(TestCase):
@@ -14,3 +14,10 @@ class TestECM(TestCase):
         i = ecm(self.test_series1)
         self.assertListEqual(list(np.array(i, dtype=int)), list(np.ones(1000)))
         i2 = np.array(ecm(self.test_series2), dtype=int)
+
+    def test_ecm_stack(self):
+        series = np.random.poisson(5, size=(50, 4, 6)).astype(float)
+        correlation = ecm_stack(series, chunk_size=5)
+        for i, j in [(0, 0), (3, 5)]:
+            np.testing.assert_allclose(correlation[:, i, j], ecm(series[:, i, j]))
+        np.testing.assert_allclose(ecm_stack(np.moveaxis(series, 0, -1), axis=-1), np.moveaxis(correlation, 0, -1))
@@ -0,0 +1,90 @@
+from unittest import TestCase
+import tracemalloc
+import numpy as np
+import dask.array as da
+from empyer.misc.fem import fem, annular_statistics, FEMAccumulator, variable_resolution_fem
+
+
+class TestFEM(TestCase):
+    def setUp(self):
+        self.imgs = np.random.poisson(50, size=(30, 20, 90)).astype(float) + 1e6  # large mean, small variance
+        self.mask = np.zeros(self.imgs.shape, dtype=bool)
+        self.mask[:, 0:5, 10:40] = True
+
+    def test_fem(self):
+        annular_mean = self.imgs.mean(axis=-1)
+        # <A^2>/<A>^2 - 1 written as var(A)/<A>^2 so the reference doesn't lose precision either
+        annular_variance = np.var(annular_mean, axis=0) / np.mean(annular_mean, axis=0)**2
+        ring_variance = np.mean(np.var(self.imgs, axis=-1) / annular_mean**2, axis=0)
+        # 'omega' has always been the mean ring variance here and 'rings' the variance of the annular means
+        np.testing.assert_allclose(fem(self.imgs, version="omega", cut=0), ring_variance, rtol=1e-8)
+        np.testing.assert_allclose(fem(self.imgs, version="rings", cut=0), annular_variance, rtol=1e-8)
+        np.testing.assert_allclose(fem(self.imgs, version="ring_variance", cut=0), ring_variance, rtol=1e-8)
+        np.testing.assert_allclose(fem(self.imgs, version="annular_variance", cut=0), annular_variance, rtol=1e-8)
+        accumulator = FEMAccumulator()
+        accumulator.add(self.imgs)
+        omega = -np.var(annular_mean, axis=0) / np.mean(annular_mean**2, axis=0)  # <A>^2/<A^2> - 1
+        np.testing.assert_allclose(accumulator.fem("omega"), omega, rtol=1e-8)
+        self.assertEqual(len(fem(self.imgs, cut=4)), 16)
+        with self.assertRaises(ValueError):
+            fem(self.imgs, version="ring")
+
+    def test_chunks(self):
+        masked = np.ma.masked_array(self.imgs, mask=self.mask)
+        masked[3, 7, 5] = np.nan
+        whole = FEMAccumulator()
+        whole.add(masked)
+        chunked = FEMAccumulator()
+        for start in range(0, 30, 7):
+            chunked.add(masked[start:start + 7])
+        np.testing.assert_allclose(chunked.annular_variance(), whole.annular_variance(), rtol=1e-8)
+        np.testing.assert_allclose(chunked.ring_variance(), whole.ring_variance(), rtol=1e-8)
+        annular_mean, ring_variance = annular_statistics(masked)
+        self.assertAlmostEqual(annular_mean[0, 2], np.mean(self.imgs[0, 2][self.mask[0, 2] == 0]))
+        self.assertFalse(np.isnan(annular_mean[3, 7]))
+        fully_masked = annular_statistics(self.imgs, mask=np.ones(self.imgs.shape, dtype=bool))[0]
+        self.assertTrue(np.all(np.isnan(fully_masked)))
+
+    def test_groups(self):
+        labels = np.arange(30) % 4 - 1  # group -1 is left out
+        grouped = FEMAccumulator(n_groups=3)
+        for start in range(0, 30, 7):
+            grouped.add(self.imgs[start:start + 7], labels=labels[start:start + 7])
+        self.assertEqual(grouped.annular_variance().shape, (3, 20))
+        for group in range(3):
+            np.testing.assert_allclose(grouped.annular_variance()[group],
+                                       fem(self.imgs[labels == group], version="annular_variance", cut=0), rtol=1e-8)
+            np.testing.assert_allclose(grouped.ring_variance()[group],
+                                       fem(self.imgs[labels == group], version="ring_variance", cut=0), rtol=1e-8)
+
+    def test_variable_resolution(self):
+        grid = np.reshape(self.imgs[:24], (4, 6, 20, 90))
+        vr_fem = variable_resolution_fem(grid, window_sizes=[1, 2, 3], version="annular_variance", chunk_size=5)
+        self.assertEqual(vr_fem.shape, (3, 20))
+        np.testing.assert_allclose(vr_fem[0], fem(self.imgs[:24], version="annular_variance", cut=0), rtol=1e-6)
+        binned = np.sum(np.reshape(grid, (2, 2, 3, 2, 20, 90)), axis=(1, 3))
+        np.testing.assert_allclose(vr_fem[1], fem(np.reshape(binned, (-1, 20, 90)), version="annular_variance", cut=0),
+                                   rtol=1e-6)
+        masked = np.ma.masked_array(grid, mask=False)
+        masked[1, 1, 4, :10] = np.ma.masked
+        overlapping = variable_resolution_fem(masked, window_sizes=[2], version="ring_variance", step=1)
+        windows = np.array([np.sum(grid[y:y + 2, x:x + 2], axis=(0, 1)) for y in range(3) for x in range(5)])
+        window_mask = np.array([np.any(np.ma.getmaskarray(masked)[y:y + 2, x:x + 2], axis=(0, 1))
+                                for y in range(3) for x in range(5)])
+        np.testing.assert_allclose(overlapping[0],
+                                   fem(np.ma.masked_array(windows, mask=window_mask), version="ring_variance", cut=0),
+                                   rtol=1e-6)
+        lazy = da.ma.masked_array(da.from_array(grid, chunks=(1, 3, 20, 90)), mask=np.ma.getmaskarray(masked))
+        np.testing.assert_allclose(variable_resolution_fem(lazy, window_sizes=[2], version="ring_variance", step=1),
+                                   overlapping, rtol=1e-8)
+        np.testing.assert_allclose(variable_resolution_fem(grid.astype(np.float32), window_sizes=[1, 2, 3],
+                                                           version="annular_variance", chunk_size=5),
+                                   vr_fem, rtol=1e-4)
+
+    def test_variable_resolution_memory(self):
+        grid = np.random.poisson(50, size=(64, 16, 20, 90)).astype(float)
+        tracemalloc.start()
+        variable_resolution_fem(grid, window_sizes=[1, 2, 4, 8], chunk_size=16)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.assertLess(peak, grid.nbytes / 3)  # the table is kept a few rows at a time
@@ -0,0 +1,59 @@
+from unittest import TestCase, skipIf
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from empyer.misc import fft_backend
+from empyer.misc.angular_correlation import angular_correlation_stack, power_spectrum
+from empyer.misc.ecm import ecm
+
+
+class TestFFTBackend(TestCase):
+    def setUp(self):
+        self.stack = np.random.rand(4, 20, 90)
+        self.mask = np.zeros((20, 90), dtype=bool)
+        self.mask[0:10, 20:40] = True
+
+    def tearDown(self):
+        fft_backend.set_backend("scipy")
+
+    def test_backends_agree(self):
+        ac = angular_correlation_stack(self.stack, mask=self.mask, backend="scipy")
+        for name in fft_backend.BACKENDS:
+            np.testing.assert_allclose(angular_correlation_stack(self.stack, mask=self.mask, backend=name), ac,
+                                       atol=1e-10)
+            np.testing.assert_allclose(power_spectrum(ac, backend=name), power_spectrum(ac), rtol=1e-8)
+            np.testing.assert_allclose(ecm(self.stack[0, 0], backend=name), ecm(self.stack[0, 0]), rtol=1e-10)
+
+    def test_set_backend(self):
+        fft_backend.set_backend("numpy")
+        self.assertEqual(fft_backend.get_backend(), ("numpy", -1))
+        ac32 = angular_correlation_stack(self.stack, mask=self.mask, dtype=np.float32)
+        self.assertEqual(ac32.dtype, np.float32)
+        with self.assertRaises(ValueError):
+            fft_backend.set_backend("fftpack")
+
+    def test_threads(self):
+        self.assertEqual(fft_backend._resolve("scipy"), ("scipy", -1))
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            self.assertEqual(executor.submit(fft_backend._resolve, "scipy").result(), ("scipy", 1))
+            for name in fft_backend.BACKENDS:
+                expected = angular_correlation_stack(self.stack, backend=name)
+                results = executor.map(lambda stack: angular_correlation_stack(stack, backend=name),
+                                       [self.stack + 0 for i in range(8)])
+                for result in results:
+                    np.testing.assert_allclose(result, expected, atol=1e-10)
+
+    @skipIf(fft_backend.pyfftw is None, "pyfftw isn't installed")
+    def test_pyfftw_threads(self):
+        fft_backend.set_backend("pyfftw", workers=-1)
+        fft_backend._local.plans = {}
+        angular_correlation_stack(self.stack)
+        self.assertTrue(fft_backend._local.plans)
+        for key in fft_backend._local.plans:
+            self.assertEqual(key[-1], os.cpu_count())  # -1 uses all of the cores on the main thread
+
+    def test_benchmark(self):
+        times = fft_backend.benchmark(shape=(200, 720), n_patterns=8, repeat=2)
+        self.assertIn("numpy", times)
+        self.assertIn("scipy", times)
+        self.assertTrue(all(seconds > 0 for seconds in times.values()))
@@ -0,0 +1,56 @@
+from unittest import TestCase
+import numpy as np
+import time
+from empyer.misc.radial_profile import RadialProfilePlan, radial_profile, elliptical_radius
+from empyer.misc.cartesain_to_polar import PolarTransformPlan, convert_stack
+
+
+class TestRadialProfile(TestCase):
+    def setUp(self):
+        self.center = [130, 120]
+        self.lengths = [110, 90]
+        self.angle = 0.4
+        x, y = np.mgrid[:256, :256]
+        self.r = elliptical_radius(x, y, self.center, lengths=self.lengths, angle=self.angle)
+        self.img = np.sin(self.r/7) + 2
+        self.expected = np.sin(np.arange(100)/7) + 2
+
+    def test_profile(self):
+        plan = RadialProfilePlan((256, 256), center=self.center, angle=self.angle, lengths=self.lengths,
+                                 radius=[0, 100])
+        np.testing.assert_allclose(radial_profile(self.img, plan)[2:], self.expected[2:], atol=.02)
+
+    def test_splitting(self):
+        plan = RadialProfilePlan((256, 256), center=self.center, angle=self.angle, lengths=self.lengths,
+                                 radius=[10, 100], splitting=3)
+        np.testing.assert_allclose(radial_profile(self.img, plan), self.expected[10:], atol=.02)
+
+    def test_masked_profile(self):
+        imgs = np.ma.masked_array(np.repeat(self.img[np.newaxis], 4, axis=0))
+        imgs.mask = np.zeros(imgs.shape, dtype=bool)
+        imgs[:, :, 0:120] = -1000
+        imgs.mask[:, :, 0:120] = True
+        imgs.mask[1, 130:, :] = True
+        plan = RadialProfilePlan((256, 256), center=self.center, angle=self.angle, lengths=self.lengths,
+                                 radius=[0, 100])
+        profile = radial_profile(imgs, plan)
+        self.assertTupleEqual(np.shape(profile), (4, 100))
+        self.assertTrue(profile.mask[1, 0])  # the center is masked for pattern 1
+        np.testing.assert_allclose(profile[0, 2:], self.expected[2:], atol=.02)
+
+    def test_faster_than_polar(self):
+        imgs = np.random.rand(200, 256, 256)
+        plan = RadialProfilePlan((256, 256), center=self.center, angle=self.angle, lengths=self.lengths,
+                                 radius=[0, 100])
+        polar_plan = PolarTransformPlan((256, 256), center=self.center, angle=self.angle, lengths=self.lengths,
+                                        radius=[0, 100])
+        radial_time = []
+        polar_time = []
+        for i in range(3):  # the best of a few runs so a stall doesn't decide the test
+            start = time.time()
+            radial_profile(imgs, plan)
+            radial_time.append(time.time() - start)
+            start = time.time()
+            convert_stack(imgs, plan=polar_plan).mean(axis=-1)
+            polar_time.append(time.time() - start)
+        self.assertLess(1.5 * min(radial_time), min(polar_time))
@@ -3,8 +3,10 @@ import numpy as np
 
 from hyperspy.signals import Signal2D, BaseSignal
 from empyer.signals.diffraction_signal import DiffractionSignal, LazyDiffractionSignal
+from empyer.signals.polar_signal import LazyPolarSignal
 import matplotlib.pyplot as plt
-from empyer.misc.image import random_ellipse
+from empyer.misc.image import random_ellipse, bin_2d
+from empyer.misc.ecm import ecm
 import time
 
 
@@ -55,6 +57,89 @@ class TestDiffractionSignal(TestCase):
         self.assertAlmostEqual(self.ds.metadata.Signal.Ellipticity.angle, self.angle, places=1)
         self.assertLess((converted.sum(axis=(0, 1)).data > 5000).sum(), 10)
 
+    def test_sparse_conversion(self):
+        self.ds.determine_ellipse()
+        mapped = self.ds.calculate_polar_spectrum(phase_width=720, radius=[0, 200], engine="map")
+        sparse = self.ds.calculate_polar_spectrum(phase_width=720, radius=[0, 200], engine="sparse")
+        np.testing.assert_array_almost_equal(mapped.data, sparse.data)
+
+    def test_process_conversion(self):
+        self.ds.determine_ellipse()
+        sparse = self.ds.calculate_polar_spectrum(phase_width=720, radius=[0, 200], engine="sparse")
+        processes = self.ds.calculate_polar_spectrum(phase_width=720, radius=[0, 200], engine="processes", workers=2)
+        np.testing.assert_array_almost_equal(sparse.data, processes.data)
+        self.assertGreaterEqual(len(processes.metadata.Signal.conversion_throughput), 1)
+
+    def test_rebin_conversion(self):
+        self.ds.determine_ellipse()
+        rebinned = self.ds.calculate_polar_spectrum(phase_width=720, radius=[0, 200], method="rebin", splitting=2)
+        sparse = self.ds.calculate_polar_spectrum(phase_width=720, radius=[0, 200], engine="sparse",
+                                                  method="rebin", splitting=2)
+        self.assertTrue(rebinned.data.mask.any())
+        np.testing.assert_array_equal(rebinned.data.mask, sparse.data.mask)
+        np.testing.assert_array_almost_equal(rebinned.data, sparse.data)
+
+    def test_rebin_faster_than_linear(self):
+        self.ds.determine_ellipse()
+        rebin_time = []
+        linear_time = []
+        for i in range(3):  # the best of a few runs so a stall doesn't decide the test
+            start = time.time()
+            self.ds.calculate_polar_spectrum(phase_width=720, radius=[0, 200], engine="sparse", method="rebin")
+            rebin_time.append(time.time() - start)
+            start = time.time()
+            self.ds.calculate_polar_spectrum(phase_width=720, radius=[0, 200], engine="sparse", method="linear")
+            linear_time.append(time.time() - start)
+        self.assertLess(min(rebin_time), min(linear_time))
+
+    def test_radial_profile(self):
+        self.ds.determine_ellipse()
+        self.ds.mask_below(.1)
+        profile = self.ds.get_radial_profile(radius=[0, 200])
+        self.assertTupleEqual(profile.data.shape, (10, 10, 200))
+        polar = self.ds.calculate_polar_spectrum(phase_width=720, radius=[0, 200], engine="sparse")
+        polar_profile = polar.data.mean(axis=-1)
+        self.assertAlmostEqual(np.argmax(profile.data.mean(axis=(0, 1))), np.argmax(polar_profile.mean(axis=(0, 1))),
+                               delta=1)
+        np.testing.assert_allclose(profile.data[:, :, 10:].mean(axis=-1), polar_profile[:, :, 10:].mean(axis=-1),
+                                   atol=.05)
+
+    def test_early_cut_binning(self):
+        self.ds.determine_ellipse()
+        full = self.ds.calculate_polar_spectrum(phase_width=720, radius=[0, 200], engine="sparse")
+        ac = full.autocorrelation(binning_factor=2, cut=40)
+        early = self.ds.calculate_polar_spectrum(phase_width=720, radius=[0, 200], engine="sparse", binning_factor=2,
+                                                 cut=40)
+        early_ac = early.autocorrelation()
+        self.assertTupleEqual(early.data.shape, (10, 10, 80, 360))
+        np.testing.assert_array_almost_equal(early.data, bin_2d(full.data[:, :, 40:, :], 2))
+        np.testing.assert_array_almost_equal(early_ac.data, ac.data)
+        self.assertAlmostEqual(early_ac.axes_manager[-1].offset, ac.axes_manager[-1].offset)
+        self.assertAlmostEqual(early_ac.axes_manager[-1].scale, ac.axes_manager[-1].scale)
+
+    def test_variable_resolution_fem(self):
+        self.ds.determine_ellipse()
+        vr_fem = self.ds.variable_resolution_fem(window_sizes=[1, 2, 5], phase_width=360, radius=[0, 100])
+        binned = self.ds.rebin(scale=(2, 2, 1, 1))
+        binned.metadata.set_item("Signal.Ellipticity", self.ds.metadata.Signal.Ellipticity.as_dictionary())
+        expected = binned.calculate_polar_spectrum(phase_width=360, radius=[0, 100], engine="sparse").fem()
+        self.assertEqual(vr_fem.axes_manager.navigation_shape, (3,))
+        np.testing.assert_allclose(vr_fem.inav[1].data, expected.data, rtol=1e-6)
+
+    def test_lazy_conversion(self):
+        self.ds.determine_ellipse()
+        lazy = self.ds.as_lazy()
+        for item in ["center", "angle", "lengths", "calibrated"]:
+            lazy.metadata.set_item("Signal.Ellipticity." + item, self.ds.metadata.Signal.Ellipticity[item])
+        lazy.mask_below(.1)
+        self.ds.mask_below(.1)
+        converted = lazy.calculate_polar_spectrum(phase_width=720, radius=[0, 200])
+        self.assertIsInstance(converted, LazyPolarSignal)
+        expected = self.ds.calculate_polar_spectrum(phase_width=720, radius=[0, 200], engine="sparse")
+        computed = converted.data.compute()
+        np.testing.assert_array_equal(computed.mask, expected.data.mask)
+        np.testing.assert_array_almost_equal(computed.filled(0), expected.data.filled(0))
+
     def test_conversion_and_mask(self):
         self.ds.masig[240:260, 0:256] = True
         converted = self.ds.calculate_polar_spectrum(phase_width=720,
@@ -102,10 +187,47 @@ class TestSegmentedDiffractionSignal(TestCase):
         ps.inav[1, 1].plot()
         plt.show()
 
+    def test_seg_grouped(self):
+        ps = self.ds.calculate_polar_spectrum(segments=5, num_points=120, radius=[0, 80])
+        parallel = self.ds.calculate_polar_spectrum(segments=5, num_points=120, radius=[0, 80], parallel=True)
+        np.testing.assert_array_almost_equal(ps.data, parallel.data)
+        lazy = self.ds.as_lazy().calculate_polar_spectrum(segments=5, num_points=120, radius=[0, 80])
+        self.assertIsInstance(lazy, LazyPolarSignal)
+        np.testing.assert_array_almost_equal(lazy.data.compute(), ps.data)
+
     def test_lazy(self):
         lazy = self.ds.as_lazy()
         self.assertIsInstance(lazy, LazyDiffractionSignal)
         lazy.determine_ellipse()
         lazy.mask_below(10)
         lazy.manav[2:4,1].mask_below(10)
-        lazy.calculate_polar_spectrum()
\ No newline at end of file
+        lazy.calculate_polar_spectrum()
+
+class TestECM(TestCase):
+    def setUp(self):
+        d = np.random.poisson(5, size=(64, 2, 3, 32, 32)).astype(float)  # (t, y, x, ky, kx)
+        self.ds = DiffractionSignal(d)
+        self.ds.metadata.set_item("Signal.Ellipticity.center", [16, 16])
+        self.ds.metadata.set_item("Signal.Ellipticity.angle", 0)
+        self.ds.metadata.set_item("Signal.Ellipticity.lengths", [10, 10])
+        self.ds.metadata.set_item("Signal.Ellipticity.calibrated", True)
+
+    def test_ecm(self):
+        correlation = self.ds.get_ecm()
+        self.assertTupleEqual(correlation.data.shape, self.ds.data.shape)
+        self.assertEqual(correlation.axes_manager.navigation_axes[-1].name, "tau")
+        np.testing.assert_allclose(correlation.data[:, 1, 2, 5, 7], ecm(self.ds.data[:, 1, 2, 5, 7]))
+        by_name = self.ds.get_ecm(time_axis=2, chunk_size=100)
+        np.testing.assert_allclose(by_name.data, correlation.data)
+
+    def test_ring_average(self):
+        lazy = self.ds.as_lazy()
+        lazy.metadata.set_item("Signal.Ellipticity", self.ds.metadata.Signal.Ellipticity.as_dictionary())
+        self.ds.mask_below(1)
+        lazy.mask_below(1)
+        rings = self.ds.get_ecm(ring_average=True, radius=[0, 12])
+        self.assertTupleEqual(rings.data.shape, (64, 2, 3, 12))
+        correlation = self.ds.get_ecm()
+        np.testing.assert_allclose(rings.data, correlation.get_radial_profile(radius=[0, 12]).data)
+        lazy_rings = lazy.get_ecm(ring_average=True, radius=[0, 12])
+        np.testing.assert_allclose(lazy_rings.data.compute(), rings.data)
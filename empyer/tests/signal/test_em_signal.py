@@ -82,3 +82,34 @@ class TestEMSignal(TestCase):
         print(lazy)
 
 
+
+    def assert_lazy_mask(self, write):
+        lazy = self.ds.as_lazy()
+        write(self.ds)
+        write(lazy)
+        np.testing.assert_array_equal(np.ma.getmaskarray(lazy.data.compute()), np.ma.getmaskarray(self.ds.data))
+
+    def test_lazy_mask_border(self):
+        self.assert_lazy_mask(lambda s: s.mask_border(pixels=2))
+
+    def test_lazy_mask_circle(self):
+        self.assert_lazy_mask(lambda s: s.mask_circle(center=(5, 5), radius=3))
+
+    def test_lazy_mask_slicing(self):
+        def write(s):
+            s.manav[:, 1].masig[2:5, 3:10] = True
+            s.masig[0:2, 0:1] = True
+        self.assert_lazy_mask(write)
+
+    def test_lazy_slice_mask_below(self):
+        self.assert_lazy_mask(lambda s: s.manav[0:2, 1].masig[1:2, :].mask_below(.5))
+
+    def test_lazy_slice_mask_above(self):
+        self.assert_lazy_mask(lambda s: s.manav[0:2, 0:2].mask_above(.5))
+
+    def test_lazy_slice_mask_where(self):
+        condition = self.ds.inav[0:2, 0:2].isig[1:5, :].data == 10
+        self.assert_lazy_mask(lambda s: s.manav[0:2, 0:2].masig[1:5, :].mask_where(condition))
+
+    def test_lazy_slice_mask_circle(self):
+        self.assert_lazy_mask(lambda s: s.manav[0:2, 0:2].mask_circle(center=(5, 5), radius=3))
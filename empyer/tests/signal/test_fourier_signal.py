@@ -0,0 +1,58 @@
+from unittest import TestCase
+from unittest.mock import patch
+import numpy as np
+import dask
+import dask.array as da
+import matplotlib.pyplot as plt
+from empyer.signals import polar_signal
+from empyer.signals.polar_signal import PolarSignal
+from empyer.signals.fourier_signal import FourierSignal, LazyFourierSignal
+from empyer.tests.utils import CountingArray
+
+
+class TestFourierSignal(TestCase):
+    def setUp(self):
+        theta = np.arange(360) * 2 * np.pi / 360
+        self.orientations = np.random.rand(4, 5) * np.pi / 3
+        d = np.ones(shape=(4, 5, 20, 360))
+        d[:, :, 8:12, :] += np.cos(6 * (theta - self.orientations[:, :, np.newaxis, np.newaxis]))
+        self.ps = PolarSignal(d)
+        self.ps.set_axes(3,
+                         name="k",
+                         scale=.5,
+                         units='nm^-1')
+
+    def test_autocorrelation_orders(self):
+        ac, fourier = self.ps.autocorrelation(orders=[2, 4, 6])
+        self.assertIsInstance(fourier, FourierSignal)
+        self.assertTupleEqual(fourier.data.shape, (4, 5, 20, 3))
+        np.testing.assert_array_almost_equal(ac.data, self.ps.autocorrelation().data)
+        np.testing.assert_array_almost_equal(np.abs(fourier.data[:, :, 10, 2]), .5)
+        np.testing.assert_array_almost_equal(np.abs(fourier.data[:, :, 10, 0]), 0)
+
+    def test_orientation_map(self):
+        ac, fourier = self.ps.autocorrelation(orders=[2, 4, 6])
+        orientation = fourier.get_orientation_map(6, k_region=[4.0, 6.0])
+        np.testing.assert_array_almost_equal(orientation.data, self.orientations)
+        magnitude = fourier.get_magnitude_map(6, k_region=[4.0, 6.0])
+        np.testing.assert_array_almost_equal(magnitude.data, np.ones((4, 5)) * 2)
+        fourier.plot_orientation_map(6, k_region=[4.0, 6.0])
+        plt.close()
+
+    def test_lazy(self):
+        ac, fourier = self.ps.as_lazy().autocorrelation(orders=[6])
+        self.assertIsInstance(fourier, LazyFourierSignal)
+        expected_ac, expected = self.ps.autocorrelation(orders=[6])
+        np.testing.assert_array_almost_equal(fourier.data.compute(), expected.data)
+        counting = CountingArray(self.ps.data)
+        lazy = self.ps.as_lazy()
+        lazy.data = da.from_array(counting, chunks=(2, 5, 20, 360))
+        with patch.object(polar_signal, "angular_correlation_stack",
+                          wraps=polar_signal.angular_correlation_stack) as correlate:
+            ac, fourier = lazy.autocorrelation(orders=[6])
+            ac, fourier = dask.compute(ac.data, fourier.data)
+        # the correlation and the coefficients come from one read and one transform of each block
+        self.assertEqual(counting.reads, 2)
+        self.assertEqual(correlate.call_count, 2)
+        np.testing.assert_array_almost_equal(ac, expected_ac.data)
+        np.testing.assert_array_almost_equal(fourier, expected.data)
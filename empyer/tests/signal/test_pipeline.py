@@ -0,0 +1,108 @@
+from unittest import TestCase
+import os
+import tempfile
+import numpy as np
+import dask.array as da
+
+from hyperspy.signals import Signal2D
+from hyperspy.io import load
+from empyer.signals.diffraction_signal import DiffractionSignal
+from empyer.signals.polar_signal import PolarSignal
+from empyer.signals.power_signal import PowerSignal
+from empyer.signals.fourier_signal import FourierSignal
+from empyer.misc.angular_correlation import angular_correlation, power_spectrum
+from empyer.misc.image import random_ellipse
+from empyer import pipeline
+from empyer.tests.utils import CountingArray
+
+
+class TestPipeline(TestCase):
+    def setUp(self):
+        d = np.random.rand(4, 5, 256, 256)
+        center = [130, 128]
+        lengths = sorted(np.random.rand(2) * 20 + 60, reverse=True)
+        angle = np.random.rand() * np.pi
+        rand_points = random_ellipse(num_points=1000, center=center, foci=lengths, angle=angle)
+        d[:, :, rand_points[:, 0], rand_points[:, 1]] = 10
+        self.ds = DiffractionSignal(Signal2D(d))
+        self.ds.determine_ellipse()
+
+    def test_stages(self):
+        self.ds.mask_below(.1)
+        signals = pipeline.run(self.ds, stages=("polar", "power"), chunk_size=7, phase_width=360, radius=[0, 100])
+        self.assertSetEqual(set(signals), {"polar", "power"})
+        self.assertIsInstance(signals["polar"], PolarSignal)
+        self.assertIsInstance(signals["power"], PowerSignal)
+        expected = self.ds.calculate_polar_spectrum(phase_width=360, radius=[0, 100], engine="sparse")
+        np.testing.assert_array_equal(signals["polar"].data.mask, expected.data.mask)
+        np.testing.assert_array_almost_equal(signals["polar"].data, expected.data)
+        polar = expected.data[1, 3]
+        power = power_spectrum(angular_correlation(polar.data, mask=polar.mask))
+        self.assertTupleEqual(signals["power"].data.shape, (4, 5, 100, 360))
+        np.testing.assert_array_almost_equal(signals["power"].data[1, 3], power)
+
+    def test_lazy(self):
+        lazy = self.ds.as_lazy()
+        for item in ["center", "angle", "lengths", "calibrated"]:
+            lazy.metadata.set_item("Signal.Ellipticity." + item, self.ds.metadata.Signal.Ellipticity[item])
+        lazy.mask_below(.1)
+        self.ds.mask_below(.1)
+        computed = pipeline.run(lazy, stages=("correlation",), chunk_size=3, phase_width=360, radius=[0, 100],
+                                cut=10)
+        expected = pipeline.run(self.ds, stages=("correlation",), phase_width=360, radius=[0, 100],
+                                cut=10)
+        self.assertTupleEqual(computed["correlation"].data.shape, (4, 5, 90, 360))
+        np.testing.assert_array_almost_equal(computed["correlation"].data, expected["correlation"].data)
+
+    def test_coefficients(self):
+        signals = pipeline.run(self.ds, stages=("power", "coefficients"), phase_width=360, radius=[0, 100],
+                               orders=[2, 6])
+        self.assertIsInstance(signals["coefficients"], FourierSignal)
+        self.assertTupleEqual(signals["coefficients"].data.shape, (4, 5, 100, 2))
+        polar = self.ds.calculate_polar_spectrum(phase_width=360, radius=[0, 100], engine="sparse")
+        expected = polar.autocorrelation(orders=[2, 6])[1]
+        np.testing.assert_array_almost_equal(signals["coefficients"].data, expected.data)
+
+    def test_summed_power(self):
+        self.ds.mask_below(.1)
+        signals = pipeline.run(self.ds, stages=("correlation", "summed_power"), chunk_size=6, phase_width=360,
+                               radius=[0, 100], binning_factor=2, half=True)
+        self.assertSetEqual(set(signals), {"correlation", "summed_power", "summed_power_variance"})
+        expected = power_spectrum(np.sum(signals["correlation"].data, axis=(0, 1)), half=True, n=180)
+        np.testing.assert_allclose(signals["summed_power"].data, expected, atol=1e-10*np.max(expected))
+        self.assertTupleEqual(signals["summed_power_variance"].data.shape, (50, 91))
+
+    def test_file_streaming(self):
+        self.ds.mask_below(.1)
+        expected = pipeline.run(self.ds, stages=("polar", "power", "summed_power"), chunk_size=7, phase_width=360,
+                                radius=[0, 100])
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "streamed")
+            streamed = pipeline.run(self.ds, stages=("polar", "power", "summed_power"), chunk_size=7,
+                                    phase_width=360, radius=[0, 100], file_name=file_name)
+            self.assertTrue(streamed["polar"]._lazy)
+            polar = streamed["polar"].data.compute()
+            np.testing.assert_array_equal(polar.mask, expected["polar"].data.mask)
+            np.testing.assert_array_almost_equal(polar.data, expected["polar"].data.data)
+            np.testing.assert_array_almost_equal(streamed["power"].data.compute(), expected["power"].data)
+            self.assertEqual(streamed["power"].axes_manager[-1].scale, expected["power"].axes_manager[-1].scale)
+            loaded = load(file_name + "_angularPower.hdf5")
+            np.testing.assert_array_almost_equal(loaded.data, expected["power"].data)
+            self.assertTrue(os.path.isfile(file_name + "_summedPower.hdf5"))
+
+    def test_lazy_reads(self):
+        counting = CountingArray(self.ds.data)
+        lazy = self.ds.as_lazy()
+        lazy.data = da.from_array(counting, chunks=(2, 2, 256, 256))
+        for item in ["center", "angle", "lengths", "calibrated"]:
+            lazy.metadata.set_item("Signal.Ellipticity." + item, self.ds.metadata.Signal.Ellipticity[item])
+        power = pipeline.run(lazy, stages=("power",), chunk_size=3, phase_width=360, radius=[0, 100])["power"]
+        self.assertEqual(counting.reads, 6)  # every block is read once
+        self.assertEqual(counting.largest, 2 * 2 * 256 * 256)  # and never more than one block at once
+        expected = pipeline.run(self.ds, stages=("power",), chunk_size=3, phase_width=360, radius=[0, 100])
+        np.testing.assert_array_almost_equal(power.data, expected["power"].data)
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, "streamed")
+            streamed = pipeline.run(lazy, stages=("power",), chunk_size=3, phase_width=360, radius=[0, 100],
+                                    file_name=file_name)
+            np.testing.assert_array_almost_equal(streamed["power"].data.compute(), expected["power"].data)
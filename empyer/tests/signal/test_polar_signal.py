@@ -3,6 +3,10 @@ import numpy as np
 import matplotlib.pyplot as plt
 from hyperspy.signals import Signal2D, BaseSignal
 from empyer.signals.diffraction_signal import PolarSignal
+from hyperspy.utils import stack
+import dask.array as da
+from empyer.signals.correlation_signal import LazyCorrelationSignal
+from empyer.tests.utils import CountingArray
 
 
 class TestPolarSignal(TestCase):
@@ -23,6 +27,115 @@ class TestPolarSignal(TestCase):
         self.assertGreater(ac.data[1, 1, 5, 30], 17)
         self.assertLess(ac.data[1, 1, 5, 29], .1)
 
+    def test_autocorrelation_single_precision(self):
+        ac = self.ps.autocorrelation(dtype=np.float32)
+        self.assertEqual(ac.data.dtype, np.float32)
+        np.testing.assert_allclose(ac.data, self.ps.autocorrelation().data, atol=1e-4)
+        power = ac.get_power_spectrum(dtype=np.float32)
+        self.assertEqual(power.data.dtype, np.float32)
+
+    def test_lazy_autocorrelation(self):
+        lazy = self.ps.as_lazy()
+        lazy.mask_below(value=40)
+        self.ps.mask_below(value=40)
+        ac = lazy.autocorrelation(binning_factor=2, cut=2, dtype=np.float32)
+        self.assertEqual(ac.data.dtype, np.float32)
+        expected = self.ps.autocorrelation(binning_factor=2, cut=2)
+        np.testing.assert_allclose(ac.data.compute(), expected.data, atol=1e-4)
+
+    def test_half_autocorrelation(self):
+        ac = self.ps.autocorrelation()
+        half = self.ps.autocorrelation(half=True)
+        self.assertTupleEqual(half.data.shape, (5, 5, 20, 46))
+        np.testing.assert_array_almost_equal(half.data, ac.data[:, :, :, :46])
+        power = half.get_power_spectrum(half=True)
+        self.assertTupleEqual(power.data.shape, (5, 5, 20, 46))
+        np.testing.assert_array_almost_equal(power.data, ac.get_power_spectrum().data[:, :, :, :46])
+        np.testing.assert_array_almost_equal(half.get_power_spectrum().data, ac.get_power_spectrum().data)
+
+    def test_symmetry_spectrum(self):
+        symmetry = self.ps.get_symmetry_spectrum(orders=[2, 3, 4])
+        self.assertTupleEqual(symmetry.data.shape, (5, 5, 20, 3))
+        power = self.ps.autocorrelation().get_power_spectrum()
+        np.testing.assert_allclose(symmetry.data, power.data[:, :, :, 2:5], rtol=1e-6, atol=1e-9)
+        np.testing.assert_array_almost_equal(symmetry.get_map(k_region=[5, 6], symmetry=3).data,
+                                             power.get_map(k_region=[5, 6], symmetry=3).data)
+
+    def test_summed_power_spectrum(self):
+        self.ps.data = self.ps.data + np.random.rand(5, 5, 20, 90)
+        lazy = self.ps.as_lazy()
+        summed, variance = self.ps.get_summed_power_spectrum(binning_factor=2, cut=2, chunk_size=7,
+                                                             return_variance=True)
+        expected = self.ps.autocorrelation(binning_factor=2, cut=2).get_summed_power_spectrum()
+        self.assertTupleEqual(summed.data.shape, (9, 45))
+        np.testing.assert_allclose(summed.data, expected.data, atol=1e-10*np.max(expected.data))
+        self.assertEqual(summed.axes_manager[-1].offset, expected.axes_manager[-1].offset)
+        self.assertTrue(np.all(variance.data >= 0))
+        np.testing.assert_allclose(lazy.get_summed_power_spectrum(binning_factor=2, cut=2).data, summed.data)
+
+    def test_summed_power_spectrum_reads(self):
+        counting = CountingArray(np.random.rand(40, 40, 20, 90))
+        lazy = PolarSignal(counting.array).as_lazy()
+        lazy.data = da.from_array(counting, chunks=(20, 20, 20, 90))
+        lazy.get_summed_power_spectrum(chunk_size=32)
+        self.assertEqual(counting.reads, 4)  # every block is read once
+        self.assertEqual(counting.largest, 20 * 20 * 20 * 90)  # and never more than one block at once
+        counting.reads = 0
+        correlation = LazyCorrelationSignal(da.from_array(counting, chunks=(20, 20, 20, 90)))
+        correlation.get_summed_power_spectrum(chunk_size=32)
+        self.assertEqual(counting.reads, 4)
+
+    def test_fem_reads(self):
+        counting = CountingArray(np.random.rand(40, 40, 20, 90) + 1)
+        lazy = PolarSignal(counting.array).as_lazy()
+        lazy.data = da.from_array(counting, chunks=(20, 20, 20, 90))
+        np.testing.assert_allclose(lazy.fem(chunk_size=32).data, PolarSignal(counting.array).fem().data, rtol=1e-8)
+        self.assertEqual(counting.reads, 4)  # every block is read once
+        counting.reads = 0
+        lazy.grouped_fem(labels=np.arange(1600).reshape(40, 40) % 3, chunk_size=32)
+        self.assertEqual(counting.reads, 4)
+        counting.reads = 0
+        lower = lazy.bootstrap_fem(n_replicates=5, seed=0, chunk_size=32)[1]
+        self.assertEqual(counting.reads, 4)
+        expected = PolarSignal(counting.array).bootstrap_fem(n_replicates=5, seed=0)[1]
+        np.testing.assert_allclose(lower.data, expected.data, rtol=1e-8)  # the same draws whatever the chunks are
+        counting.reads = 0
+        indicies = [[1, 1], [30, 2], [5, 19]]
+        np.testing.assert_allclose(lazy.fem(indicies=indicies, chunk_size=2).data,
+                                   PolarSignal(counting.array).fem(indicies=indicies).data, rtol=1e-8)
+        self.assertEqual(counting.reads, 2)  # only the blocks holding the first 20 rows
+
+    def test_cross_correlation(self):
+        cross = self.ps.cross_correlation(binning_factor=2, cut=2, chunk_size=3)
+        self.assertTrue(cross._lazy)  # every pair of rings is never held in memory
+        self.assertTupleEqual(cross.data.shape, (5, 5, 9, 9, 45))
+        self.assertEqual(cross.data.dtype, np.float64)
+        self.assertEqual(cross.axes_manager.navigation_axes[0].name, "k1")
+        cross = cross.data.compute()
+        self.assertTupleEqual(cross.shape, (5, 5, 9, 9, 45))
+        self.assertEqual(cross.dtype, np.float64)
+        ac = self.ps.autocorrelation(binning_factor=2, cut=2)
+        np.testing.assert_array_almost_equal(np.moveaxis(np.diagonal(cross, axis1=2, axis2=3), -1, 2), ac.data)
+        single = self.ps.cross_correlation(binning_factor=2, cut=2, dtype=np.float32)
+        self.assertEqual(single.data.dtype, np.float32)
+        self.assertEqual(single.data.compute().dtype, np.float32)
+        pairs = self.ps.cross_correlation(k_pairs=[[0, 3], [4, 1]], binning_factor=2, cut=2)
+        self.assertTupleEqual(pairs.data.shape, (5, 5, 2, 45))
+        np.testing.assert_array_almost_equal(pairs.data[:, :, 1], cross[:, :, 4, 1])
+
+    def test_lazy_cross_correlation(self):
+        self.ps.data[:, :, 8, 20] = 100
+        lazy = self.ps.as_lazy()
+        self.ps.mask_below(value=0.5)
+        lazy.mask_below(value=0.5)
+        cross = lazy.cross_correlation(k_pairs=[[5, 8], [8, 5]])
+        expected = self.ps.cross_correlation(k_pairs=[[5, 8], [8, 5]])
+        np.testing.assert_allclose(cross.data.compute(), expected.data, atol=1e-8)
+        # the spots on the two rings are 5 pixels apart and swapping the rings reverses the angle
+        self.assertEqual(np.argmax(expected.data[1, 1, 0]), 5)
+        np.testing.assert_allclose(np.roll(expected.data[:, :, 1, ::-1], 1, axis=-1), expected.data[:, :, 0],
+                                   atol=1e-8)
+
     def test_autocorrelation_mask(self):
         self.ps.mask_below(value=40)
         ac = self.ps.autocorrelation()
@@ -31,6 +144,88 @@ class TestPolarSignal(TestCase):
     def test_fem_omega(self):
         fem_results = self.ps.fem(version='omega')
         self.assertAlmostEqual(np.sum(fem_results.data), 0)
+        self.ps.data = self.ps.data + np.random.rand(5, 5, 20, 90)
+        annular_mean = np.reshape(np.mean(self.ps.data, axis=-1), (-1, 20))
+        omega = np.mean(annular_mean, axis=0)**2 / np.mean(annular_mean**2, axis=0) - 1
+        np.testing.assert_allclose(self.ps.fem(version="omega").data, omega, rtol=1e-6)
+        variance = np.var(annular_mean, axis=0) / np.mean(annular_mean, axis=0)**2
+        np.testing.assert_allclose(self.ps.fem(version="annular_variance").data, variance, rtol=1e-6)
+
+    def test_lazy_fem(self):
+        self.ps.data = self.ps.data + np.random.rand(5, 5, 20, 90)
+        lazy = self.ps.as_lazy()
+        for version in ["omega", "rings", "annular_variance", "ring_variance"]:
+            fem_results = self.ps.fem(version=version, chunk_size=7)
+            self.assertEqual(fem_results.axes_manager[0].name, "k")
+            np.testing.assert_allclose(lazy.fem(version=version).data, fem_results.data, rtol=1e-8)
+
+    def test_fem_subset(self):
+        self.ps.data = self.ps.data + np.random.rand(5, 5, 20, 90)
+        indicies = [[1, 1], [1, 2], [1, 3], [2, 3]]
+        expected = PolarSignal(stack([self.ps.inav[ind] for ind in indicies]).data).fem(version="omega")
+        np.testing.assert_allclose(self.ps.fem(version="omega", indicies=indicies).data, expected.data, rtol=1e-8)
+        selection = np.zeros((5, 5), dtype=bool)
+        selection[[1, 1, 1, 2], [1, 2, 3, 3]] = True  # the mask is (x, y) like inav
+        np.testing.assert_allclose(self.ps.fem(version="omega", indicies=selection).data, expected.data, rtol=1e-8)
+        lazy = self.ps.as_lazy().fem(version="rings", indicies=selection, chunk_size=3)
+        np.testing.assert_allclose(lazy.data, self.ps.fem(version="rings", indicies=indicies).data, rtol=1e-8)
+        wide = PolarSignal(np.random.rand(4, 6, 20, 90) + 1)  # inav is (6, 4)
+        indicies = [[5, 0], [1, 3], [2, 2]]
+        selection = np.zeros((6, 4), dtype=bool)
+        selection[tuple(np.transpose(indicies))] = True
+        expected = PolarSignal(stack([wide.inav[ind] for ind in indicies]).data).fem(version="annular_variance")
+        for subset in [indicies, selection]:
+            np.testing.assert_allclose(wide.fem(version="annular_variance", indicies=subset).data, expected.data,
+                                       rtol=1e-8)
+        lower = wide.bootstrap_fem(indicies=indicies, n_replicates=5, seed=0)[1]
+        np.testing.assert_allclose(wide.bootstrap_fem(indicies=selection, n_replicates=5, seed=0)[1].data, lower.data,
+                                   rtol=1e-8)
+        with self.assertRaises(ValueError):
+            wide.fem(indicies=np.transpose(selection))
+
+    def test_grouped_fem(self):
+        self.ps.data = self.ps.data + np.random.rand(5, 5, 20, 90)
+        labels = np.zeros((5, 5), dtype=int)
+        labels[:, 1:3] = 1  # labels are (x, y) like inav
+        labels[:, 4] = -1
+        grouped = self.ps.grouped_fem(labels=labels, version="omega")
+        self.assertEqual(grouped.axes_manager.navigation_shape, (2,))
+        for group in range(2):
+            expected = self.ps.fem(version="omega", indicies=labels == group)
+            np.testing.assert_allclose(grouped.inav[group].data, expected.data, rtol=1e-8)
+        lazy = self.ps.as_lazy().grouped_fem(labels=labels, version="rings", chunk_size=4)
+        np.testing.assert_allclose(lazy.inav[1].data, self.ps.fem(version="rings", indicies=labels == 1).data,
+                                   rtol=1e-8)
+        self.ps.add_haadf_intensities(np.random.rand(5, 5), slope=1, intercept=0)
+        thickness = self.ps.grouped_fem()
+        self.assertEqual(thickness.axes_manager.navigation_shape, (4,))
+        self.assertEqual(thickness.axes_manager[0].name, "thickness")
+
+    def test_bootstrap_fem(self):
+        self.ps.data = self.ps.data + np.random.rand(5, 5, 20, 90)
+        int_vs_k, lower, upper = self.ps.bootstrap_fem(version="omega", n_replicates=50, seed=0)
+        np.testing.assert_allclose(int_vs_k.data, self.ps.fem(version="omega").data, rtol=1e-8)
+        self.assertTrue(np.all(lower.data <= upper.data))
+        lazy = self.ps.as_lazy().bootstrap_fem(version="omega", n_replicates=50, seed=0, chunk_size=7)
+        np.testing.assert_allclose(lazy[1].data, lower.data, rtol=1e-8)
+        spectrum, lower, upper = self.ps.bootstrap_symmetry_spectrum(orders=[2, 3, 4], n_replicates=50, seed=0)
+        expected = self.ps.get_symmetry_spectrum(orders=[2, 3, 4]).data.mean(axis=(0, 1))
+        np.testing.assert_allclose(spectrum.data, expected, rtol=1e-8)
+        self.assertTrue(np.all(lower.data <= upper.data + 1e-12))
+
+    def test_variable_resolution_fem(self):
+        self.ps.data = self.ps.data + np.random.rand(5, 5, 20, 90)
+        vr_fem = self.ps.variable_resolution_fem(window_sizes=[1, 2], version="omega")
+        self.assertEqual(vr_fem.axes_manager.navigation_shape, (2,))
+        self.assertListEqual(vr_fem.metadata.Signal.window_sizes, [1, 2])
+        np.testing.assert_allclose(vr_fem.inav[0].data, self.ps.fem(version="omega").data, rtol=1e-6)
+        counting = CountingArray(self.ps.data)
+        lazy = self.ps.as_lazy()
+        lazy.data = da.from_array(counting, chunks=(2, 3, 20, 90))
+        lazy = lazy.variable_resolution_fem(window_sizes=[1, 2], version="omega")
+        np.testing.assert_allclose(lazy.data, vr_fem.data, rtol=1e-8)
+        self.assertEqual(counting.reads, 6)  # every block is read once
+        self.assertEqual(counting.largest, 2 * 3 * 20 * 90)
 
     def test_fem_rings(self):
         self.ps.fem(version='rings').plot()
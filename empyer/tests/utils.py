@@ -0,0 +1,17 @@
+class CountingArray(object):
+    """An array which counts how many times it is read and remembers the largest read.
+    """
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.ndim = array.ndim
+        self.reads = 0
+        self.largest = 0
+
+    def __getitem__(self, item):
+        values = self.array[item]
+        if values.size > 0:  # dask reads empty slices to find the dtype
+            self.reads += 1
+            self.largest = max(self.largest, values.size)
+        return values